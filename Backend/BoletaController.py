@@ -1,3 +1,4 @@
+import json
 import logging
 from typing import List, Tuple
 
@@ -5,13 +6,24 @@ from pydantic import ValidationError
 from rapidfuzz import process, fuzz
 
 from Backend.models import BoletaData
-from Scraping.scraper_sunat import send_billing_sunat
+from Backend.utils.product_search import ClientSearchIndex, ProductSearchIndex
+from Scraping.scraper_sunat import (
+    EmisionSinConfirmar,
+    send_billing_batch,
+    send_billing_sunat,
+)
 
 
 class BoletaController:
+    # reintentos de la cola de emisión: 30 s, 1 min, 2 min, ... (tope 30 min)
+    REINTENTO_BASE = 30
+    REINTENTO_MAX = 1800
+    MAX_INTENTOS = 5
 
     def __init__(self, db):
         self.db = db
+        self.indices_productos = {}  # id_sender -> ProductSearchIndex
+        self.indice_clientes = None  # ClientSearchIndex (se construye al primer uso)
 
     def emitir_boleta(self, boleta_data) -> bool:
         try:
@@ -24,59 +36,232 @@ class BoletaController:
         logging.info("Boleta validada correctamente, enviando a SUNAT...")
         logging.info("Datos de la boleta: %s", boleta_data.dict())
 
+        # se guarda y queda en la cola; OutboxWorker la envía a SUNAT
         result = self.guardar_boleta_db(boleta_data.dict())
         if result is False:
             return False
 
-        send_billing_sunat(boleta_data.dict())
-
-        logging.info("Boleta Emitida correctamente :)")
+        logging.info("Boleta guardada y encolada para SUNAT")
         return True
 
+    def enviar_siguiente_emision(self):
+        """Envía a SUNAT la siguiente boleta de la cola de emisión.
+
+        Retorna (invoice_id, status, error) con el estado en que quedó, o
+        None si no hay nada pendiente. Queda 'sent' solo con el número que
+        SUNAT confirmó; si se pulsó emitir sin confirmación queda
+        'unconfirmed' para que el operador la verifique. Los fallos se
+        reintentan con espera exponencial hasta MAX_INTENTOS; después quedan
+        en 'failed'.
+        """
+        fila = self.db.claim_next_emission()
+        if fila is None:
+            return None
+        logging.info(f"Enviando a SUNAT la boleta {fila[1]} (intento {fila[4]})")
+
+        sin_confirmar = False
+        try:
+            numero = send_billing_sunat(json.loads(fila[3]))
+            error = None if numero else "No se pudo completar el documento en SUNAT"
+        except EmisionSinConfirmar as e:
+            numero, error, sin_confirmar = None, str(e), True
+        except Exception as e:
+            numero, error = None, str(e)
+        return self._registrar_envio(fila, numero, error, sin_confirmar)
+
+    def enviar_lote_emisiones(self, limite=50):
+        """Envía en un solo lote (un login) las pendientes de un mismo remitente.
+
+        Toma la emisión más antigua y hasta `limite` pendientes más del mismo
+        remitente, las emite con send_billing_batch y registra cada resultado.
+        Si el lote falla a mitad, lo que no alcanzó a informar queda
+        'unconfirmed' (pudo emitirse). Retorna una lista de (invoice_id,
+        status, error); vacía si no hay nada.
+        """
+        primera = self.db.claim_next_emission()
+        if primera is None:
+            return []
+        id_sender = primera[2]
+        filas = [primera]
+        while len(filas) < limite:
+            fila = self.db.claim_next_emission(id_sender)
+            if fila is None:
+                break
+            filas.append(fila)
+        logging.info(f"Enviando a SUNAT {len(filas)} boletas del remitente {id_sender}")
+
+        try:
+            documentos = [json.loads(fila[3]) for fila in filas]
+        except Exception as e:
+            # no llegó al navegador: se puede reintentar
+            return [self._registrar_envio(fila, None, str(e)) for fila in filas]
+
+        informados = {}  # posición -> resultado, a medida que se emiten
+        try:
+            resultados = send_billing_batch(
+                id_sender, documentos, al_emitir=informados.__setitem__
+            )
+        except Exception as e:
+            logging.error(f"Lote del remitente {id_sender} interrumpido: {e}")
+            sin_resultado = {"numero": None, "error": str(e), "sin_confirmar": True}
+            resultados = [informados.get(i, sin_resultado) for i in range(len(filas))]
+        return [
+            self._registrar_envio(
+                fila, r.get("numero"), r["error"], r.get("sin_confirmar", False)
+            )
+            for fila, r in zip(filas, resultados)
+        ]
+
+    def enviar_emisiones_pendientes(self, scheduler, progreso=None, limite=500):
+        """Envía todas las emisiones vencidas de la cola, varios remitentes en
+        paralelo (un navegador por proceso, ver Scraping.scheduler).
+
+        Cada documento se registra en la cola apenas se conoce su resultado;
+        si un proceso muere (o se cierra la app) a mitad de un lote, lo que no
+        alcanzó a informar queda 'unconfirmed'. Los lotes que no se llegaron
+        a enviar vuelven a la cola. Retorna la lista de (invoice_id, status,
+        error); vacía si no había nada pendiente.
+        """
+        filas_por_remitente = {}
+        for _ in range(limite):
+            fila = self.db.claim_next_emission()
+            if fila is None:
+                break
+            filas_por_remitente.setdefault(fila[2], []).append(fila)
+        if not filas_por_remitente:
+            return []
+
+        registrados = []
+
+        def al_terminar(id_sender, desde, resultados):
+            filas = filas_por_remitente[id_sender][desde : desde + len(resultados)]
+            for fila, r in zip(filas, resultados):
+                registrados.append(
+                    self._registrar_envio(
+                        fila, r.get("numero"), r["error"], r.get("sin_confirmar", False)
+                    )
+                )
+
+        resultados = scheduler.ejecutar(
+            {
+                id_sender: [json.loads(fila[3]) for fila in filas]
+                for id_sender, filas in filas_por_remitente.items()
+            },
+            progreso=progreso,
+            al_terminar=al_terminar,
+        )
+        # cerrado antes de enviarlas: nunca llegaron al navegador
+        for id_sender, filas in filas_por_remitente.items():
+            for fila, r in zip(filas, resultados.get(id_sender, [])):
+                if r is None:
+                    registrados.append(
+                        self._registrar_envio(fila, None, "Envío cancelado al cerrar")
+                    )
+        return registrados
+
+    def _registrar_envio(self, fila, numero, error, sin_confirmar=False):
+        """Marca en la cola el resultado de un envío (con reintento si falló).
+
+        numero: el que SUNAT asignó y confirmó; sin él nunca queda 'sent'.
+        """
+        outbox_id, invoice_id, _, _, intentos = fila
+        if numero:
+            self.db.mark_emission_sent(outbox_id, numero)
+            return invoice_id, "sent", None
+        if sin_confirmar:
+            # pudo quedar emitida: reintentar la duplicaría
+            self.db.mark_emission_unconfirmed(outbox_id, error)
+            logging.error(f"Boleta {invoice_id} sin confirmar en SUNAT: {error}")
+            return invoice_id, "unconfirmed", error
+        if intentos >= self.MAX_INTENTOS:
+            self.db.mark_emission_failed(outbox_id, error)
+            logging.error(f"Boleta {invoice_id} sin enviar tras {intentos} intentos")
+            return invoice_id, "failed", error
+        espera = min(self.REINTENTO_BASE * 2 ** (intentos - 1), self.REINTENTO_MAX)
+        self.db.mark_emission_failed(outbox_id, error, retry_in=espera)
+        logging.warning(f"Boleta {invoice_id}: reintento en {espera} s ({error})")
+        return invoice_id, "pending", error
+
     def guardar_boleta_db(self, data):
+        """Guarda cliente, boleta y detalles en una sola transacción (un commit)."""
         try:
             id_remitente = data["id_remitente"]
             nombre = data["cliente"]["nombre"]
             dni = data["cliente"]["dni"]
             ruc = data["cliente"]["ruc"]
-            id_cliente = self.db.insert_client(id_remitente, nombre, dni, ruc)
-            logging.info("Insertado cliente ")
+
             # -- guardar factura--
             total = data["resumen"]["total"]
             igv_total = data["resumen"]["igv_total"]
 
             # -- guardar invoice--
-            serie = data["resumen"]["serie"]
-            numero = data["resumen"]["numero"]
             emision_fecha = data["fecha"]
             tipo = data["tipo_documento"]
-            invoice_id = self.db.insert_invoice(
-                id_cliente,
-                id_remitente,
-                total,
-                igv_total,
-                tipo,
-                serie,
-                numero,
-                emision_fecha,
-            )
-            logging.info("Insertado invoice ")
-
-            # -- guardar detailes--
-            productos = data["productos"]
-            for p in productos:
-                cantidad = p["cantidad"]
-                descripcion = p["descripcion"]
-                unidad = p["unidad_medida"].upper()
-                precio = p["precio_base"]
-                igv = p["igv"]
-                total = p["precio_total"]
-
-                product_id = self.db.insert_product(
-                    id_remitente, descripcion, unidad, precio, igv
+
+            with self.db.transaction():
+                # el número se reserva en la misma transacción que la boleta
+                num_documento = self.db.reserve_invoice_number(id_remitente, tipo)
+                serie_base = self.db.series_prefix(id_remitente, tipo)
+                serie = f"{serie_base}-{num_documento:02d}"
+                numero = f"{num_documento:02d}"
+                data["resumen"]["serie"] = serie
+                data["resumen"]["numero"] = numero
+
+                id_cliente = self.db.insert_client(id_remitente, nombre, dni, ruc)
+                logging.info("Insertado cliente ")
+                invoice_id = self.db.insert_invoice(
+                    id_cliente,
+                    id_remitente,
+                    total,
+                    igv_total,
+                    tipo,
+                    serie,
+                    numero,
+                    emision_fecha,
+                )
+                logging.info("Insertado invoice ")
+
+                # -- guardar detailes--
+                detalles = []
+                for p in data["productos"]:
+                    cantidad = p["cantidad"]
+                    descripcion = p["descripcion"]
+                    unidad = p["unidad_medida"].upper()
+                    precio = p["precio_base"]
+                    igv = p["igv"]
+                    total = p["precio_total"]
+
+                    product_id = self.db.insert_product(
+                        id_remitente, descripcion, unidad, precio, igv
+                    )
+                    detalles.append((product_id, cantidad, total))
+                self.db.insert_invoice_details(invoice_id, detalles)
+
+                # a la cola de emisión en la misma transacción que la boleta
+                self.db.enqueue_emission(invoice_id, id_remitente, json.dumps(data))
+
+            # cliente nuevo al índice de clientes (si ya existía no se toca)
+            if (
+                self.indice_clientes is not None
+                and nombre
+                and id_cliente not in self.indice_clientes
+            ):
+                self.indice_clientes.agregar(
+                    (id_cliente, id_remitente, nombre, dni, ruc)
                 )
-                self.db.insert_invoice_detail(invoice_id, product_id, cantidad, total)
 
+            # productos nuevos de la boleta al índice de búsqueda del remitente
+            for (product_id, _, _), p in zip(detalles, data["productos"]):
+                self._indexar_producto(
+                    (
+                        product_id,
+                        id_remitente,
+                        p["descripcion"],
+                        p["unidad_medida"].upper(),
+                        p["precio_base"],
+                        p["igv"],
+                    )
+                )
             logging.info("Insertado productos y details")
             logging.info("Data guardada correctamente BD")
             return True
@@ -148,19 +333,73 @@ class BoletaController:
         data_names = [str(item[2]).lower() for item in data]
         query = query.lower()
 
-        # Buscar coincidencias aproximadas
+        # Buscar coincidencias aproximadas (ya vienen ordenadas por score)
         results = process.extract(
-            query, data_names, scorer=fuzz.WRatio, score_cutoff=60
+            query, data_names, scorer=fuzz.WRatio, score_cutoff=60, limit=5
         )
 
-        # Emparejar con los productos originales
-        matches_with_confidence = []
-        for name, score, index in results:
-            product = data[index]
-            matches_with_confidence.append((*product, score))  # Agrega el score
+        # Emparejar con los productos originales, agregando el score
+        return [(*data[index], score) for name, score, index in results]
+
+    # ---- BUSQUEDA DE PRODUCTOS ----
+    def indice_productos(self, id_sender) -> ProductSearchIndex:
+        """Índice de búsqueda del remitente; se construye una sola vez."""
+        id_sender = int(id_sender)
+        indice = self.indices_productos.get(id_sender)
+        if indice is None:
+            indice = ProductSearchIndex(self.db.get_products_by_sender(id_sender))
+            self.indices_productos[id_sender] = indice
+            logging.info(
+                "Indice de productos del remitente %s: %s productos",
+                id_sender,
+                len(indice),
+            )
+        return indice
+
+    def buscar_productos(self, id_sender, query: str, limite: int = 5) -> List[Tuple]:
+        """Productos del remitente más parecidos a la query (con score al final)."""
+        if id_sender is None or not query:
+            return []
+        return self.indice_productos(id_sender).search(query, limite)
+
+    def buscar_clientes(self, query: str, limite: int = 5) -> List[Tuple]:
+        """Clientes más parecidos a la query (con score al final)."""
+        if not query:
+            return []
+        if self.indice_clientes is None:
+            self.indice_clientes = ClientSearchIndex(self.db.get_clients())
+        return self.indice_clientes.search(query, limite)
+
+    def emparejar_productos(self, id_sender, descripciones, umbral=85):
+        """Empareja todas las líneas extraídas con el catálogo del remitente.
 
-        # Retornar los mejores 5 resultados (ordenados por score descendente)
-        return sorted(matches_with_confidence, key=lambda x: x[-1], reverse=True)[:5]
+        Retorna una lista alineada con descripciones: la fila del producto
+        (con score al final) o None si no hay coincidencia confiable.
+        """
+        if id_sender is None:
+            return [None] * len(descripciones)
+        try:
+            return self.indice_productos(id_sender).match_batch(
+                descripciones, score_cutoff=umbral
+            )
+        except Exception as e:
+            logging.error("Error al emparejar productos con el catalogo: %s", e)
+            return [None] * len(descripciones)
+
+    def _indexar_producto(self, producto):
+        """Refleja un producto insertado/actualizado en los índices ya construidos."""
+        id_producto, id_sender = producto[0], int(producto[1])
+        for id_indice, indice in list(self.indices_productos.items()):
+            if id_indice != id_sender:
+                indice.eliminar(id_producto)  # pudo cambiar de remitente
+        indice = self.indices_productos.get(id_sender)
+        if indice is not None:
+            indice.agregar(producto)
+
+    def _desindexar_producto(self, id_sender, id_producto):
+        indice = self.indices_productos.get(int(id_sender))
+        if indice is not None:
+            indice.eliminar(id_producto)
 
     # --- SENDERS ----
     def agregar_sender(self, nombre: str, ruc: str, user: str, password: str) -> bool:
@@ -225,6 +464,7 @@ class BoletaController:
             return None
         try:
             product_id = self.db.insert_product(id_sender, name, unit, price, igv)
+            self._indexar_producto((product_id, id_sender, name, unit, price, igv))
             logging.info(
                 f"Producto '{name}' agregado correctamente con ID: {product_id}"
             )
@@ -253,6 +493,7 @@ class BoletaController:
         """
         try:
             self.db.delete_product_by_sender(id_sender, id_product)
+            self._desindexar_producto(id_sender, id_product)
             logging.info(f"Producto con ID {id_product} borrado correctamente.")
             return True
         except Exception as e:
@@ -269,6 +510,7 @@ class BoletaController:
             return False
         try:
             self.db.update_product(id_product, id_sender, name, unit, price, igv)
+            self._indexar_producto((id_product, id_sender, name, unit, price, igv))
             logging.info(f"Producto con ID {id_product} actualizado correctamente.")
             return True
         except Exception as e:
@@ -286,6 +528,40 @@ class BoletaController:
             )
             return []
 
+    def ver_historial_pagina(self, id_sender, limite=100, despues=None, **filtros):
+        """Una página del historial (ver DatabaseManager.get_invoices_page)."""
+        try:
+            return self.db.get_invoices_page(
+                id_sender, limit=limite, after=despues, **filtros
+            )
+        except Exception as e:
+            logging.error(
+                "fallo al extraer la pagina de historial id_sender=%s, error=%s",
+                id_sender,
+                e,
+            )
+            return []
+
+    def ver_estadisticas(self, id_sender, desde=None, hasta=None, top=10):
+        """Resumen de ventas y top de clientes (fechas yyyy-mm-dd)."""
+        try:
+            boletas, total, igv, maximo = self.db.get_sales_summary(
+                id_sender, desde, hasta
+            )
+            return {
+                "boletas": boletas,
+                "total": total,
+                "igv": igv,
+                "promedio": total / boletas if boletas else 0.0,
+                "maximo": maximo,
+                "top_clientes": self.db.get_top_clients(id_sender, top, desde, hasta),
+            }
+        except Exception as e:
+            logging.error(
+                "fallo al calcular estadisticas id_sender=%s, error=%s", id_sender, e
+            )
+            return None
+
     def ver_invoice_details(self, invoice_id):
         try:
             return self.db.get_invoice_details(invoice_id)
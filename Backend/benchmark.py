@@ -0,0 +1,77 @@
+"""Benchmark de la ingesta por lote con el backend de extracción stub.
+
+Procesa N fotos de prueba con IngestionPipeline y un ExtractionClient sin
+red (StubBackend, que tarda --latencia segundos por archivo entre subida y
+generación) para cada nivel de concurrencia, y muestra el tiempo total, los
+archivos por minuto y el preprocesado medio por foto. No usa la caché, la
+base real (usa una en memoria) ni el límite de solicitudes por minuto.
+
+Uso:
+    python -m Backend.benchmark --archivos 20 --latencia 1.0 --concurrencia 1 4 8
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+from Backend.utils.extraction_client import ExtractionClient, StubBackend
+from Backend.utils.ingestion import IngestionPipeline
+from DataBase.DatabaseManager import DatabaseManager
+
+
+def carpeta_de_prueba(carpeta, archivos):
+    """Fotos de boleta de 1200x1600 con contenido distinto (la cola omite
+    los repetidos); pasan por el preprocesado como las reales."""
+    for i in range(archivos):
+        foto = Image.new("RGB", (1200, 1600), (60, 40, 30))
+        dibujo = ImageDraw.Draw(foto)
+        dibujo.rectangle((200, 200, 999, 1399), fill=(245, 245, 240))
+        for linea in range(30):
+            texto = f"PRODUCTO {i}-{linea}  S/ 10.00"
+            dibujo.text((240, 240 + linea * 36), texto, fill=0)
+        foto.save(os.path.join(carpeta, f"boleta_{i:04d}.jpg"), quality=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archivos", type=int, default=20)
+    parser.add_argument("--latencia", type=float, default=1.0)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    backend = StubBackend(
+        latencia_subida=args.latencia / 2, latencia_generacion=args.latencia / 2
+    )
+    print(
+        f"{'concurrencia':<14}{'archivos':>9}{'total s':>10}{'archivos/min':>14}"
+        f"{'preproc. s':>12}"
+    )
+    with tempfile.TemporaryDirectory() as carpeta:
+        carpeta_de_prueba(carpeta, args.archivos)
+        for concurrencia in args.concurrencia:
+            db = DatabaseManager(":memory:")
+            db.create_tables()
+            cliente = ExtractionClient(backend)
+            pipeline = IngestionPipeline(
+                db, extraer=cliente.extraer, concurrencia=concurrencia, por_minuto=0
+            )
+            pipeline.encolar_carpeta(carpeta)
+            inicio = time.perf_counter()
+            resumen = pipeline.procesar_pendientes()
+            duracion = time.perf_counter() - inicio
+            # preprocesado medio por archivo (corre en los hilos de la ingesta)
+            preprocesado = cliente.estadisticas["preprocesado"] / max(
+                1, cliente.estadisticas["extracciones"]
+            )
+            print(
+                f"{concurrencia:<14}{resumen['listos']:>9}{duracion:>10.2f}"
+                f"{resumen['listos'] / duracion * 60:>14.1f}{preprocesado:>12.3f}"
+            )
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -74,3 +74,55 @@ class BoletaData(BaseModel):
         except ValueError:
             raise ValueError(f"La fecha debe tener el formato dd/mm/yyyy. recibido")
         return v
+
+
+# --- Extracción de boletas (respuesta del modelo) ---
+# El esquema de estas clases se envía al modelo (response_schema) y con
+# ellas se valida lo que responde. Los campos de texto opcionales van ""
+# (nunca None), como los espera el formulario.
+
+
+class ClienteExtraido(BaseModel):
+    fecha: str = Field("", description="dd/mm/yyyy, o vacío")
+    cliente: str = Field("", description="Nombre del cliente en mayúsculas")
+    dni: str = Field("", description="8 dígitos, o vacío")
+    ruc: str = Field("", description="11 dígitos, o vacío")
+
+    @field_validator("fecha", "cliente", "dni", "ruc", mode="before")
+    @classmethod
+    def texto(cls, v):
+        # el modelo a veces responde null o el DNI como número
+        return "" if v is None else str(v).strip()
+
+    @field_validator("dni")
+    @classmethod
+    def dni_valido(cls, v):
+        if v and not (v.isdigit() and len(v) == 8):
+            raise ValueError("El DNI debe tener 8 dígitos")
+        return v
+
+    @field_validator("ruc")
+    @classmethod
+    def ruc_valido(cls, v):
+        if v and not (v.isdigit() and len(v) == 11):
+            raise ValueError("El RUC debe tener 11 dígitos")
+        return v
+
+
+class ProductoExtraido(BaseModel):
+    cantidad: float = Field(..., gt=0)
+    unidad_medida: Literal["KILOGRAMO", "CAJA", "UNIDAD", "BOLSA"] = Field(
+        ..., description="KILOGRAMO para menestras, CAJA para otros productos"
+    )
+    descripcion: str = Field(..., min_length=1)
+    precio_base: float = Field(0.0, ge=0)
+    igv: int = Field(
+        ..., ge=0, le=1, description="1 si incluye IGV, 0 si no (menestras: 0)"
+    )
+    precio_total: float = Field(..., ge=0, description="Total de la línea")
+
+
+class BoletaExtraida(BaseModel):
+    cliente: ClienteExtraido
+    productos: List[ProductoExtraido] = Field(..., min_length=1)
+    total: float = Field(..., ge=0, description="Total a pagar por el cliente")
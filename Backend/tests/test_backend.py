@@ -1 +1,756 @@
-# TODO recomendado hacer test
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from rapidfuzz import fuzz, process
+
+import Backend.BoletaController as boleta_controller
+from Backend.BoletaController import BoletaController
+from Backend.utils.extraction_cache import ExtractionCache
+from Backend.utils.extraction_client import (
+    BOLETA_STUB,
+    ExtractionClient,
+    GeminiBackend,
+    StubBackend,
+    leer_json,
+    prompt_para,
+)
+from Backend.utils.image_preprocess import preparar_imagen
+from Backend.utils.ingestion import IngestionPipeline, LimiteSolicitudes
+from Backend.utils.product_search import (
+    ClientSearchIndex,
+    ProductSearchIndex,
+    normalizar,
+)
+from DataBase.DatabaseManager import DatabaseManager
+from Scraping.scheduler import EmissionScheduler
+from Scraping.scraper_sunat import EmisionSinConfirmar
+
+CATALOGO = [
+    (1, 1, "ARROZ EXTRA SUPERIOR", "KILOGRAMO", 5.5, 0),
+    (2, 1, "AZÚCAR RUBIA", "KILOGRAMO", 4.8, 0),
+    (3, 1, "ACEITE VEGETAL", "CAJA", 60.0, 1),
+    (4, 1, "HARINA INTEGRAL", "BOLSA", 3.5, 1),
+]
+
+
+@pytest.fixture
+def indice():
+    return ProductSearchIndex(CATALOGO)
+
+
+def test_normalizar_quita_tildes_y_espacios():
+    assert normalizar("  Azúcar   RUBIA ") == "azucar rubia"
+
+
+def test_busqueda_tolerante_a_errores_y_tildes(indice):
+    resultados = indice.search("arros superor")
+    assert resultados[0][:6] == CATALOGO[0]
+
+    resultados = indice.search("azucar")
+    assert resultados[0][2] == "AZÚCAR RUBIA"
+    assert resultados[0][-1] >= 60  # score al final
+
+
+def test_busqueda_vacia(indice):
+    assert indice.search("") == []
+
+
+def test_actualizacion_incremental(indice):
+    indice.agregar((5, 1, "SAL DE MESA", "BOLSA", 1.2, 0))
+    assert indice.search("sal de mesa")[0][0] == 5
+
+    indice.actualizar((5, 1, "SAL YODADA", "BOLSA", 1.5, 0))
+    assert indice.search("sal yodada")[0][4] == 1.5
+    assert len(indice) == 5
+
+    assert indice.eliminar(1)
+    assert 1 not in indice
+    assert all(fila[0] != 1 for fila in indice.search("arroz extra superior"))
+    # las demás filas siguen apuntando a sus datos tras el borrado
+    for producto in CATALOGO[1:]:
+        assert indice.search(producto[2])[0][:6] == producto
+
+
+def test_emparejamiento_en_lote(indice):
+    lineas = ["ARROZ EXTRA SUPERIOR", "azucar rubia", "producto desconocido xyz", ""]
+    coincidencias = indice.match_batch(lineas, score_cutoff=85)
+
+    assert coincidencias[0][:6] == CATALOGO[0]
+    assert coincidencias[1][:6] == CATALOGO[1]
+    assert coincidencias[1][-1] >= 85
+    assert coincidencias[2] is None
+    assert coincidencias[3] is None
+
+
+def test_emparejamiento_en_lote_catalogo_vacio():
+    assert ProductSearchIndex().match_batch(["arroz"]) == [None]
+
+
+def test_busqueda_de_clientes():
+    indice = ClientSearchIndex(
+        [
+            (1, 1, "JUAN PEREZ GOMEZ", "12345678", None, "2024-01-01"),
+            (2, 1, "MARIA LOPEZ", "87654321", None, "2024-01-01"),
+        ]
+    )
+    resultado = indice.search("juan peres")[0]
+    assert resultado[:5] == (1, 1, "JUAN PEREZ GOMEZ", "12345678", None)
+
+
+def test_prefiltro_de_trigramas_mantiene_el_recall():
+    """Con el prefiltro activo, el mejor score coincide con el de puntuar todo."""
+    random.seed(3)
+    silabas = ["ar", "roz", "ca", "ne", "li", "mo", "ta", "su", "pe", "rio", "ga", "to"]
+
+    def palabra():
+        return "".join(random.choice(silabas) for _ in range(random.randint(2, 4)))
+
+    catalogo = [
+        (i, 1, " ".join(palabra() for _ in range(3)).upper(), "UNIDAD", 1.0, 0)
+        for i in range(5000)
+    ]
+    indice = ProductSearchIndex(catalogo)
+    assert len(indice) > indice.UMBRAL_PREFILTRO
+
+    aciertos = 0
+    consultas = random.sample(catalogo, 100)
+    for fila in consultas:
+        nombre = normalizar(fila[2])
+        i = random.randrange(len(nombre))
+        query = nombre[:i] + "x" + nombre[i + 1 :]  # un error de tipeo
+        esperado = process.extractOne(
+            query, indice.normalizados, scorer=fuzz.WRatio, processor=None
+        )[1]
+        resultados = indice.search(query, 1, score_cutoff=0)
+        if resultados and resultados[0][-1] >= esperado:
+            aciertos += 1
+    assert aciertos / len(consultas) >= 0.95
+
+
+BOLETA = {
+    "cliente": {"nombre": "CLIENTE PRUEBA", "dni": "12345678", "ruc": None},
+    "productos": [
+        {
+            "cantidad": 2.0,
+            "descripcion": "ARROZ EXTRA SUPERIOR",
+            "unidad_medida": "KILOGRAMO",
+            "precio_base": 5.0,
+            "igv": 0.0,
+            "igv_total": 0.0,
+            "precio_total": 10.0,
+        }
+    ],
+    "resumen": {
+        "serie": "B01-01", "numero": "01", "sub_total": 10.0, "igv_total": 0.0,
+        "total": 10.0,
+    },
+    "fecha": "01/07/2025",
+    "id_remitente": "1",
+    "id_cliente": "None",
+    "tipo_documento": "BOLETA",
+}
+
+
+@pytest.fixture
+def controller():
+    db = DatabaseManager(":memory:")
+    db.create_tables()
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    yield BoletaController(db)
+    db.close()
+
+
+def test_emitir_boleta_encola_sin_enviar(controller, monkeypatch):
+    enviados = []
+    monkeypatch.setattr(
+        boleta_controller, "send_billing_sunat", lambda data, **kw: enviados.append(data)
+    )
+
+    assert controller.emitir_boleta(BOLETA)
+    assert enviados == []
+    (fila,) = controller.db.get_emission_outbox()
+    assert fila[3] == "pending"
+
+
+def test_envio_en_segundo_plano_con_reintentos(controller, monkeypatch):
+    respuestas = [False, RuntimeError("chrome se cerró"), "EB01-1"]
+    enviados = []
+
+    def enviar(data):
+        enviados.append(data)
+        respuesta = respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+    monkeypatch.setattr(boleta_controller, "send_billing_sunat", enviar)
+    monkeypatch.setattr(BoletaController, "REINTENTO_BASE", 0)
+    controller.emitir_boleta(BOLETA)
+
+    invoice_id, status, error = controller.enviar_siguiente_emision()
+    assert status == "pending" and error
+    assert controller.enviar_siguiente_emision()[1:] == ("pending", "chrome se cerró")
+    assert controller.enviar_siguiente_emision() == (invoice_id, "sent", None)
+    assert controller.enviar_siguiente_emision() is None
+    assert controller.db.get_emission_outbox("sent")[0][7] == "EB01-1"
+    # se envía la boleta tal como se guardó, con el número reservado
+    assert enviados[0]["resumen"]["serie"] == "B01-01"
+
+
+def test_envio_sin_confirmacion_no_se_reintenta(controller, monkeypatch):
+    def enviar(data):
+        raise EmisionSinConfirmar("SUNAT no confirmó la emisión de la boleta")
+
+    monkeypatch.setattr(boleta_controller, "send_billing_sunat", enviar)
+    monkeypatch.setattr(BoletaController, "REINTENTO_BASE", 0)
+    controller.emitir_boleta(BOLETA)
+
+    invoice_id, status, error = controller.enviar_siguiente_emision()
+    assert status == "unconfirmed"
+    assert error == "SUNAT no confirmó la emisión de la boleta"
+    assert controller.enviar_siguiente_emision() is None
+    assert controller.db.get_emission_outbox("sent") == []
+
+
+def test_envio_fallido_tras_maximo_de_intentos(controller, monkeypatch):
+    monkeypatch.setattr(boleta_controller, "send_billing_sunat", lambda *a, **k: False)
+    monkeypatch.setattr(BoletaController, "REINTENTO_BASE", 0)
+    monkeypatch.setattr(BoletaController, "MAX_INTENTOS", 2)
+    controller.emitir_boleta(BOLETA)
+
+    assert controller.enviar_siguiente_emision()[1] == "pending"
+    assert controller.enviar_siguiente_emision()[1] == "failed"
+    assert controller.enviar_siguiente_emision() is None
+
+
+def test_envio_en_lote_por_remitente(controller, monkeypatch):
+    lotes = []
+
+    def enviar_lote(sender_id, documentos, al_emitir=None):
+        lotes.append((sender_id, [d["resumen"]["serie"] for d in documentos]))
+        numeros = {"B01-01": "EB01-1"}
+        return [
+            {
+                "enviado": d["resumen"]["serie"] in numeros,
+                "numero": numeros.get(d["resumen"]["serie"]),
+                "sin_confirmar": d["resumen"]["serie"] == "B01-03",
+                "error": "timeout",
+            }
+            for d in documentos
+        ]
+
+    monkeypatch.setattr(boleta_controller, "send_billing_batch", enviar_lote)
+    for _ in range(3):
+        controller.emitir_boleta(BOLETA)
+
+    resultados = controller.enviar_lote_emisiones()
+    assert lotes == [(1, ["B01-01", "B01-02", "B01-03"])]
+    # solo el número confirmado marca 'sent'; sin confirmación no se reintenta
+    assert [status for _, status, _ in resultados] == ["sent", "pending", "unconfirmed"]
+    assert controller.enviar_lote_emisiones() == []  # el reintento aún no vence
+
+
+def test_lote_interrumpido_no_reencola_lo_que_pudo_emitirse(controller, monkeypatch):
+    def enviar_lote(sender_id, documentos, al_emitir=None):
+        al_emitir(0, {"enviado": True, "numero": "EB01-1", "error": None})
+        raise RuntimeError("chrome dejó de responder")
+
+    monkeypatch.setattr(boleta_controller, "send_billing_batch", enviar_lote)
+    for _ in range(3):
+        controller.emitir_boleta(BOLETA)
+
+    resultados = controller.enviar_lote_emisiones()
+    assert [status for _, status, _ in resultados] == [
+        "sent",
+        "unconfirmed",
+        "unconfirmed",
+    ]
+    assert resultados[1][2] == "chrome dejó de responder"
+    assert controller.db.get_emission_outbox("pending") == []
+
+
+def test_envio_en_paralelo_por_remitente(controller):
+    controller.db.insert_sender("Empresa B", "20345678901", "user_b", "pass_b")
+    for remitente in ("1", "2", "1"):
+        controller.emitir_boleta(dict(BOLETA, id_remitente=remitente))
+
+    lotes = []
+
+    def tarea(sender_id, documentos, al_emitir=None):
+        lotes.append((sender_id, [d["resumen"]["serie"] for d in documentos]))
+        numero = "EB01-1" if sender_id == 1 else None
+        return [
+            {"enviado": numero is not None, "numero": numero, "error": "timeout"}
+            for _ in documentos
+        ]
+
+    avances = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = EmissionScheduler(max_procesos=2, tarea=tarea, executor=executor)
+        resultados = controller.enviar_emisiones_pendientes(
+            scheduler, progreso=avances.append
+        )
+
+    assert sorted(lotes) == [(1, ["B01-01", "B01-02"]), (2, ["B02-01"])]
+    assert sorted(status for _, status, _ in resultados) == ["pending", "sent", "sent"]
+    assert avances[-1]["terminados"] == 3
+
+
+def test_proceso_caido_no_reencola_lo_que_pudo_emitirse(controller):
+    for _ in range(3):
+        controller.emitir_boleta(BOLETA)
+
+    def tarea(sender_id, documentos, al_emitir=None):
+        al_emitir(0, {"enviado": True, "numero": "EB01-1", "error": None})
+        raise BrokenProcessPool("el proceso de emisión murió")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = EmissionScheduler(max_procesos=1, tarea=tarea, executor=executor)
+        resultados = controller.enviar_emisiones_pendientes(scheduler)
+
+    # la primera quedó registrada al emitirse; las otras se verifican a mano
+    assert [status for _, status, _ in resultados] == [
+        "sent",
+        "unconfirmed",
+        "unconfirmed",
+    ]
+    assert controller.db.get_emission_outbox("pending") == []
+    assert controller.db.get_emission_outbox("sent")[0][7] == "EB01-1"
+
+
+@pytest.fixture
+def cache_extraccion():
+    db = DatabaseManager(":memory:")
+    db.create_tables()
+    yield ExtractionCache(db, max_bytes=10_000)
+    db.close()
+
+
+def test_cache_de_extraccion_por_contenido(cache_extraccion, tmp_path):
+    llamadas = []
+
+    def extraer():
+        llamadas.append(1)
+        return '{"total": 10.0}'
+
+    foto = tmp_path / "boleta.jpg"
+    foto.write_bytes(b"imagen de la boleta")
+    copia = tmp_path / "copia.jpg"
+    copia.write_bytes(b"imagen de la boleta")
+
+    assert cache_extraccion.obtener_o_extraer(foto, "v1", extraer) == '{"total": 10.0}'
+    assert cache_extraccion.obtener_o_extraer(copia, "v1", extraer) == '{"total": 10.0}'
+    assert len(llamadas) == 1  # mismo contenido, otro nombre: no se vuelve a subir
+    cache_extraccion.obtener_o_extraer(foto, "v2", extraer)  # cambió el prompt
+    assert len(llamadas) == 2
+    assert cache_extraccion.estadisticas == {"aciertos": 1, "fallos": 2, "desalojos": 0}
+    assert cache_extraccion.db.get_extraction_cache_stats()[::2] == (2, 1)
+
+
+def test_cache_no_guarda_extracciones_fallidas(cache_extraccion, tmp_path):
+    foto = tmp_path / "boleta.jpg"
+    foto.write_bytes(b"x")
+    assert cache_extraccion.obtener_o_extraer(foto, "v1", lambda: None) is None
+    assert cache_extraccion.obtener_o_extraer(foto, "v1", lambda: "{}") == "{}"
+    assert cache_extraccion.estadisticas["fallos"] == 2
+
+
+def test_cache_desaloja_lo_usado_hace_mas_tiempo(cache_extraccion, tmp_path):
+    cache_extraccion.max_bytes = 250
+    fotos = []
+    for i in range(3):
+        foto = tmp_path / f"boleta{i}.jpg"
+        foto.write_bytes(bytes([i]))
+        fotos.append(foto)
+
+    def abrir(foto):
+        return cache_extraccion.obtener_o_extraer(foto, "v1", lambda: "x" * 100)
+
+    abrir(fotos[0])
+    abrir(fotos[1])
+    abrir(fotos[0])  # se volvió a abrir: la menos reciente es la segunda
+    abrir(fotos[2])  # 300 bytes > 250: se desaloja una
+
+    assert cache_extraccion.estadisticas["desalojos"] == 1
+    aciertos = cache_extraccion.estadisticas["aciertos"]
+    abrir(fotos[0])
+    abrir(fotos[2])
+    assert cache_extraccion.estadisticas["aciertos"] == aciertos + 2
+    assert cache_extraccion.db.get_extraction_cache_stats()[:2] == (2, 200)
+
+
+class BackendDePrueba(StubBackend):
+    """Stub que anota cada archivo subido: (ruta, bytes, nombre)."""
+
+    def __init__(self, respuesta=None):
+        super().__init__(respuesta)
+        self.subidas = []
+
+    def subir(self, ruta, nombre):
+        self.subidas.append((ruta, os.path.getsize(ruta), nombre))
+        return super().subir(ruta, nombre)
+
+
+def test_extraccion_de_imagen_usa_la_cache(cache_extraccion, tmp_path):
+    backend = BackendDePrueba()
+    foto = tmp_path / "boleta.bmp"
+    foto.write_bytes(b"imagen")
+
+    cliente = ExtractionClient(backend, cache=cache_extraccion)
+    assert cliente.extraer(str(foto)) == BOLETA_STUB
+    assert cliente.extraer(str(foto)) == BOLETA_STUB
+    assert len(backend.subidas) == 1
+
+    ExtractionClient(backend).extraer(str(foto))  # sin caché
+    assert len(backend.subidas) == 2
+
+
+def foto_de_boleta(ruta, orientacion=None):
+    """Foto 'de celular': papel claro con texto sobre una mesa oscura."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(7)
+    foto = Image.new("RGB", (4000, 3000), (60, 40, 30))
+    dibujo = ImageDraw.Draw(foto)
+    dibujo.rectangle((1000, 500, 2999, 2499), fill=(245, 245, 240))
+    for y in range(600, 2400, 40):
+        for x in range(1100, 2900, 30):
+            if rng.random() < 0.6:
+                dibujo.rectangle((x, y, x + 18, y + 24), fill=(20, 20, 20))
+    # ruido del sensor: las fotos reales pesan varios MB
+    ruido = Image.effect_noise((4000, 3000), 25).convert("RGB")
+    foto = Image.blend(foto, ruido, 0.08)
+    exif = Image.Exif()
+    if orientacion:
+        exif[0x0112] = orientacion
+    foto.save(ruta, "JPEG", quality=95, exif=exif)
+
+
+def test_preprocesado_de_la_foto(tmp_path):
+    from PIL import Image
+
+    foto = tmp_path / "boleta.jpg"
+    foto_de_boleta(foto, orientacion=6)  # tomada con el celular de costado
+
+    subir, medidas = preparar_imagen(str(foto), lado_max=1600)
+    try:
+        assert subir != str(foto)
+        assert medidas["bytes_subida"] < medidas["bytes_original"] / 3
+        with Image.open(subir) as preparada:
+            assert preparada.mode == "L"
+            assert max(preparada.size) <= 1600
+            # solo el papel (2000x2000 + relleno), ya enderezado
+            ancho, alto = preparada.size
+            assert abs(ancho - alto) < 0.1 * ancho
+        assert medidas["tamano"] == (ancho, alto)
+    finally:
+        os.remove(subir)
+
+
+def test_preprocesado_sin_ganancia_sube_el_original(tmp_path):
+    from PIL import Image
+
+    chica = tmp_path / "chica.png"
+    Image.new("L", (40, 30), 255).save(chica)
+    assert preparar_imagen(str(chica))[0] == str(chica)
+
+    rota = tmp_path / "rota.jpg"
+    rota.write_bytes(b"no es una imagen")
+    subir, medidas = preparar_imagen(str(rota))
+    assert subir == str(rota)
+    assert medidas["bytes_subida"] == medidas["bytes_original"]
+
+
+def test_extraccion_sube_la_foto_preprocesada(tmp_path, monkeypatch):
+    backend = BackendDePrueba()
+    cliente = ExtractionClient(backend)
+    monkeypatch.delenv("IMAGEN_PREPROCESADO", raising=False)
+    foto = tmp_path / "boleta.jpg"
+    foto_de_boleta(foto)
+
+    assert cliente.extraer(str(foto)) == BOLETA_STUB
+    ((ruta, tamano, nombre),) = backend.subidas
+    assert ruta != str(foto) and not os.path.exists(ruta)  # temporal borrado
+    assert tamano < os.path.getsize(foto)
+    assert nombre == "boleta.jpg"
+
+    monkeypatch.setenv("IMAGEN_PREPROCESADO", "0")
+    cliente.extraer(str(foto))
+    assert backend.subidas[-1][0] == str(foto)
+
+
+def test_cliente_gemini_se_configura_una_vez(tmp_path, monkeypatch):
+    from Backend.utils import extraction_client
+
+    llamadas = {"configure": 0, "modelos": 0, "timeouts": [], "esquemas": []}
+
+    class Modelo:
+        def __init__(self, model_name):
+            llamadas["modelos"] += 1
+
+        def generate_content(self, partes, generation_config, request_options):
+            llamadas["timeouts"].append(request_options["timeout"])
+            llamadas["esquemas"].append(generation_config["response_schema"])
+            texto = json.dumps(BOLETA_STUB)
+            return type("Respuesta", (), {"text": texto})
+
+    def configure(api_key):
+        llamadas["configure"] += 1
+
+    archivo = type("Archivo", (), {"display_name": "b.pdf", "uri": "files/1"})
+    monkeypatch.setattr(extraction_client.genai, "configure", configure)
+    monkeypatch.setattr(extraction_client.genai, "GenerativeModel", Modelo)
+    monkeypatch.setattr(
+        extraction_client.genai, "upload_file", lambda path, display_name: archivo
+    )
+    pdf = tmp_path / "b.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    cliente = ExtractionClient(GeminiBackend(api_key="clave", timeout=12.0))
+    for _ in range(3):
+        assert cliente.extraer(str(pdf)) == BOLETA_STUB
+    assert (llamadas["configure"], llamadas["modelos"]) == (1, 1)
+    assert llamadas["timeouts"] == [12.0] * 3
+    esquema = llamadas["esquemas"][0]
+    assert esquema["required"] == ["cliente", "productos", "total"]
+    assert "$defs" not in json.dumps(esquema)
+    assert cliente.estadisticas["extracciones"] == 3
+
+
+def test_cliente_sin_api_key_no_extrae(tmp_path, monkeypatch):
+    monkeypatch.delenv("API_KEY", raising=False)
+    pdf = tmp_path / "b.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    assert ExtractionClient(GeminiBackend()).extraer(str(pdf)) is None
+
+
+def test_un_solo_prompt_para_imagen_y_pdf():
+    imagen, pdf = prompt_para("imagen"), prompt_para("pdf")
+    assert "la imagen proporcionada" in imagen and "el PDF proporcionado" in pdf
+    assert imagen.replace("la imagen proporcionada", "") == pdf.replace(
+        "el PDF proporcionado", ""
+    )
+    # el mismo formato de fecha que valida BoletaData
+    assert '"fecha": "dd/mm/yyyy"' in imagen
+
+
+def test_lectura_tolerante_de_la_respuesta():
+    esperado = {"total": 5.0, "productos": [1, 2]}
+    assert leer_json('{"total": 5.0, "productos": [1, 2]}') == esperado
+    assert leer_json('```json\n{"total": 5.0, "productos": [1, 2]}\n```') == esperado
+    assert leer_json('Claro:\n{"total": 5.0, "productos": [1, 2,],}\nListo') == esperado
+    with pytest.raises(ValueError):
+        leer_json("No puedo leer la imagen")
+
+
+class BackendConRespuestas(StubBackend):
+    """Responde en orden las respuestas dadas y anota cada prompt."""
+
+    def __init__(self, *respuestas):
+        super().__init__()
+        self.respuestas = list(respuestas)
+        self.prompts = []
+
+    def generar(self, archivo, prompt, esquema=None):
+        self.prompts.append((prompt, list(esquema["properties"])))
+        respuesta = self.respuestas.pop(0)
+        return respuesta if isinstance(respuesta, str) else json.dumps(respuesta)
+
+
+def test_se_vuelve_a_pedir_solo_la_parte_invalida(cache_extraccion, tmp_path):
+    mal_cliente = dict(BOLETA_STUB, cliente={"cliente": "ANA", "dni": "123"})
+    backend = BackendConRespuestas(
+        mal_cliente, {"cliente": {"cliente": "ANA", "dni": "12345678"}}
+    )
+    pdf = tmp_path / "b.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    cliente = ExtractionClient(backend, cache=cache_extraccion)
+    data = cliente.extraer(str(pdf))
+    assert data["cliente"] == {
+        "fecha": "",
+        "cliente": "ANA",
+        "dni": "12345678",
+        "ruc": "",
+    }
+    assert data["productos"] == BOLETA_STUB["productos"]
+    # la segunda generación pide solo el cliente
+    assert backend.prompts[1][1] == ["cliente"]
+    assert "cliente.dni" in backend.prompts[1][0]
+    assert cliente.estadisticas["reintentos"] == 1
+    assert cliente.extraer(str(pdf)) == data  # validada: quedó en la caché
+
+
+def test_respuesta_invalida_tras_reintentar(cache_extraccion, tmp_path):
+    pdf = tmp_path / "b.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    sin_productos = dict(BOLETA_STUB, productos=[])
+    backend = BackendConRespuestas(
+        "no es json", sin_productos, {"productos": []}, *["no es json"] * 3
+    )
+    cliente = ExtractionClient(backend, cache=cache_extraccion, reintentos=2)
+
+    # sin JSON se pide todo de nuevo; luego solo los productos
+    assert cliente.extraer(str(pdf))["productos"] == []
+    assert [campos for _, campos in backend.prompts] == [
+        ["cliente", "productos", "total"],
+        ["cliente", "productos", "total"],
+        ["productos"],
+    ]
+    # lo inválido no se guarda en la caché: se vuelve a extraer
+    assert cliente.extraer(str(pdf)) is None
+    assert len(backend.prompts) == 6
+
+
+def boleta_extraida(total=10.0, dni="12345678", descripciones=("ARROZ EXTRA",)):
+    productos = [
+        {"cantidad": 1, "descripcion": d, "precio_total": total / len(descripciones)}
+        for d in descripciones
+    ]
+    return {
+        "cliente": {"cliente": "JUAN", "dni": dni, "ruc": ""},
+        "productos": productos,
+        "total": total,
+    }
+
+
+@pytest.fixture
+def cola_ingesta(tmp_path):
+    db = DatabaseManager(":memory:")
+    db.create_tables()
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    carpeta = tmp_path / "boletas"
+    carpeta.mkdir()
+    for i in range(8):
+        (carpeta / f"boleta_{i}.jpg").write_bytes(f"foto {i}".encode())
+    (carpeta / "notas.txt").write_text("no es una boleta")
+    yield db, carpeta
+    db.close()
+
+
+def test_ingesta_escala_con_la_concurrencia(cola_ingesta):
+    db, carpeta = cola_ingesta
+
+    def extraer(ruta):
+        time.sleep(0.1)  # subida + generación
+        return json.dumps(boleta_extraida())
+
+    pipeline = IngestionPipeline(db, extraer=extraer, concurrencia=4, por_minuto=0)
+    assert len(pipeline.encolar_carpeta(str(carpeta))) == 8
+    avances = []
+    resumen = pipeline.procesar_pendientes(avances.append)
+
+    assert resumen["listos"] == 8 and resumen["errores"] == 0
+    assert resumen["segundos"] < 0.5  # en serie serían 0.8 s
+    assert [a["terminados"] for a in avances] == list(range(1, 9))
+    assert len(db.get_ingestion_queue("ready")) == 8
+    # nada más que procesar
+    assert pipeline.procesar_pendientes()["total"] == 0
+
+
+def test_ingesta_detenida_no_empieza_mas_archivos(cola_ingesta):
+    db, carpeta = cola_ingesta
+    pipeline = None
+
+    def extraer(ruta):
+        pipeline.detener()  # p. ej. se cerró la app durante el primero
+        return json.dumps(boleta_extraida())
+
+    pipeline = IngestionPipeline(db, extraer=extraer, concurrencia=1, por_minuto=0)
+    pipeline.encolar_carpeta(str(carpeta))
+    assert pipeline.procesar_pendientes()["listos"] == 1
+    assert pipeline.procesar_pendientes()["total"] == 0
+    # lo tomado y no empezado vuelve a la cola al reiniciar
+    assert db.reset_processing_ingestions() == 7
+
+
+def test_ingesta_omite_archivos_repetidos(cola_ingesta, tmp_path):
+    db, carpeta = cola_ingesta
+    pipeline = IngestionPipeline(db, extraer=lambda ruta: None, por_minuto=0)
+    pipeline.encolar_carpeta(str(carpeta))
+    copia = tmp_path / "copia.jpg"
+    copia.write_bytes(b"foto 3")
+
+    assert pipeline.encolar_carpeta(str(carpeta)) == []
+    assert pipeline.encolar_archivos([str(copia)]) == []
+
+
+def test_ingesta_limita_solicitudes_por_minuto(cola_ingesta):
+    db, carpeta = cola_ingesta
+    inicios = []
+
+    def extraer(ruta):
+        inicios.append(time.monotonic())
+        return json.dumps(boleta_extraida())
+
+    pipeline = IngestionPipeline(db, extraer=extraer, concurrencia=8, por_minuto=600)
+    pipeline.encolar_archivos(sorted(map(str, carpeta.glob("*.jpg")))[:4])
+    pipeline.procesar_pendientes()
+
+    inicios.sort()
+    separaciones = [b - a for a, b in zip(inicios, inicios[1:])]
+    assert min(separaciones) >= 0.09  # 600 por minuto = una cada 0.1 s
+
+
+def test_ingesta_guarda_errores_y_observaciones(cola_ingesta):
+    db, carpeta = cola_ingesta
+    respuestas = {
+        "boleta_0.jpg": None,  # el modelo no respondió
+        "boleta_1.jpg": "no es json",
+        "boleta_2.jpg": json.dumps({"total": 5}),
+        "boleta_3.jpg": json.dumps(boleta_extraida(dni="123")),
+        "boleta_4.jpg": json.dumps(dict(boleta_extraida(), total=99.0)),
+    }
+
+    def extraer(ruta):
+        return respuestas.get(os.path.basename(ruta), json.dumps(boleta_extraida()))
+
+    controller = BoletaController(db)
+    controller.agregar_product(1, "ARROZ EXTRA", "KILOGRAMO", 5.5, 0)
+    pipeline = IngestionPipeline(db, controller, extraer=extraer, por_minuto=0)
+    pipeline.encolar_carpeta(str(carpeta), id_sender=1)
+    resumen = pipeline.procesar_pendientes()
+
+    assert (resumen["listos"], resumen["errores"]) == (5, 3)
+    filas = {os.path.basename(f[1]): f for f in db.get_ingestion_queue()}
+    assert filas["boleta_0.jpg"][3] == "error"
+    assert "cliente y productos" in filas["boleta_2.jpg"][7]
+    assert json.loads(filas["boleta_3.jpg"][6]) == ["DNI inválido: 123"]
+    assert "no coincide" in json.loads(filas["boleta_4.jpg"][6])[0]
+    coincidencias = json.loads(filas["boleta_5.jpg"][5])
+    assert coincidencias[0]["nombre"] == "ARROZ EXTRA"
+    assert json.loads(filas["boleta_5.jpg"][6]) == []
+
+
+def test_limite_de_solicitudes_entre_vueltas():
+    limite = LimiteSolicitudes(por_minuto=600)
+    inicios = []
+
+    async def solicitud():
+        await limite.esperar()
+        inicios.append(time.monotonic())
+
+    asyncio.run(solicitud())
+    asyncio.run(solicitud())  # otra vuelta del worker: respeta la anterior
+    assert inicios[1] - inicios[0] >= 0.09
+
+
+def test_ingesta_sin_red_con_el_backend_stub(cola_ingesta):
+    db, carpeta = cola_ingesta
+    backend = StubBackend(latencia_subida=0.05, latencia_generacion=0.05)
+    cliente = ExtractionClient(backend)
+    pipeline = IngestionPipeline(
+        db, extraer=cliente.extraer, concurrencia=8, por_minuto=0
+    )
+    pipeline.encolar_carpeta(str(carpeta))
+    resumen = pipeline.procesar_pendientes()
+
+    assert resumen["listos"] == 8 and resumen["segundos"] < 0.5
+    data = json.loads(db.get_ingestion_queue("ready")[0][4])
+    assert data["cliente"]["cliente"] == "CLIENTE DE PRUEBA"
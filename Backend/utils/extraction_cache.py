@@ -0,0 +1,72 @@
+"""Caché de extracciones de Gemini por contenido del archivo.
+
+Los operadores suelen volver a abrir la misma foto o PDF (p. ej. después de
+corregir un error); con la caché la segunda vez no se sube el archivo ni se
+consume cuota de la API. La clave es el SHA-256 de los bytes del archivo más
+la versión de la extracción (modelo + prompt): si cambia el prompt o el
+modelo, los resultados anteriores dejan de usarse solos.
+
+Se guarda en la tabla extraction_cache de billing_system.db con un límite de
+tamaño (EXTRACCION_CACHE_MB, 50 por defecto); al superarlo se desalojan las
+extracciones usadas hace más tiempo. EXTRACCION_CACHE=0 la desactiva.
+"""
+
+import hashlib
+import logging
+import os
+
+
+def sha256_archivo(ruta, bloque=1 << 20):
+    digest = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for parte in iter(lambda: archivo.read(bloque), b""):
+            digest.update(parte)
+    return digest.hexdigest()
+
+
+def version_extraccion(*partes):
+    """Huella corta del modelo y el prompt usados para extraer."""
+    return hashlib.sha256("\x00".join(partes).encode("utf-8")).hexdigest()[:16]
+
+
+class ExtractionCache:
+    """Resultados de extracción (texto JSON) por archivo y versión.
+
+    estadisticas cuenta aciertos, fallos y desalojos de este proceso; los
+    aciertos acumulados por entrada están en la columna hits.
+    """
+
+    def __init__(self, db, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("EXTRACCION_CACHE_MB", "50")) * 2**20)
+        self.db = db
+        self.max_bytes = max_bytes
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+
+    def obtener_o_extraer(self, ruta, version, extraer):
+        """Resultado guardado para el archivo, o extraer() (y se guarda si
+        no es None). Un error de la caché nunca impide la extracción."""
+        try:
+            huella = sha256_archivo(ruta)
+            clave = f"{huella}:{version}"
+            guardado = self.db.get_cached_extraction(clave)
+        except Exception as e:
+            logging.warning(f"Caché de extracción no disponible: {e}")
+            return extraer()
+
+        if guardado is not None:
+            self.estadisticas["aciertos"] += 1
+            logging.info(f"Extracción de {os.path.basename(ruta)} desde la caché")
+            return guardado
+
+        self.estadisticas["fallos"] += 1
+        resultado = extraer()
+        if resultado is not None:
+            try:
+                self.db.put_cached_extraction(clave, huella, version, resultado)
+                self.estadisticas["desalojos"] += self.db.evict_cached_extractions(
+                    self.max_bytes
+                )
+            except Exception as e:
+                logging.warning(f"No se pudo guardar la extracción en caché: {e}")
+        return resultado
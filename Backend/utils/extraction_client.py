@@ -0,0 +1,405 @@
+"""Cliente de extracción de boletas: imagen o PDF -> JSON.
+
+Se crea una sola vez (ver img_to_json.obtener_cliente) con el backend ya
+configurado: el modelo de Gemini, la clave y el prompt no se vuelven a
+preparar en cada archivo. El backend se elige con EXTRACCION_BACKEND:
+
+    gemini  (por defecto) sube el archivo y genera con el modelo MODELO
+    stub    sin red: responde una boleta fija después de una latencia
+            simulada (EXTRACCION_STUB_LATENCIA segundos, 0 por defecto);
+            sirve para medir la ingesta por lote sin gastar cuota
+
+La respuesta se pide como JSON con el esquema de Backend.models.BoletaExtraida
+y se lee con tolerancia (con o sin ```json, comas finales). Si no valida se
+vuelve a pedir solo la parte que falló (cliente, productos o total), sin
+volver a subir el archivo.
+
+La generación se corta a los EXTRACCION_TIMEOUT segundos (60 por defecto).
+Un backend es cualquier objeto con nombre, disponible, subir(ruta,
+nombre) -> archivo y generar(archivo, prompt, esquema) -> texto.
+"""
+
+import copy
+import functools
+import json
+import logging
+import os
+import re
+import time
+
+import google.generativeai as genai
+from pydantic import ValidationError, create_model
+
+from Backend.models import BoletaExtraida
+
+from Backend.utils.extraction_cache import version_extraccion
+from Backend.utils.image_preprocess import (
+    parametros as parametros_preprocesado,
+    preparar_imagen,
+    version_preprocesado,
+)
+
+MODELO = "gemini-2.0-flash"
+TIMEOUT = 60.0
+
+ORIGENES = {"imagen": "la imagen proporcionada", "pdf": "el PDF proporcionado"}
+
+PLANTILLA_PROMPT = """
+Convierte la información de {origen} en un JSON con la siguiente estructura con tipo UTF-8:
+{
+    "cliente":{
+    "fecha": "dd/mm/yyyy" (opcional tipo DATE),
+    "cliente": "Nombre del cliente (tipo STRING)",
+    "dni": "DNI del comprador" (opcional 8 digitos , tipo string),
+    "ruc": "ruc del cliente" (opcional, debe comenzar con '10',tipo string),
+    }
+    "productos": [
+        {
+            "cantidad": X (Tipo float o int),
+            "unidad_medida": "CAJA" (si es otro producto) o "KILOGRAMO" (si es menestra tipo STRING)
+            "descripcion": "Descripción del producto (tipo STRING)",
+            "precio_base": X.XX,   (precio base del producto opcional tipo FLOAT)
+            "igv": 1 (si incluye IGV) o 0 (si no incluye IGV, debes considerar que las menestras Peruanas no incluyen IGV)
+           "precio_total": x.xx (precio total del producto a pagar tipo FLOAT)
+
+        }
+    ],
+    "total": X.XX (total a pagar por el cliente  tipo FLOAT)
+}
+Utiliza los valores exactos de {origen} para cada campo y coloca un valor vacío segun tipo de dato  (no uses None , int => 0 ,string="") corresponda en los campos opcionales si no están presentes,ademas pasa a mayuscual los datos.
+"""
+
+# respuesta del backend stub
+BOLETA_STUB = {
+    "cliente": {
+        "fecha": "",
+        "cliente": "CLIENTE DE PRUEBA",
+        "dni": "12345678",
+        "ruc": "",
+    },
+    "productos": [
+        {
+            "cantidad": 2,
+            "unidad_medida": "KILOGRAMO",
+            "descripcion": "ARROZ EXTRA",
+            "precio_base": 5.0,
+            "igv": 0,
+            "precio_total": 10.0,
+        }
+    ],
+    "total": 10.0,
+}
+
+
+def prompt_para(tipo):
+    """Prompt de extracción para "imagen" o "pdf"."""
+    return PLANTILLA_PROMPT.replace("{origen}", ORIGENES[tipo])
+
+
+def tipo_de_archivo(ruta):
+    return "pdf" if ruta.lower().endswith(".pdf") else "imagen"
+
+
+def prompt_parte(tipo, parte, errores):
+    """Prompt para volver a pedir solo `parte` de la boleta."""
+    return (
+        prompt_para(tipo)
+        + f'\nLa respuesta anterior tenía errores en "{parte}" ({errores}). '
+        + f'Responde un JSON solo con el campo "{parte}", corregido.\n'
+    )
+
+
+_CERCO = re.compile(r"```(?:json)?\s*(.*?)(?:```|\Z)", re.DOTALL)
+_COMA_FINAL = re.compile(r",\s*([}\]])")
+
+
+def leer_json(texto):
+    """Objeto JSON de la respuesta del modelo, con o sin bloque ```json,
+    con texto alrededor o con comas finales. ValueError si no hay JSON."""
+    cercado = _CERCO.search(texto)
+    if cercado:
+        texto = cercado.group(1)
+    texto = texto.strip()
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        pass
+    inicios = [i for i in (texto.find("{"), texto.find("[")) if i >= 0]
+    fin = max(texto.rfind("}"), texto.rfind("]"))
+    if not inicios or fin < min(inicios):
+        raise ValueError("La respuesta no contiene JSON")
+    return json.loads(_COMA_FINAL.sub(r"\1", texto[min(inicios) : fin + 1]))
+
+
+@functools.lru_cache(maxsize=None)
+def _esquema_gemini(modelo):
+    completo = modelo.model_json_schema()
+    definiciones = completo.get("$defs", {})
+    renombres = {"minItems": "min_items", "maxItems": "max_items"}
+
+    def convertir(nodo):
+        if "$ref" in nodo:
+            nodo = dict(definiciones[nodo["$ref"].split("/")[-1]], **nodo)
+        if "anyOf" in nodo:  # Optional[X]
+            opciones = [o for o in nodo["anyOf"] if o.get("type") != "null"]
+            return dict(convertir(opciones[0]), nullable=True)
+        esquema = {}
+        for clave, valor in nodo.items():
+            if clave == "properties":
+                esquema["properties"] = {k: convertir(v) for k, v in valor.items()}
+                esquema["required"] = list(valor)  # se piden todos los campos
+            elif clave == "items":
+                esquema["items"] = convertir(valor)
+            elif clave in ("type", "format", "description", "enum"):
+                esquema[clave] = valor
+            elif clave in renombres:
+                esquema[renombres[clave]] = valor
+        return esquema
+
+    return convertir(completo)
+
+
+def esquema_gemini(modelo):
+    """response_schema de Gemini para un modelo pydantic: el subconjunto de
+    OpenAPI que acepta (sin $ref, default, title ni límites numéricos)."""
+    return copy.deepcopy(_esquema_gemini(modelo))
+
+
+@functools.lru_cache(maxsize=None)
+def modelo_de_parte(parte):
+    """Modelo con solo el campo `parte` de BoletaExtraida."""
+    campo = BoletaExtraida.model_fields[parte]
+    return create_model(f"Parte_{parte}", **{parte: (campo.annotation, campo)})
+
+
+def partes_invalidas(data):
+    """{parte: errores} de lo que no valida contra BoletaExtraida."""
+    try:
+        BoletaExtraida.model_validate(data)
+        return {}
+    except ValidationError as e:
+        fallidas = {}
+        for error in e.errors():
+            parte = error["loc"][0]
+            detalle = ".".join(str(p) for p in error["loc"]) + ": " + error["msg"]
+            fallidas.setdefault(parte, []).append(detalle)
+        return {parte: "; ".join(detalles) for parte, detalles in fallidas.items()}
+
+
+class GeminiBackend:
+    """Gemini configurado una vez: una sola instancia del modelo."""
+
+    nombre = "gemini"
+
+    def __init__(self, api_key=None, modelo=MODELO, timeout=TIMEOUT):
+        self.modelo = modelo
+        self.timeout = timeout
+        self._model = None
+        api_key = api_key or os.getenv("API_KEY")
+        if not api_key:
+            logging.error("API_KEY no encontrada en el archivo .env.")
+            return
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model_name=modelo)
+
+    @property
+    def disponible(self):
+        return self._model is not None
+
+    def subir(self, ruta, nombre):
+        archivo = genai.upload_file(path=ruta, display_name=nombre)
+        logging.info(f"Archivo subido '{archivo.display_name}' con URI: {archivo.uri}")
+        return archivo
+
+    def generar(self, archivo, prompt, esquema=None):
+        configuracion = None
+        if esquema is not None:
+            configuracion = {
+                "response_mime_type": "application/json",
+                "response_schema": esquema,
+            }
+        respuesta = self._model.generate_content(
+            [archivo, prompt],
+            generation_config=configuracion,
+            request_options={"timeout": self.timeout},
+        )
+        return respuesta.text
+
+
+class StubBackend:
+    """Sin red: responde `respuesta` (por defecto BOLETA_STUB; un texto se
+    devuelve tal cual) después de esperar las latencias dadas."""
+
+    nombre = "stub"
+    disponible = True
+
+    def __init__(
+        self, respuesta=None, latencia_subida=0.0, latencia_generacion=0.0
+    ):
+        self.respuesta = respuesta if respuesta is not None else BOLETA_STUB
+        self.latencia_subida = latencia_subida
+        self.latencia_generacion = latencia_generacion
+
+    def subir(self, ruta, nombre):
+        time.sleep(self.latencia_subida)
+        return ruta
+
+    def generar(self, archivo, prompt, esquema=None):
+        time.sleep(self.latencia_generacion)
+        if isinstance(self.respuesta, str):
+            return self.respuesta
+        return json.dumps(self.respuesta, ensure_ascii=False)
+
+
+def backend_desde_entorno():
+    """Backend según EXTRACCION_BACKEND, EXTRACCION_TIMEOUT y
+    EXTRACCION_STUB_LATENCIA."""
+    nombre = os.getenv("EXTRACCION_BACKEND", "gemini")
+    if nombre == "stub":
+        latencia = float(os.getenv("EXTRACCION_STUB_LATENCIA", "0"))
+        return StubBackend(
+            latencia_subida=latencia / 2, latencia_generacion=latencia / 2
+        )
+    if nombre != "gemini":
+        raise ValueError(f"EXTRACCION_BACKEND desconocido: {nombre}")
+    timeout = float(os.getenv("EXTRACCION_TIMEOUT", str(TIMEOUT)))
+    return GeminiBackend(timeout=timeout)
+
+
+class ExtractionClient:
+    """Extrae boletas con un backend; con `cache` (ExtractionCache) el mismo
+    archivo no se vuelve a enviar.
+
+    estadisticas acumula los segundos de preprocesado, subida y generación
+    de las extracciones hechas por el backend (no las de la caché) y las
+    generaciones repetidas por respuestas inválidas.
+    """
+
+    def __init__(self, backend, cache=None, reintentos=1):
+        self.backend = backend
+        self.cache = cache
+        self.reintentos = reintentos
+        self.estadisticas = {
+            "extracciones": 0,
+            "reintentos": 0,
+            "preprocesado": 0.0,
+            "subida": 0.0,
+            "generacion": 0.0,
+        }
+
+    def version(self, tipo):
+        """Versión de la extracción para la caché: backend, modelo y prompt
+        (y el preprocesado, en imágenes)."""
+        partes = [
+            self.backend.nombre,
+            getattr(self.backend, "modelo", ""),
+            prompt_para(tipo),
+            json.dumps(esquema_gemini(BoletaExtraida), sort_keys=True),
+        ]
+        if tipo == "imagen":
+            partes.append(version_preprocesado())
+        return version_extraccion(*partes)
+
+    def extraer(self, ruta):
+        """Boleta del archivo como dict (cliente, productos, total), o None
+        si no se pudo extraer. Solo se guardan en la caché las que validan."""
+        tipo = tipo_de_archivo(ruta)
+        if self.cache is None:
+            return self._extraer(ruta, tipo)[0]
+        extraida = []
+
+        def extraer_texto():
+            data, valida = self._extraer(ruta, tipo)
+            extraida.append(data)
+            return json.dumps(data, ensure_ascii=False) if valida else None
+
+        texto = self.cache.obtener_o_extraer(ruta, self.version(tipo), extraer_texto)
+        if extraida:  # recién extraída: ya es un dict
+            return extraida[0]
+        return json.loads(texto)
+
+    # -- internos --
+    def _extraer(self, ruta, tipo):
+        """(boleta, valida): la boleta es None si no se pudo extraer nada."""
+        if not self.backend.disponible:
+            return None, False
+        nombre = os.path.basename(ruta)
+        inicio = time.perf_counter()
+        ruta_subida = ruta
+        medidas = {"bytes_original": os.path.getsize(ruta), "segundos": 0.0}
+        medidas["bytes_subida"] = medidas["bytes_original"]
+        activo, lado_max, calidad = parametros_preprocesado()
+        if tipo == "imagen" and activo:
+            # foto enderezada, recortada, en grises y reducida: se sube mucho menos
+            ruta_subida, medidas = preparar_imagen(ruta, lado_max, calidad)
+
+        try:
+            inicio_subida = time.perf_counter()
+            archivo = self.backend.subir(ruta_subida, nombre)
+        except Exception as e:
+            logging.error(f"al subir {nombre}: {e}")
+            return None, False
+        finally:
+            if ruta_subida != ruta:
+                os.remove(ruta_subida)
+
+        inicio_generacion = time.perf_counter()
+        data, valida = self._generar_boleta(archivo, tipo, nombre)
+        fin = time.perf_counter()
+
+        self.estadisticas["extracciones"] += 1
+        self.estadisticas["preprocesado"] += medidas["segundos"]
+        self.estadisticas["subida"] += inicio_generacion - inicio_subida
+        self.estadisticas["generacion"] += fin - inicio_generacion
+        logging.info(
+            f"Extracción de {nombre}: "
+            f"{medidas['bytes_original'] / 1024:.0f} KB -> "
+            f"{medidas['bytes_subida'] / 1024:.0f} KB subidos, "
+            f"preprocesado {medidas['segundos']:.2f} s, "
+            f"subida {inicio_generacion - inicio_subida:.2f} s, "
+            f"generación {fin - inicio_generacion:.2f} s, "
+            f"total {fin - inicio:.2f} s"
+        )
+        return data, valida
+
+    def _generar(self, archivo, prompt, modelo):
+        """Objeto JSON generado con el esquema de `modelo`, o None si el
+        backend falla o no responde JSON."""
+        try:
+            texto = self.backend.generar(archivo, prompt, esquema_gemini(modelo))
+            return leer_json(texto)
+        except Exception as e:
+            logging.warning(f"Respuesta no válida del modelo: {e}")
+            return None
+
+    def _generar_boleta(self, archivo, tipo, nombre):
+        """Genera la boleta del archivo ya subido. Si no valida contra
+        BoletaExtraida se vuelve a pedir solo lo que falló (cliente,
+        productos o total), hasta `reintentos` veces."""
+        prompt = prompt_para(tipo)
+        data = self._generar(archivo, prompt, BoletaExtraida)
+        for _ in range(self.reintentos):
+            if not isinstance(data, dict):  # nada utilizable: se pide todo otra vez
+                self.estadisticas["reintentos"] += 1
+                data = self._generar(archivo, prompt, BoletaExtraida)
+                continue
+            fallidas = partes_invalidas(data)
+            if not fallidas:
+                break
+            for parte, errores in fallidas.items():
+                self.estadisticas["reintentos"] += 1
+                logging.info(f"Extracción de {nombre}: se vuelve a pedir {parte}")
+                respuesta = self._generar(
+                    archivo, prompt_parte(tipo, parte, errores), modelo_de_parte(parte)
+                )
+                if isinstance(respuesta, dict) and parte in respuesta:
+                    data[parte] = respuesta[parte]
+
+        if not isinstance(data, dict):
+            return None, False
+        try:
+            return BoletaExtraida.model_validate(data).model_dump(), True
+        except ValidationError as e:
+            # se entrega igual: el operador la corrige en el formulario
+            logging.warning(f"Extracción de {nombre} con {e.error_count()} errores")
+            return data, False
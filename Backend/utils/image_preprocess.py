@@ -0,0 +1,134 @@
+"""Preprocesado de las fotos de boletas antes de subirlas a Gemini.
+
+Una foto de celular pesa entre 4 y 12 MB y su subida es casi toda la espera
+después de "Subir Imagen". Antes de subirla se endereza según el EXIF, se
+recortan los márgenes (la mesa alrededor del papel), se pasa a escala de
+grises y se reduce a IMAGEN_LADO_MAX px (2000 por defecto; la letra de una
+boleta sigue legible) como JPEG de calidad IMAGEN_CALIDAD (80). Si el
+resultado no pesa menos que el original se sube el original.
+IMAGEN_PREPROCESADO=0 lo desactiva.
+
+Uso, para ver cuánto se ahorra con fotos reales:
+    python -m Backend.utils.image_preprocess foto1.jpg foto2.jpg
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+LADO_MAX = 2000
+CALIDAD = 80
+
+
+def parametros():
+    """(activo, lado_max, calidad) según las variables de entorno."""
+    activo = os.getenv("IMAGEN_PREPROCESADO", "1") != "0"
+    lado_max = int(os.getenv("IMAGEN_LADO_MAX", str(LADO_MAX)))
+    calidad = int(os.getenv("IMAGEN_CALIDAD", str(CALIDAD)))
+    return activo, lado_max, calidad
+
+
+def version_preprocesado():
+    """Entra en la clave de la caché de extracciones: otro preprocesado
+    puede dar otra extracción."""
+    activo, lado_max, calidad = parametros()
+    return f"gris-recorte-{lado_max}-{calidad}" if activo else "original"
+
+
+def recortar_margenes(imagen, tolerancia=40, relleno=0.02):
+    """Recorta el fondo uniforme alrededor del documento.
+
+    El fondo se toma del color de las esquinas; se conserva un pequeño
+    relleno para no cortar texto pegado al borde. Si no hay un margen claro
+    la imagen queda igual. El borde se busca en una copia de 512 px.
+    """
+    muestra = imagen.convert("L")
+    muestra.thumbnail((512, 512))
+    ancho, alto = muestra.size
+    esquinas = [
+        muestra.getpixel((0, 0)),
+        muestra.getpixel((ancho - 1, 0)),
+        muestra.getpixel((0, alto - 1)),
+        muestra.getpixel((ancho - 1, alto - 1)),
+    ]
+    fondo = Image.new("L", muestra.size, sorted(esquinas)[len(esquinas) // 2])
+    diferencia = ImageChops.difference(muestra, fondo)
+    diferencia = diferencia.filter(ImageFilter.MedianFilter(3))  # quita el ruido
+    caja = diferencia.point(lambda p: 255 if p > tolerancia else 0).getbbox()
+    if caja is None:
+        return imagen
+    escala_x, escala_y = imagen.width / ancho, imagen.height / alto
+    margen_x, margen_y = imagen.width * relleno, imagen.height * relleno
+    izquierda, arriba, derecha, abajo = caja
+    caja = (
+        max(0, int(izquierda * escala_x - margen_x)),
+        max(0, int(arriba * escala_y - margen_y)),
+        min(imagen.width, int(derecha * escala_x + margen_x)),
+        min(imagen.height, int(abajo * escala_y + margen_y)),
+    )
+    area = (caja[2] - caja[0]) * (caja[3] - caja[1])
+    if area > 0.95 * imagen.width * imagen.height:
+        return imagen  # casi sin margen: no vale la pena recortar
+    return imagen.crop(caja)
+
+
+def preparar_imagen(ruta, lado_max=LADO_MAX, calidad=CALIDAD):
+    """Genera la versión liviana de la foto en un archivo temporal.
+
+    Retorna (ruta_a_subir, medidas) con medidas = {"bytes_original",
+    "bytes_subida", "tamano": (ancho, alto), "segundos"}. ruta_a_subir es
+    el original si el preprocesado no lo achica o falla; si no, el que
+    llama debe borrar el temporal.
+    """
+    inicio = time.perf_counter()
+    bytes_original = os.path.getsize(ruta)
+    medidas = {
+        "bytes_original": bytes_original,
+        "bytes_subida": bytes_original,
+        "tamano": None,
+        "segundos": 0.0,
+    }
+    temporal = None
+    try:
+        with Image.open(ruta) as original:
+            imagen = ImageOps.exif_transpose(original)
+            imagen = recortar_margenes(imagen.convert("L"))
+            imagen.thumbnail((lado_max, lado_max), Image.Resampling.LANCZOS)
+            descriptor, temporal = tempfile.mkstemp(suffix=".jpg", prefix="boleta_")
+            with os.fdopen(descriptor, "wb") as salida:
+                imagen.save(salida, "JPEG", quality=calidad, optimize=True)
+    except Exception as e:  # nunca impide la extracción: se sube el original
+        logging.warning(f"No se pudo preprocesar {os.path.basename(ruta)}: {e}")
+        if temporal is not None:
+            os.remove(temporal)
+        medidas["segundos"] = time.perf_counter() - inicio
+        return ruta, medidas
+
+    medidas["segundos"] = time.perf_counter() - inicio
+    bytes_subida = os.path.getsize(temporal)
+    if bytes_subida >= bytes_original:
+        os.remove(temporal)
+        return ruta, medidas
+    medidas["bytes_subida"] = bytes_subida
+    medidas["tamano"] = imagen.size
+    return temporal, medidas
+
+
+if __name__ == "__main__":
+    print(f"{'archivo':<32}{'original KB':>13}{'subida KB':>11}{'tamaño':>13}{'s':>7}")
+    for ruta in sys.argv[1:]:
+        subir, medidas = preparar_imagen(ruta)
+        ancho, alto = medidas["tamano"] or (0, 0)
+        print(
+            f"{os.path.basename(ruta)[:31]:<32}"
+            f"{medidas['bytes_original'] / 1024:>13.0f}"
+            f"{medidas['bytes_subida'] / 1024:>11.0f}"
+            f"{f'{ancho}x{alto}':>13}"
+            f"{medidas['segundos']:>7.2f}"
+        )
+        if subir != ruta:
+            os.remove(subir)
@@ -0,0 +1,257 @@
+"""Ingesta por lote de boletas (imágenes y PDF) a una cola de revisión.
+
+"Subir Imagen" procesa un archivo a la vez y deja el formulario esperando.
+Con la ingesta por lote se elige (o se vigila) una carpeta: cada archivo
+entra a la tabla ingestion_queue y se procesa en segundo plano, varios a la
+vez (INGESTA_CONCURRENCIA, 4 por defecto), sin pasar de GEMINI_RPM
+solicitudes por minuto (15 por defecto, el límite del plan gratuito; 0 =
+sin límite). Cada archivo pasa por:
+
+    extracción (preprocesado, subida, generación y lectura del JSON, con
+    la caché de extracciones) -> validación -> emparejamiento con el
+    catálogo del remitente
+
+y queda "ready" con sus observaciones para que el operador lo revise y lo
+cargue en el formulario, o "error". El mismo archivo (por contenido) no se
+encola dos veces.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Backend.utils.extraction_cache import sha256_archivo
+
+EXTENSIONES = (".png", ".jpg", ".jpeg", ".bmp", ".pdf")
+
+
+def extraer_archivo(ruta):
+    """Boleta (dict) de una imagen o PDF, o None si falló."""
+    from Backend.utils.img_to_json import obtener_cliente
+
+    return obtener_cliente().extraer(ruta)
+
+
+def archivos_de_carpeta(carpeta):
+    """Imágenes y PDF de la carpeta (sin subcarpetas), en orden alfabético."""
+    return sorted(
+        os.path.join(carpeta, nombre)
+        for nombre in os.listdir(carpeta)
+        if nombre.lower().endswith(EXTENSIONES)
+        and os.path.isfile(os.path.join(carpeta, nombre))
+    )
+
+
+def validar_extraccion(data):
+    """Observaciones para el operador sobre una extracción (lista de textos).
+
+    Lanza ValueError si no tiene la estructura esperada (cliente y productos).
+    """
+    if (
+        not isinstance(data, dict)
+        or not isinstance(data.get("cliente"), dict)
+        or not isinstance(data.get("productos"), list)
+    ):
+        raise ValueError("La extracción no tiene cliente y productos")
+
+    observaciones = []
+    cliente, productos = data["cliente"], data["productos"]
+    if not productos:
+        observaciones.append("Sin productos")
+    try:
+        suma = sum(float(p.get("precio_total") or 0) for p in productos)
+        total = float(data.get("total") or 0)
+        if productos and abs(suma - total) > 0.05:
+            observaciones.append(
+                f"El total {total:.2f} no coincide con la suma de productos {suma:.2f}"
+            )
+    except (TypeError, ValueError, AttributeError):
+        observaciones.append("Importes no numéricos")
+    dni = str(cliente.get("dni") or "")
+    if dni and not re.fullmatch(r"\d{8}", dni):
+        observaciones.append(f"DNI inválido: {dni}")
+    ruc = str(cliente.get("ruc") or "")
+    if ruc and not re.fullmatch(r"\d{11}", ruc):
+        observaciones.append(f"RUC inválido: {ruc}")
+    return observaciones
+
+
+class LimiteSolicitudes:
+    """Espaciado mínimo entre solicitudes (por_minuto por minuto) para
+    tareas de asyncio; 0 = sin límite. Vale entre varios asyncio.run()."""
+
+    def __init__(self, por_minuto, reloj=time.monotonic):
+        self.intervalo = 60.0 / por_minuto if por_minuto > 0 else 0.0
+        self._reloj = reloj
+        self._siguiente = 0.0
+        self._lock = None
+        self._loop = None
+
+    async def esperar(self):
+        if not self.intervalo:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:  # el Lock no se puede usar en otro loop
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            espera = self._siguiente - self._reloj()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            self._siguiente = max(self._reloj(), self._siguiente) + self.intervalo
+
+
+class IngestionPipeline:
+    """Encola archivos en ingestion_queue y procesa los pendientes.
+
+    extraer(ruta) -> dict (o texto JSON) o None (por defecto extraer_archivo,
+    que usa Gemini); corre en un pool de hilos, hasta `concurrencia` a la vez. La
+    base de datos solo se toca desde el hilo que llama a procesar_pendientes.
+    """
+
+    def __init__(
+        self,
+        db,
+        controller=None,
+        extraer=extraer_archivo,
+        concurrencia=None,
+        por_minuto=None,
+    ):
+        if concurrencia is None:
+            concurrencia = int(os.getenv("INGESTA_CONCURRENCIA", "4"))
+        if por_minuto is None:
+            por_minuto = float(os.getenv("GEMINI_RPM", "15"))
+        self.db = db
+        self.controller = controller
+        self.extraer = extraer
+        self.concurrencia = max(1, concurrencia)
+        self.limite = LimiteSolicitudes(por_minuto)
+        self._detenido = threading.Event()
+
+    def detener(self):
+        """No empezar más archivos (p. ej. al cerrar la app). Los que están en
+        curso terminan; los tomados y no empezados siguen en processing y
+        vuelven a pending al reiniciar (reset_processing_ingestions)."""
+        self._detenido.set()
+
+    def encolar_archivos(self, rutas, id_sender=None):
+        """Ids de los archivos encolados (los repetidos se omiten)."""
+        encolados = []
+        for ruta in rutas:
+            try:
+                huella = sha256_archivo(ruta)
+            except OSError as e:
+                logging.warning(f"No se pudo leer {ruta}: {e}")
+                continue
+            id_ingesta = self.db.enqueue_ingestion(
+                os.path.abspath(ruta), huella, id_sender
+            )
+            if id_ingesta is not None:
+                encolados.append(id_ingesta)
+        return encolados
+
+    def encolar_carpeta(self, carpeta, id_sender=None):
+        return self.encolar_archivos(archivos_de_carpeta(carpeta), id_sender)
+
+    def procesar_pendientes(self, progreso=None):
+        """Procesa todo lo pendiente y retorna {"total", "listos", "errores",
+        "segundos"}. progreso(estado) se llama al terminar cada archivo."""
+        filas = []
+        if not self._detenido.is_set():
+            filas = self.db.claim_pending_ingestions(limit=1000)
+        estado = {"total": len(filas), "terminados": 0, "listos": 0, "errores": 0}
+        inicio = time.perf_counter()
+        if filas:
+            asyncio.run(self._procesar(filas, estado, progreso))
+        return {
+            "total": estado["total"],
+            "listos": estado["listos"],
+            "errores": estado["errores"],
+            "segundos": time.perf_counter() - inicio,
+        }
+
+    # -- internos --
+    async def _procesar(self, filas, estado, progreso):
+        semaforo = asyncio.Semaphore(self.concurrencia)
+        with ThreadPoolExecutor(
+            max_workers=self.concurrencia, thread_name_prefix="ingesta"
+        ) as executor:
+            await asyncio.gather(
+                *(
+                    self._procesar_archivo(
+                        fila, semaforo, executor, estado, progreso
+                    )
+                    for fila in filas
+                )
+            )
+
+    async def _procesar_archivo(self, fila, semaforo, executor, estado, progreso):
+        id_ingesta, ruta, id_sender = fila
+        nombre = os.path.basename(ruta)
+        async with semaforo:
+            if self._detenido.is_set():
+                return
+            await self.limite.esperar()
+            inicio = desde = time.perf_counter()
+            tiempos = {}  # segundos de cada etapa
+
+            def marcar(etapa):
+                nonlocal desde
+                ahora = time.perf_counter()
+                tiempos[etapa] = ahora - desde
+                desde = ahora
+
+            try:
+                data = await asyncio.get_running_loop().run_in_executor(
+                    executor, self.extraer, ruta
+                )
+                marcar("extraccion")
+                if not data:
+                    raise ValueError("No se obtuvo respuesta del modelo")
+                if isinstance(data, str):
+                    data = json.loads(data)
+                observaciones = validar_extraccion(data)
+                marcar("validacion")
+                coincidencias = self._emparejar(id_sender, data["productos"])
+                sin_catalogo = sum(1 for c in coincidencias if c is None)
+                if id_sender is not None and sin_catalogo:
+                    observaciones.append(
+                        f"{sin_catalogo} producto(s) sin coincidencia en el catálogo"
+                    )
+                marcar("emparejamiento")
+            except Exception as e:
+                segundos = time.perf_counter() - inicio
+                logging.warning(f"Ingesta de {nombre} fallida: {e}")
+                self.db.fail_ingestion(id_ingesta, str(e), segundos)
+                estado["errores"] += 1
+            else:
+                segundos = time.perf_counter() - inicio
+                self.db.complete_ingestion(
+                    id_ingesta,
+                    json.dumps(data, ensure_ascii=False),
+                    json.dumps(coincidencias, ensure_ascii=False),
+                    json.dumps(observaciones, ensure_ascii=False),
+                    segundos,
+                )
+                estado["listos"] += 1
+                logging.info(
+                    f"Ingesta de {nombre}: "
+                    + ", ".join(f"{paso} {s:.2f} s" for paso, s in tiempos.items())
+                )
+        estado["terminados"] += 1
+        if progreso is not None:
+            progreso(dict(estado, archivo=nombre))
+
+    def _emparejar(self, id_sender, productos):
+        """Producto del catálogo de cada línea (dict con id, nombre, precio,
+        score, ...) o None."""
+        if self.controller is None or id_sender is None:
+            return [None] * len(productos)
+        descripciones = [str(p.get("descripcion") or "") for p in productos]
+        filas = self.controller.emparejar_productos(id_sender, descripciones)
+        claves = ("id", "id_sender", "nombre", "unidad", "precio", "igv", "score")
+        return [None if f is None else dict(zip(claves, f)) for f in filas]
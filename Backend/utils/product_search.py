@@ -0,0 +1,289 @@
+"""Índices de búsqueda difusa del catálogo de productos y de clientes"""
+
+import logging
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from rapidfuzz import process, fuzz
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios simples ("Azúcar  RUBIA" -> "azucar rubia")."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+def trigramas(texto):
+    """Trigramas de un texto normalizado, con relleno para marcar inicio/fin."""
+    texto = f"  {texto} "
+    return {texto[i : i + 3] for i in range(len(texto) - 2)}
+
+
+class TrigramIndex:
+    """Índice invertido trigrama -> claves, para preseleccionar candidatos.
+
+    Con catálogos grandes no se puntúa cada nombre con WRatio: primero se
+    toman las claves que comparten más trigramas con la query y solo esas
+    se puntúan.
+    """
+
+    def __init__(self):
+        self.postings = {}  # trigrama -> set(claves)
+        self._trigramas = {}  # clave -> set(trigramas)
+
+    def __len__(self):
+        return len(self._trigramas)
+
+    def agregar(self, clave, texto):
+        self.eliminar(clave)
+        grams = trigramas(texto)
+        self._trigramas[clave] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(clave)
+
+    def eliminar(self, clave):
+        for gram in self._trigramas.pop(clave, ()):
+            claves = self.postings.get(gram)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self.postings[gram]
+
+    def candidatos(self, texto, limite=300, presupuesto=5000):
+        """Las `limite` claves con más trigramas en común con el texto.
+
+        Se cuentan primero los trigramas más raros (los que más discriminan)
+        y se dejan de contar los frecuentes cuando se supera el presupuesto
+        de entradas, para que el costo no crezca con el catálogo.
+        """
+        listas = sorted(
+            (self.postings[g] for g in trigramas(texto) if g in self.postings),
+            key=len,
+        )
+        conteo = Counter()
+        contadas = 0
+        for i, claves in enumerate(listas):
+            if i >= 4 and contadas + len(claves) > presupuesto:
+                break
+            conteo.update(claves)
+            contadas += len(claves)
+        return [clave for clave, _ in conteo.most_common(limite)]
+
+
+class NameSearchIndex:
+    """Filas de una tabla preparadas una sola vez para búsquedas difusas por nombre.
+
+    Guarda las primeras ANCHO columnas de cada fila y el nombre ya
+    normalizado, para no recalcular nada en cada tecla. Se actualiza de forma
+    incremental con agregar/actualizar/eliminar. Con más de UMBRAL_PREFILTRO
+    filas, un índice de trigramas reduce los candidatos antes de puntuar.
+    """
+
+    ANCHO = None  # columnas de la fila que se devuelven
+    COLUMNA_NOMBRE = 2
+    UMBRAL_PREFILTRO = 2000
+    MAX_CANDIDATOS = 300
+
+    def __init__(self, filas=()):
+        self.filas = []
+        self.normalizados = []
+        self._posiciones = {}  # id -> posición en los arreglos
+        self._trigramas = TrigramIndex()
+        self._lock = threading.Lock()  # el hilo de emisión también lo actualiza
+        for fila in filas:
+            self.agregar(fila)
+
+    def __len__(self):
+        return len(self.filas)
+
+    def __contains__(self, id_fila):
+        return id_fila in self._posiciones
+
+    def fila(self, posicion):
+        return self.filas[posicion]
+
+    def agregar(self, fila):
+        """Agrega una fila (o la actualiza si su id ya está en el índice)."""
+        fila = tuple(fila[: self.ANCHO])
+        normalizado = normalizar(fila[self.COLUMNA_NOMBRE])
+        with self._lock:
+            posicion = self._posiciones.get(fila[0])
+            if posicion is None:
+                self._posiciones[fila[0]] = len(self.filas)
+                self.filas.append(fila)
+                self.normalizados.append(normalizado)
+            else:
+                self.filas[posicion] = fila
+                self.normalizados[posicion] = normalizado
+            self._trigramas.agregar(fila[0], normalizado)
+
+    actualizar = agregar
+
+    def eliminar(self, id_fila):
+        """Quita una fila en O(1): la última ocupa su lugar."""
+        with self._lock:
+            posicion = self._posiciones.pop(id_fila, None)
+            if posicion is None:
+                return False
+            self._trigramas.eliminar(id_fila)
+            ultima = len(self.filas) - 1
+            for arreglo in (self.filas, self.normalizados):
+                arreglo[posicion] = arreglo[ultima]
+                arreglo.pop()
+            if posicion != ultima:
+                self._posiciones[self.filas[posicion][0]] = posicion
+            return True
+
+    def _posiciones_candidatas(self, query):
+        """Posiciones a puntuar: todas, o las preseleccionadas por trigramas."""
+        if len(self.filas) <= self.UMBRAL_PREFILTRO:
+            return None
+        claves = self._trigramas.candidatos(query, self.MAX_CANDIDATOS)
+        return [self._posiciones[clave] for clave in claves]
+
+    def search(self, query, limit=5, score_cutoff=60):
+        """Las `limit` filas más parecidas a la query, con su score al final,
+        ordenadas de mayor a menor score."""
+        query = normalizar(query)
+        if not query:
+            return []
+        with self._lock:
+            posiciones = self._posiciones_candidatas(query)
+            nombres = (
+                self.normalizados
+                if posiciones is None
+                else {pos: self.normalizados[pos] for pos in posiciones}
+            )
+            resultados = process.extract(
+                query,
+                nombres,
+                scorer=fuzz.WRatio,
+                processor=None,  # los nombres ya están normalizados
+                limit=limit,
+                score_cutoff=score_cutoff,
+            )
+            return [(*self.fila(pos), score) for _, score, pos in resultados]
+
+    def match_batch(self, queries, score_cutoff=85, workers=-1):
+        """Mejor fila para cada query, en una sola llamada.
+
+        Calcula la matriz completa de scores (queries x candidatos) con
+        rapidfuzz.process.cdist usando todos los núcleos (workers=-1). En
+        catálogos grandes los candidatos son la unión de los preseleccionados
+        por trigramas para cada query. Retorna una lista alineada con queries:
+        la fila con su score al final, o None si ninguna alcanza score_cutoff.
+        """
+        normalizadas = [normalizar(query) for query in queries]
+        coincidencias = [None] * len(normalizadas)
+        with self._lock:
+            if not normalizadas or not self.filas:
+                return coincidencias
+            if len(self.filas) <= self.UMBRAL_PREFILTRO:
+                posiciones = range(len(self.filas))
+            else:
+                union = set()
+                for query in normalizadas:
+                    if query:
+                        union.update(self._posiciones_candidatas(query))
+                posiciones = sorted(union)
+            if not posiciones:
+                return coincidencias
+            matriz = process.cdist(
+                normalizadas,
+                [self.normalizados[pos] for pos in posiciones],
+                scorer=fuzz.WRatio,
+                processor=None,
+                score_cutoff=score_cutoff,
+                dtype=np.uint8,
+                workers=workers,
+            )
+            mejores = matriz.argmax(axis=1)
+            for i, columna in enumerate(mejores):
+                score = int(matriz[i, columna])
+                if normalizadas[i] and score >= score_cutoff:
+                    coincidencias[i] = (*self.fila(posiciones[columna]), score)
+        return coincidencias
+
+
+class ProductSearchIndex(NameSearchIndex):
+    """Catálogo de productos de un remitente.
+
+    Filas de la tabla products: (id, id_sender, name, unit, price, igv).
+    """
+
+    ANCHO = 6
+
+
+class ClientSearchIndex(NameSearchIndex):
+    """Clientes para el autocompletado del nombre en ClienteView.
+
+    Filas de la tabla clients: (id, id_sender, name, dni, ruc).
+    """
+
+    ANCHO = 5
+
+
+if __name__ == "__main__":
+    # Benchmark: ProductSearchIndex.search vs BoletaController.match_fuzzy
+    import random
+    import time
+
+    from Backend.BoletaController import BoletaController
+
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(7)
+    palabras = [
+        "arroz", "azúcar", "aceite", "harina", "frejol", "lenteja", "avena",
+        "maíz", "cancha", "pardina", "galleta", "fideo", "atún", "leche",
+    ]
+    unidades = ["KILOGRAMO", "CAJA", "UNIDAD", "BOLSA"]
+    queries = ["arros superor", "azucar rubia", "aceite vejetal", "lentja", "fideo"]
+
+    for tamano in (1_000, 10_000, 100_000):
+        catalogo = [
+            (
+                i,
+                1,
+                " ".join(random.choice(palabras) for _ in range(3)).upper() + f" {i}",
+                random.choice(unidades),
+                round(random.uniform(1, 100), 2),
+                random.randint(0, 1),
+            )
+            for i in range(tamano)
+        ]
+        controller = BoletaController(db=None)
+
+        inicio = time.perf_counter()
+        indice = ProductSearchIndex(catalogo)
+        construccion = time.perf_counter() - inicio
+
+        def medir(buscar, repeticiones=5):
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                for query in queries:
+                    buscar(query)
+            return (time.perf_counter() - inicio) / (repeticiones * len(queries))
+
+        t_actual = medir(lambda q: controller.match_fuzzy(catalogo, q))
+        t_indice = medir(lambda q: indice.search(q, 5))
+        print(
+            f"{tamano:>7} productos | match_fuzzy {t_actual * 1000:8.2f} ms | "
+            f"indice {t_indice * 1000:8.2f} ms | construccion {construccion * 1000:.0f} ms"
+        )
+
+        # Emparejamiento de una boleta de 60 líneas (salida de Gemini)
+        lineas = [random.choice(catalogo)[2].lower()[:-2] for _ in range(60)]
+        inicio = time.perf_counter()
+        for linea in lineas:
+            indice.search(linea, 1)
+        t_por_linea = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        indice.match_batch(lineas)
+        t_lote = time.perf_counter() - inicio
+        print(
+            f"{'':>7} 60 lineas    | una a una {t_por_linea * 1000:8.2f} ms | "
+            f"cdist {t_lote * 1000:8.2f} ms"
+        )
@@ -2,28 +2,139 @@
 
 import os
 import sqlite3
+import threading
+import uuid
+import weakref
+from contextlib import contextmanager
 
 from rapidfuzz import process, fuzz  # asegúrate de tener rapidfuzz instalado
 
+from DataBase.migrations import apply_migrations
+
+
+class _ConexionHilo:
+    """Conexión propia de un hilo; se cierra sola cuando el hilo termina."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()  # cursor heredado (DatabaseManager.cursor)
+        self.tx_depth = 0  # profundidad de transaction() activa en este hilo
+
+    def close(self):
+        try:
+            self.conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+
+    def __del__(self):
+        self.close()
+
 
 class DatabaseManager:
     # Encapsulamiento de la base de datos
-    def __init__(self, db_path=None):
+    # Cada hilo (UI, TaskWorker, workers de fondo) usa su propia conexión, en
+    # modo WAL: los lectores no se bloquean detrás del hilo que emite.
+    def __init__(self, db_path=None, timeout=30.0):
         if db_path is None:
+            # BILLING_DB_PATH: otra base, p. ej. una temporal para los benchmarks
             base_dir = os.path.dirname(os.path.abspath(__file__))
-            db_path = os.path.join(base_dir, "billing_system.db")
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+            db_path = os.getenv("BILLING_DB_PATH") or os.path.join(
+                base_dir, "billing_system.db"
+            )
+
+        self._uri = False
+        self._en_memoria = db_path == ":memory:"
+        if self._en_memoria:
+            # ":memory:" sería una base distinta por conexión; se usa una base
+            # en memoria compartida para que todos los hilos vean los mismos datos
+            db_path = f"file:memdb_{uuid.uuid4().hex}?mode=memory&cache=shared"
+            self._uri = True
+
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexiones = weakref.WeakSet()
+        self._principal = self._conexion_hilo()  # mantiene viva la base en memoria
+
+    def _conectar(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            uri=self._uri,
+            check_same_thread=False,  # solo para poder cerrarla desde close()
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        if not self._en_memoria:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _conexion_hilo(self):
+        actual = getattr(self._local, "conexion", None)
+        if actual is None:
+            actual = _ConexionHilo(self._conectar())
+            self._local.conexion = actual
+            with self._lock:
+                self._conexiones.add(actual)
+        return actual
+
+    @property
+    def conn(self):
+        """Conexión del hilo actual (se crea en el primer uso)."""
+        return self._conexion_hilo().conn
+
+    @property
+    def cursor(self):
+        """Cursor compartido del hilo actual; los métodos usan cursores propios."""
+        return self._conexion_hilo().cursor
 
     def close(self):
-        self.conn.close()
+        with self._lock:
+            conexiones = list(self._conexiones)
+            self._conexiones.clear()
+        for conexion in conexiones:
+            conexion.close()
+        self._local = threading.local()
 
     def commit(self):
         self.conn.commit()
 
+    def _commit(self):
+        """Commit de un método individual; dentro de transaction() se difiere."""
+        if not self._conexion_hilo().tx_depth:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Unidad de trabajo: agrupa varias escrituras en un único commit.
+
+        Dentro del bloque los métodos de inserción/actualización/borrado no
+        hacen commit propio. Si el bloque lanza una excepción se hace rollback
+        de todo. Los bloques anidados se unen a la transacción externa. La
+        transacción es del hilo actual (cada hilo tiene su conexión).
+        """
+        conexion = self._conexion_hilo()
+        externa = conexion.tx_depth == 0
+        if externa:
+            conexion.conn.execute("BEGIN IMMEDIATE")
+        conexion.tx_depth += 1
+        try:
+            yield self
+        except Exception:
+            if externa:
+                conexion.conn.rollback()
+            raise
+        else:
+            if externa:
+                conexion.conn.commit()
+        finally:
+            conexion.tx_depth -= 1
+
     def create_tables(self):
         """Crea todas las tablas necesarias en la base de datos."""
-        self.cursor.executescript(
+        cursor = self.conn.cursor()
+        cursor.executescript(
             """
         -- Tabla de Remitentes
         CREATE TABLE IF NOT EXISTS sender (
@@ -86,7 +197,12 @@ class DatabaseManager:
         );
         """
         )
-        self.conn.commit()
+        self._commit()
+        self.migrate()
+
+    def migrate(self):
+        """Aplica las migraciones pendientes del esquema (ver DataBase/migrations.py)."""
+        return apply_migrations(self.conn)
 
     # ===============================
     # Métodos de inserción
@@ -94,106 +210,131 @@ class DatabaseManager:
 
     def insert_sender(self, name, ruc, user, password):
         """Inserta un nuevo remitente."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             INSERT INTO sender (name, ruc, user, password)
             VALUES (?, ?, ?, ?)
         """,
             (name, ruc, user, password),
         )
-        self.conn.commit()
+        self._commit()
 
     def insert_client(self, id_sender, name, dni, ruc):
         """Inserta un nuevo cliente o devuelve ID si ya existe."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             SELECT id FROM clients WHERE name = ? OR dni = ? OR ruc = ?
             """,
             (name, dni, ruc),
         )
-        existing_client = self.cursor.fetchone()
+        existing_client = cursor.fetchone()
         if existing_client:
             return existing_client[0]
 
-        self.cursor.execute(
+        cursor.execute(
             """
             INSERT INTO clients (id_sender, name, dni, ruc)
             VALUES (?, ?, ?, ?)
             """,
             (id_sender, name, dni, ruc),
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self._commit()
+        return cursor.lastrowid
 
     def insert_product(self, id_sender, name, unit, price, igv):
         """Inserta un producto para un remitente."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             SELECT id FROM products
             WHERE id_sender = ? AND name = ? AND unit = ? AND price = ? AND igv = ?
         """,
             (id_sender, name, unit, price, igv),
         )
-        existing_product = self.cursor.fetchone()
+        existing_product = cursor.fetchone()
         if existing_product:
             return existing_product[0]
-        self.cursor.execute(
+        cursor.execute(
             """
             INSERT INTO products (id_sender, name, unit, price, igv)
             VALUES (?, ?, ?, ?, ?)
         """,
             (id_sender, name, unit, price, igv),
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self._commit()
+        return cursor.lastrowid
 
     def insert_invoice(
         self, id_client, id_sender, total, igv, tipo, serie, numero, emision_fecha
     ):
         """Inserta una nueva boleta."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             INSERT INTO invoices (id_client, id_sender, total, igv, tipo, serie, numero, emision_fecha)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (id_client, id_sender, total, igv, tipo, serie, numero, emision_fecha),
         )
-        self.conn.commit()
-        return self.cursor.lastrowid
+        self._commit()
+        return cursor.lastrowid
 
     def insert_invoice_detail(self, invoice_id, product_id, quantity, subtotal):
         """Inserta un detalle de boleta."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             INSERT INTO invoice_details (invoice_id, product_id, quantity, subtotal)
             VALUES (?, ?, ?, ?)
         """,
             (invoice_id, product_id, quantity, subtotal),
         )
-        self.conn.commit()
+        self._commit()
+
+    def insert_invoice_details(self, invoice_id, details):
+        """Inserta todos los detalles de una boleta con un solo executemany.
+
+        details: iterable de tuplas (product_id, quantity, subtotal).
+        """
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO invoice_details (invoice_id, product_id, quantity, subtotal)
+            VALUES (?, ?, ?, ?)
+        """,
+            [(invoice_id, *detail) for detail in details],
+        )
+        self._commit()
 
     # ===============================
     # Métodos de consulta
     # ===============================
 
     def get_senders(self):
-        self.cursor.execute("SELECT * FROM sender")
-        return self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM sender")
+        return cursor.fetchall()
 
     def get_clients(self):
-        self.cursor.execute("SELECT * FROM clients")
-        return self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM clients")
+        return cursor.fetchall()
 
     def get_products_by_sender(self, id_sender=None):
-        self.cursor.execute("SELECT * FROM products where id_sender = ?", (id_sender,))
-        return self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM products where id_sender = ?", (id_sender,))
+        return cursor.fetchall()
 
     def get_products(self):
-        self.cursor.execute("SELECT * FROM products")
-        return self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM products")
+        return cursor.fetchall()
 
     def get_invoices_by_sender_id(self, id_sender):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             SELECT inv.id, cl.name, se.name, inv.total,inv.tipo, inv.igv, inv.emision_fecha
             FROM invoices inv
@@ -203,25 +344,166 @@ class DatabaseManager:
             """,
             (id_sender,),
         )
-        return self.cursor.fetchall()
+        return cursor.fetchall()
+
+    def get_invoices_page(
+        self,
+        id_sender,
+        limit=100,
+        after=None,
+        client=None,
+        tipo=None,
+        date_from=None,
+        date_to=None,
+    ):
+        """Página del historial, de la boleta más reciente a la más antigua.
+
+        Paginación por clave (keyset): after es la clave (emision_iso, id) de
+        la última fila de la página anterior, así cada página cuesta lo mismo
+        sin importar cuántas boletas haya. date_from/date_to en yyyy-mm-dd.
+        Retorna las columnas de get_invoices_by_sender_id + emision_iso.
+        """
+        condiciones = ["inv.id_sender = ?"]
+        parametros = [id_sender]
+        if after is not None:
+            condiciones.append("(inv.emision_iso, inv.id) < (?, ?)")
+            parametros.extend(after)
+        if client:
+            condiciones.append("cl.name LIKE ?")
+            parametros.append(f"%{client}%")
+        if tipo:
+            condiciones.append("inv.tipo = ?")
+            parametros.append(tipo)
+        if date_from:
+            condiciones.append("inv.emision_iso >= ?")
+            parametros.append(date_from)
+        if date_to:
+            condiciones.append("inv.emision_iso <= ?")
+            parametros.append(date_to)
+        parametros.append(limit)
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT inv.id, cl.name, se.name, inv.total, inv.tipo, inv.igv,
+                   inv.emision_fecha, inv.emision_iso
+            FROM invoices inv
+            JOIN clients cl ON inv.id_client = cl.id
+            JOIN sender se ON inv.id_sender = se.id
+            WHERE {" AND ".join(condiciones)}
+            ORDER BY inv.emision_iso DESC, inv.id DESC
+            LIMIT ?
+            """,
+            parametros,
+        )
+        return cursor.fetchall()
+
+    def get_sales_summary(self, id_sender, date_from=None, date_to=None):
+        """Totales de ventas desde sales_daily_agg: (boletas, total, igv, máximo)."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT COALESCE(SUM(count), 0), COALESCE(SUM(total), 0),
+                   COALESCE(SUM(igv), 0), COALESCE(MAX(max_total), 0)
+            FROM sales_daily_agg
+            WHERE id_sender = ? AND day >= ? AND day <= ?
+            """,
+            (id_sender, date_from or "0000-00-00", date_to or "9999-99-99"),
+        )
+        return cursor.fetchone()
+
+    def get_top_clients(self, id_sender, limit=10, date_from=None, date_to=None):
+        """Clientes con más boletas en el rango: [(nombre, boletas, total), ...]."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT cl.name, SUM(agg.count) AS boletas, SUM(agg.total) AS total
+            FROM sales_daily_agg agg
+            JOIN clients cl ON cl.id = agg.id_client
+            WHERE agg.id_sender = ? AND agg.day >= ? AND agg.day <= ?
+            GROUP BY agg.id_client
+            ORDER BY boletas DESC, total DESC
+            LIMIT ?
+            """,
+            (id_sender, date_from or "0000-00-00", date_to or "9999-99-99", limit),
+        )
+        return cursor.fetchall()
 
     def get_sender_by_id(self, id_sender):
-        self.cursor.execute("SELECT * FROM sender WHERE id = ?", (id_sender,))
-        return self.cursor.fetchone()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM sender WHERE id = ?", (id_sender,))
+        return cursor.fetchone()
 
-    def get_next_invoice_number(self, id_sender):
-        self.cursor.execute(
+    @staticmethod
+    def series_prefix(id_sender, tipo="BOLETA"):
+        """Prefijo de serie del remitente: B01 para boletas, F01 para facturas."""
+        prefijo = "F" if str(tipo).upper() == "FACTURA" else "B"
+        return f"{prefijo}{int(id_sender):02d}"
+
+    def get_next_invoice_number(self, id_sender, tipo="BOLETA", serie=None):
+        """Próximo número de la serie sin reservarlo (solo para mostrarlo en la UI)."""
+        tipo = str(tipo).upper()
+        serie = serie or self.series_prefix(id_sender, tipo)
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
-            SELECT COUNT(*) FROM invoices WHERE id_sender = ?
+            SELECT last_number FROM series_counters
+            WHERE id_sender = ? AND tipo = ? AND serie = ?
             """,
-            (id_sender,),
+            (id_sender, tipo, serie),
         )
-        count = self.cursor.fetchone()[0]
-        return count + 1
+        row = cursor.fetchone()
+        return (row[0] if row else 0) + 1
+
+    def reserve_invoice_number(self, id_sender, tipo="BOLETA", serie=None):
+        """Reserva atómicamente el siguiente número de la serie y lo retorna.
+
+        Usado dentro de la misma transacción que inserta la boleta: si ésta
+        falla el número vuelve a quedar libre, así que no quedan huecos.
+        """
+        tipo = str(tipo).upper()
+        serie = serie or self.series_prefix(id_sender, tipo)
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO series_counters (id_sender, tipo, serie, last_number)
+                VALUES (?, ?, ?, 0)
+                ON CONFLICT (id_sender, tipo, serie) DO NOTHING
+                """,
+                (id_sender, tipo, serie),
+            )
+            cursor.execute(
+                """
+                UPDATE series_counters
+                SET last_number = last_number + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id_sender = ? AND tipo = ? AND serie = ?
+                RETURNING last_number
+                """,
+                (id_sender, tipo, serie),
+            )
+            return cursor.fetchone()[0]
+
+    def get_series_gaps(self, id_sender, tipo="BOLETA", serie=None):
+        """Números reservados de la serie que no tienen boleta guardada (auditoría)."""
+        tipo = str(tipo).upper()
+        serie = serie or self.series_prefix(id_sender, tipo)
+        ultimo = self.get_next_invoice_number(id_sender, tipo, serie) - 1
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT CAST(numero AS INTEGER) FROM invoices
+            WHERE id_sender = ? AND tipo = ? AND serie LIKE ?
+            """,
+            (id_sender, tipo, f"{serie}-%"),
+        )
+        usados = {row[0] for row in cursor.fetchall()}
+        return [n for n in range(1, ultimo + 1) if n not in usados]
 
     def get_invoice_details(self, invoice_id):
         """Obtiene los detalles de una boleta específica con información de productos y boleta."""
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             SELECT 
                 invd.quantity,
@@ -240,49 +522,472 @@ class DatabaseManager:
             """,
             (invoice_id,),
         )
-        return self.cursor.fetchall()
+        return cursor.fetchall()
 
     def get_senders_and_id(self):
         """Obtiene todos los remitentes (id y nombre)."""
-        self.cursor.execute("SELECT id, name FROM sender")
-        senders = self.cursor.fetchall()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, name FROM sender")
+        senders = cursor.fetchall()
         return senders
 
+    # ===============================
+    # Cola de emisión a SUNAT (outbox)
+    # ===============================
+    def enqueue_emission(self, invoice_id, id_sender, payload):
+        """Encola una boleta para enviarla a SUNAT. payload: JSON de la boleta.
+
+        Se llama dentro de la transacción que guarda la boleta, así ambas
+        quedan registradas o ninguna.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO emission_outbox (invoice_id, id_sender, payload)
+            VALUES (?, ?, ?)
+            """,
+            (invoice_id, id_sender, payload),
+        )
+        self._commit()
+        return cursor.lastrowid
+
+    def claim_next_emission(self, id_sender=None):
+        """Toma la emisión pendiente más antigua cuyo reintento ya venció
+        (de cualquier remitente, o solo de id_sender).
+
+        La marca in_progress y suma un intento en la misma sentencia, así dos
+        workers no toman la misma. Retorna (id, invoice_id, id_sender,
+        payload, attempts) o None si no hay nada que enviar.
+        """
+        filtro, params = "", ()
+        if id_sender is not None:
+            filtro, params = "AND id_sender = ?", (id_sender,)
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"""
+                UPDATE emission_outbox
+                SET status = 'in_progress', attempts = attempts + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM emission_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                    {filtro}
+                    ORDER BY next_attempt_at, id
+                    LIMIT 1
+                )
+                RETURNING id, invoice_id, id_sender, payload, attempts
+                """,
+                params,
+            )
+            return cursor.fetchone()
+
+    def mark_emission_sent(self, outbox_id, sunat_number):
+        """Emisión confirmada por SUNAT con el número que asignó."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE emission_outbox
+            SET status = 'sent', sunat_number = ?, last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (sunat_number, outbox_id),
+        )
+        self._commit()
+
+    def mark_emission_unconfirmed(self, outbox_id, error):
+        """Se pulsó emitir pero SUNAT no confirmó: queda unconfirmed (sin
+        reintentos) hasta que el operador la verifique en el portal y use
+        confirm_emission o retry_emission."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE emission_outbox
+            SET status = 'unconfirmed', last_error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (str(error), outbox_id),
+        )
+        self._commit()
+
+    def confirm_emission(self, outbox_id, sunat_number):
+        """El operador encontró en SUNAT la emisión sin confirmar: pasa a sent."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE emission_outbox
+            SET status = 'sent', sunat_number = ?, last_error = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'unconfirmed'
+            """,
+            (sunat_number, outbox_id),
+        )
+        self._commit()
+        return cursor.rowcount > 0
+
+    def mark_emission_failed(self, outbox_id, error, retry_in=None):
+        """Registra un intento fallido.
+
+        Con retry_in (segundos) vuelve a pending para reintentar después; sin
+        él queda failed hasta que se reencole a mano con retry_emission.
+        """
+        cursor = self.conn.cursor()
+        if retry_in is None:
+            cursor.execute(
+                """
+                UPDATE emission_outbox
+                SET status = 'failed', last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (str(error), outbox_id),
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE emission_outbox
+                SET status = 'pending', last_error = ?,
+                    next_attempt_at = datetime('now', ?),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (str(error), f"+{int(retry_in)} seconds", outbox_id),
+            )
+        self._commit()
+
+    def retry_emission(self, outbox_id):
+        """Reencola ya una emisión fallida, o una sin confirmar que el operador
+        no encontró en SUNAT (los intentos vuelven a cero)."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE emission_outbox
+            SET status = 'pending', attempts = 0,
+                next_attempt_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('failed', 'unconfirmed')
+            """,
+            (outbox_id,),
+        )
+        self._commit()
+        return cursor.rowcount > 0
+
+    def reset_in_progress_emissions(self):
+        """Al iniciar la app: lo que quedó in_progress (cierre o caída a mitad
+        del envío) pudo llegar a emitirse, así que pasa a unconfirmed para
+        que el operador lo verifique; reencolarlo podría duplicarlo. Retorna
+        cuántas emisiones quedaron por verificar."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE emission_outbox
+            SET status = 'unconfirmed',
+                last_error = 'La app se cerró durante el envío a SUNAT',
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'in_progress'
+            """
+        )
+        self._commit()
+        return cursor.rowcount
+
+    def get_emission_outbox(self, status=None):
+        """Emisiones de la cola (todas o de un status), la más reciente primero:
+        (id, invoice_id, id_sender, status, attempts, last_error, updated_at,
+        sunat_number)."""
+        cursor = self.conn.cursor()
+        sql = """
+            SELECT id, invoice_id, id_sender, status, attempts, last_error, updated_at,
+                   sunat_number
+            FROM emission_outbox
+        """
+        params = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            params = (status,)
+        cursor.execute(sql + " ORDER BY id DESC", params)
+        return cursor.fetchall()
+
+    # ===============================
+    # Tiempos del scraper SUNAT
+    # ===============================
+    def insert_scraper_spans(self, spans):
+        """Guarda los pasos medidos de un documento. spans: tuplas
+        (trace_id, id_sender, serie, tipo, paso, inicio, duracion, ok)."""
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO scraper_spans
+                (trace_id, id_sender, serie, tipo, paso, inicio, duracion, ok)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            spans,
+        )
+        self._commit()
+
+    def get_scraper_spans(self, last_traces=200):
+        """(paso, duracion, ok) de los pasos de los últimos `last_traces`
+        documentos emitidos."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT paso, duracion, ok FROM scraper_spans
+            WHERE trace_id IN (
+                SELECT trace_id FROM scraper_spans
+                GROUP BY trace_id
+                ORDER BY MAX(id) DESC
+                LIMIT ?
+            )
+            ORDER BY id
+            """,
+            (last_traces,),
+        )
+        return cursor.fetchall()
+
+    def delete_old_scraper_spans(self, keep_traces=5000):
+        """Borra los pasos de los documentos más antiguos, dejando los
+        últimos `keep_traces`. Retorna cuántas filas borró."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM scraper_spans
+            WHERE id < (
+                SELECT COALESCE(MIN(primero), 0) FROM (
+                    SELECT MIN(id) AS primero FROM scraper_spans
+                    GROUP BY trace_id
+                    ORDER BY primero DESC
+                    LIMIT ?
+                )
+            )
+            """,
+            (keep_traces,),
+        )
+        self._commit()
+        return cursor.rowcount
+
+    # ===============================
+    # Caché de extracciones (Gemini)
+    # ===============================
+    def get_cached_extraction(self, key):
+        """Resultado guardado para key (o None). Cuenta el acierto y lo marca
+        como el más reciente para el desalojo LRU."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE extraction_cache
+            SET hits = hits + 1,
+                last_used = (SELECT MAX(last_used) + 1 FROM extraction_cache)
+            WHERE key = ?
+            RETURNING result
+            """,
+            (key,),
+        )
+        fila = cursor.fetchone()
+        self._commit()
+        return fila[0] if fila else None
+
+    def put_cached_extraction(self, key, file_sha256, version, result):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO extraction_cache
+                (key, file_sha256, version, result, size, last_used)
+            VALUES (?, ?, ?, ?, ?,
+                    (SELECT COALESCE(MAX(last_used), 0) + 1 FROM extraction_cache))
+            ON CONFLICT (key) DO UPDATE SET
+                result = excluded.result,
+                size = excluded.size,
+                last_used = excluded.last_used
+            """,
+            (key, file_sha256, version, result, len(result.encode("utf-8"))),
+        )
+        self._commit()
+
+    def evict_cached_extractions(self, max_bytes):
+        """Borra las extracciones usadas hace más tiempo hasta que el total
+        de resultados quede en max_bytes. Retorna cuántas borró."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            DELETE FROM extraction_cache
+            WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS acumulado
+                    FROM extraction_cache
+                )
+                WHERE acumulado > ?
+            )
+            """,
+            (max_bytes,),
+        )
+        self._commit()
+        return cursor.rowcount
+
+    def get_extraction_cache_stats(self):
+        """(entradas, bytes, aciertos acumulados) de la caché de extracciones."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0)
+            FROM extraction_cache
+            """
+        )
+        return cursor.fetchone()
+
+    # ===============================
+    # Ingesta por lote (cola de revisión)
+    # ===============================
+    def enqueue_ingestion(self, path, file_sha256, id_sender=None):
+        """Agrega un archivo a la cola de ingesta. Retorna su id, o None si
+        ese mismo contenido ya estaba en la cola."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO ingestion_queue (path, file_sha256, id_sender)
+            VALUES (?, ?, ?)
+            ON CONFLICT (file_sha256) DO NOTHING
+            RETURNING id
+            """,
+            (path, file_sha256, id_sender),
+        )
+        fila = cursor.fetchone()
+        self._commit()
+        return fila[0] if fila else None
+
+    def claim_pending_ingestions(self, limit=100):
+        """Marca processing hasta `limit` archivos pendientes y los retorna:
+        [(id, path, id_sender), ...] en orden de llegada."""
+        with self.transaction():
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                UPDATE ingestion_queue
+                SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM ingestion_queue
+                    WHERE status = 'pending'
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, path, id_sender
+                """,
+                (limit,),
+            )
+            filas = cursor.fetchall()
+        return sorted(filas)
+
+    def complete_ingestion(self, id_ingestion, data, matches, warnings, seconds):
+        """Guarda la extracción (JSON) y la deja lista para revisar."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE ingestion_queue
+            SET status = 'ready', data = ?, matches = ?, warnings = ?,
+                error = NULL, seconds = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (data, matches, warnings, seconds, id_ingestion),
+        )
+        self._commit()
+
+    def fail_ingestion(self, id_ingestion, error, seconds=None):
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE ingestion_queue
+            SET status = 'error', error = ?, seconds = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (error, seconds, id_ingestion),
+        )
+        self._commit()
+
+    def set_ingestion_status(self, id_ingestion, status):
+        """Para el operador: reviewed, discarded o pending (reintentar)."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE ingestion_queue
+            SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (status, id_ingestion),
+        )
+        self._commit()
+
+    def reset_processing_ingestions(self):
+        """Lo que quedó processing al cerrar la app vuelve a pending."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            """
+            UPDATE ingestion_queue
+            SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'processing'
+            """
+        )
+        self._commit()
+        return cursor.rowcount
+
+    def get_ingestion_queue(self, status=None):
+        """Archivos de la cola (todos o de un status), en orden de llegada:
+        (id, path, id_sender, status, data, matches, warnings, error, seconds)."""
+        cursor = self.conn.cursor()
+        sql = """
+            SELECT id, path, id_sender, status, data, matches, warnings, error,
+                   seconds
+            FROM ingestion_queue
+        """
+        params = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            params = (status,)
+        cursor.execute(sql + " ORDER BY id", params)
+        return cursor.fetchall()
+
     # ===============================
     # Métodos de delete
     # ===============================
     def delete_sender(self, id_sender):
-        self.cursor.execute("DELETE FROM sender WHERE id = ?", (id_sender,))
-        self.conn.commit()
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM sender WHERE id = ?", (id_sender,))
+        self._commit()
 
     def delete_client(self, id_client):
-        self.cursor.execute("DELETE FROM clients WHERE id = ?", (id_client,))
-        self.conn.commit()
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM clients WHERE id = ?", (id_client,))
+        self._commit()
 
     def delete_product_by_sender(self, id_sender, id_product):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             "DELETE FROM products WHERE id = ? and id_sender=?",
             (
                 id_product,
                 id_sender,
             ),
         )
-        self.conn.commit()
+        self._commit()
 
     def delete_invoice(self, id_invoice):
-        self.cursor.execute("DELETE FROM invoices WHERE id = ?", (id_invoice,))
-        self.conn.commit()
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM invoices WHERE id = ?", (id_invoice,))
+        self._commit()
 
     def delete_invoice_detail(self, id_invoice_detail):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             "DELETE FROM invoice_details WHERE id = ?", (id_invoice_detail,)
         )
-        self.conn.commit()
+        self._commit()
 
     def delete_all_data(self):
         """Borra todos los registros de todas las tablas (para test)."""
-        self.cursor.executescript(
+        cursor = self.conn.cursor()
+        cursor.executescript(
             """
+            DELETE FROM scraper_spans;
+            DELETE FROM extraction_cache;
+            DELETE FROM ingestion_queue;
+            DELETE FROM emission_outbox;
             DELETE FROM invoice_details;
             DELETE FROM invoices;
             DELETE FROM products;
@@ -291,13 +996,14 @@ class DatabaseManager:
             DELETE FROM sqlite_sequence;
         """
         )
-        self.conn.commit()
+        self._commit()
 
     # ===============================
     # Métodos de update
     # ===============================
     def update_sender(self, id_sender, name, ruc, user, password):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             UPDATE sender
             SET name = ?, ruc = ?, user = ?, password = ?
@@ -305,10 +1011,11 @@ class DatabaseManager:
         """,
             (name, ruc, user, password, id_sender),
         )
-        self.conn.commit()
+        self._commit()
 
     def update_client(self, id_client, name, dni, ruc):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             UPDATE clients
             SET name = ?, dni = ?, ruc = ?
@@ -316,10 +1023,11 @@ class DatabaseManager:
         """,
             (name, dni, ruc, id_client),
         )
-        self.conn.commit()
+        self._commit()
 
     def update_product(self, id_product, id_sender, name, unit, price, igv):
-        self.cursor.execute(
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             UPDATE products
             SET id_sender = ?, name = ?, unit = ?, price = ?, igv = ?
@@ -327,7 +1035,7 @@ class DatabaseManager:
         """,
             (id_sender, name, unit, price, igv, id_product),
         )
-        self.conn.commit()
+        self._commit()
 
     def test_data_user(self):
         """Prueba de conexión a la base de datos."""
@@ -0,0 +1,356 @@
+# DataBase/migrations.py
+"""Migraciones versionadas del esquema de billing_system.db.
+
+Cada migración es (version, descripcion, [sentencias SQL]) y se aplica una
+sola vez, en orden, dentro de su propia transacción. La versión aplicada se
+registra en la tabla schema_version. Para cambiar el esquema de las bases ya
+instaladas se agrega una nueva entrada al final de MIGRATIONS (nunca se
+modifica una migración ya publicada).
+"""
+
+import logging
+
+MIGRATIONS = [
+    (
+        1,
+        "indices para historial, detalles y busqueda de clientes",
+        [
+            # get_invoices_by_sender_id: filtra por id_sender y lee el resto
+            # de columnas desde el índice (covering), sin tocar la tabla.
+            """
+            CREATE INDEX IF NOT EXISTS idx_invoices_sender
+            ON invoices (id_sender, id_client, total, tipo, igv, emision_fecha)
+            """,
+            # get_invoice_details: filtra invoice_details.invoice_id
+            """
+            CREATE INDEX IF NOT EXISTS idx_invoice_details_invoice
+            ON invoice_details (invoice_id, product_id, quantity, subtotal)
+            """,
+            # insert_client: name = ? OR dni = ? OR ruc = ? (dni y ruc ya
+            # tienen índice por UNIQUE). products ya se busca por id_sender
+            # con el índice del UNIQUE (id_sender, name, unit, price, igv).
+            """
+            CREATE INDEX IF NOT EXISTS idx_clients_name ON clients (name)
+            """,
+        ],
+    ),
+    (
+        2,
+        "contadores de numeracion por remitente, tipo y serie",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS series_counters (
+                id_sender INTEGER NOT NULL,
+                tipo TEXT NOT NULL,
+                serie TEXT NOT NULL,
+                last_number INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id_sender, tipo, serie),
+                FOREIGN KEY (id_sender) REFERENCES sender(id) ON DELETE CASCADE
+            )
+            """,
+            # Semilla desde las boletas existentes: la serie guardada es
+            # "B05-19" (prefijo de serie + número), el contador va por prefijo.
+            """
+            INSERT OR IGNORE INTO series_counters (id_sender, tipo, serie, last_number)
+            SELECT
+                id_sender,
+                tipo,
+                CASE WHEN instr(serie, '-') > 0
+                     THEN substr(serie, 1, instr(serie, '-') - 1)
+                     ELSE serie END,
+                MAX(CAST(numero AS INTEGER))
+            FROM invoices
+            GROUP BY 1, 2, 3
+            """,
+        ],
+    ),
+    (
+        3,
+        "fecha de emision ISO e indice para el historial paginado",
+        [
+            # emision_fecha se guarda como dd/mm/yyyy (no ordenable); la
+            # columna generada la expone como yyyy-mm-dd para ordenar y filtrar.
+            """
+            ALTER TABLE invoices ADD COLUMN emision_iso TEXT
+            GENERATED ALWAYS AS (
+                substr(emision_fecha, 7, 4) || '-' ||
+                substr(emision_fecha, 4, 2) || '-' ||
+                substr(emision_fecha, 1, 2)
+            ) VIRTUAL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_invoices_sender_fecha
+            ON invoices (id_sender, emision_iso, id)
+            """,
+        ],
+    ),
+    (
+        4,
+        "resumen diario de ventas mantenido por triggers",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS sales_daily_agg (
+                id_sender INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                id_client INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                igv REAL NOT NULL DEFAULT 0,
+                max_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (id_sender, day, id_client)
+            )
+            """,
+            """
+            INSERT OR IGNORE INTO sales_daily_agg
+                (id_sender, day, id_client, count, total, igv, max_total)
+            SELECT id_sender, emision_iso, id_client,
+                   COUNT(*), SUM(total), SUM(igv), MAX(total)
+            FROM invoices
+            GROUP BY 1, 2, 3
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_agg_insert
+            AFTER INSERT ON invoices
+            BEGIN
+                INSERT INTO sales_daily_agg
+                    (id_sender, day, id_client, count, total, igv, max_total)
+                VALUES
+                    (NEW.id_sender, NEW.emision_iso, NEW.id_client, 1,
+                     NEW.total, NEW.igv, NEW.total)
+                ON CONFLICT (id_sender, day, id_client) DO UPDATE SET
+                    count = count + 1,
+                    total = total + excluded.total,
+                    igv = igv + excluded.igv,
+                    max_total = MAX(max_total, excluded.total);
+            END
+            """,
+            # Al borrar, el máximo del grupo se recalcula solo sobre las
+            # boletas de ese remitente/día/cliente (idx_invoices_sender_fecha).
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_sales_agg_delete
+            AFTER DELETE ON invoices
+            BEGIN
+                UPDATE sales_daily_agg SET
+                    count = count - 1,
+                    total = total - OLD.total,
+                    igv = igv - OLD.igv,
+                    max_total = COALESCE((
+                        SELECT MAX(total) FROM invoices
+                        WHERE id_sender = OLD.id_sender
+                          AND emision_iso = OLD.emision_iso
+                          AND id_client = OLD.id_client
+                    ), 0)
+                WHERE id_sender = OLD.id_sender
+                  AND day = OLD.emision_iso
+                  AND id_client = OLD.id_client;
+                DELETE FROM sales_daily_agg
+                WHERE id_sender = OLD.id_sender
+                  AND day = OLD.emision_iso
+                  AND id_client = OLD.id_client
+                  AND count <= 0;
+            END
+            """,
+        ],
+    ),
+    (
+        5,
+        "cola de emision a SUNAT (outbox)",
+        [
+            # Se escribe en la misma transacción que la boleta; un worker la
+            # vacía en segundo plano. status: pending -> in_progress -> sent,
+            # o de vuelta a pending (con next_attempt_at) / failed al agotar
+            # los intentos.
+            """
+            CREATE TABLE IF NOT EXISTS emission_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invoice_id INTEGER NOT NULL UNIQUE,
+                id_sender INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending', 'in_progress', 'sent', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_emission_outbox_status
+            ON emission_outbox (status, next_attempt_at, id)
+            """,
+        ],
+    ),
+    (
+        6,
+        "tiempos por paso del scraper SUNAT",
+        [
+            # Un registro por paso medido (iniciar_sesion, cada espera,
+            # agregar_producto, ...) de cada documento emitido. inicio es el
+            # desfase en segundos desde que empezó el documento.
+            """
+            CREATE TABLE IF NOT EXISTS scraper_spans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                trace_id TEXT NOT NULL,
+                id_sender INTEGER,
+                serie TEXT,
+                tipo TEXT,
+                paso TEXT NOT NULL,
+                inicio REAL NOT NULL,
+                duracion REAL NOT NULL,
+                ok INTEGER NOT NULL DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_scraper_spans_trace
+            ON scraper_spans (trace_id)
+            """,
+        ],
+    ),
+    (
+        7,
+        "cache de extracciones de Gemini por contenido",
+        [
+            # key = SHA-256 del archivo + versión del prompt/modelo. last_used
+            # es un reloj lógico (MAX + 1 en cada uso) para el desalojo LRU.
+            """
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                file_sha256 TEXT NOT NULL,
+                version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_used INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_extraction_cache_lru
+            ON extraction_cache (last_used, size)
+            """,
+        ],
+    ),
+    (
+        8,
+        "cola de revision de la ingesta por lote",
+        [
+            # Un registro por archivo (imagen o PDF) de la carpeta. status:
+            # pending -> processing -> ready (extraído, por revisar) o error;
+            # el operador lo pasa a reviewed (cargado en el formulario) o
+            # discarded. file_sha256 evita procesar dos veces el mismo archivo.
+            """
+            CREATE TABLE IF NOT EXISTS ingestion_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                file_sha256 TEXT NOT NULL UNIQUE,
+                id_sender INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending', 'processing', 'ready', 'error',
+                                      'reviewed', 'discarded')),
+                data TEXT,
+                matches TEXT,
+                warnings TEXT,
+                error TEXT,
+                seconds REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_ingestion_queue_status
+            ON ingestion_queue (status, id)
+            """,
+        ],
+    ),
+    (
+        9,
+        "emisiones sin confirmar y numero asignado por SUNAT",
+        [
+            # sent solo con el número que SUNAT confirmó (sunat_number);
+            # unconfirmed: se pulsó emitir y no llegó la confirmación, el
+            # operador la verifica en el portal (no se reintenta sola). El
+            # CHECK no se puede alterar: la tabla se reconstruye.
+            """
+            CREATE TABLE emission_outbox_v9 (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invoice_id INTEGER NOT NULL UNIQUE,
+                id_sender INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending'
+                    CHECK (status IN ('pending', 'in_progress', 'sent',
+                                      'unconfirmed', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                sunat_number TEXT,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (invoice_id) REFERENCES invoices(id) ON DELETE CASCADE
+            )
+            """,
+            """
+            INSERT INTO emission_outbox_v9 (
+                id, invoice_id, id_sender, payload, status, attempts, last_error,
+                next_attempt_at, created_at, updated_at
+            )
+            SELECT id, invoice_id, id_sender, payload, status, attempts, last_error,
+                   next_attempt_at, created_at, updated_at
+            FROM emission_outbox
+            """,
+            "DROP TABLE emission_outbox",
+            "ALTER TABLE emission_outbox_v9 RENAME TO emission_outbox",
+            """
+            CREATE INDEX IF NOT EXISTS idx_emission_outbox_status
+            ON emission_outbox (status, next_attempt_at, id)
+            """,
+        ],
+    ),
+]
+
+
+def current_version(conn):
+    """Devuelve la última versión aplicada (0 si no hay ninguna)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.commit()
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn, migrations=None):
+    """Aplica en orden las migraciones pendientes. Retorna la versión final."""
+    if migrations is None:
+        migrations = MIGRATIONS
+    version = current_version(conn)
+
+    for numero, descripcion, sentencias in sorted(migrations, key=lambda m: m[0]):
+        if numero <= version:
+            continue
+        logging.info("Aplicando migración %s: %s", numero, descripcion)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql in sentencias:
+                conn.execute(sql)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (numero, descripcion),
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.error("Fallo la migración %s: %s", numero, e)
+            raise
+        version = numero
+
+    return version
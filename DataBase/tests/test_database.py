@@ -1,7 +1,10 @@
 # tests/conftest.py (archivo recomendado para fixtures globales)
 
+import threading
+
 import pytest
 from DataBase.DatabaseManager import DatabaseManager
+from DataBase.migrations import MIGRATIONS, apply_migrations
 
 
 @pytest.fixture
@@ -143,5 +146,404 @@ def test_update_product(db):
     assert productos_actualizados[0][4] == 20.0
 
 
+def test_transaction_un_solo_commit(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    commits = []
+    db.conn.set_trace_callback(
+        lambda sql: commits.append(sql) if sql.upper() == "COMMIT" else None
+    )
+
+    with db.transaction():
+        id_cliente = db.insert_client(1, "Cliente A", "11111111", None)
+        invoice_id = db.insert_invoice(
+            id_cliente, 1, 30.0, 0.0, "BOLETA", "B01-01", "01", "01/07/2025"
+        )
+        p1 = db.insert_product(1, "Producto A", "KILOGRAMO", 10.0, 0)
+        p2 = db.insert_product(1, "Producto B", "CAJA", 20.0, 0)
+        db.insert_invoice_details(invoice_id, [(p1, 1, 10.0), (p2, 1, 20.0)])
+
+    db.conn.set_trace_callback(None)
+    assert len(commits) == 1
+    assert len(db.get_invoice_details(invoice_id)) == 2
+
+
+def test_transaction_rollback_si_falla(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            id_cliente = db.insert_client(1, "Cliente A", "11111111", None)
+            db.insert_invoice(
+                id_cliente, 1, 10.0, 0.0, "BOLETA", "B01-01", "01", "01/07/2025"
+            )
+            raise RuntimeError("fallo a mitad de la boleta")
+
+    assert db.get_clients() == []
+    assert db.get_invoices_by_sender_id(1) == []
+
+
+def test_numeracion_por_tipo_de_documento(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+
+    assert db.get_next_invoice_number(1, "BOLETA") == 1
+    assert db.reserve_invoice_number(1, "BOLETA") == 1
+    assert db.reserve_invoice_number(1, "BOLETA") == 2
+    # la factura tiene su propia serie (F01), no choca con B01
+    assert db.reserve_invoice_number(1, "FACTURA") == 1
+    assert db.get_next_invoice_number(1, "BOLETA") == 3
+    assert db.get_next_invoice_number(1, "FACTURA") == 2
+
+
+def test_numeracion_rollback_no_consume_numero(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.reserve_invoice_number(1, "BOLETA")
+            raise RuntimeError("fallo al guardar la boleta")
+
+    assert db.reserve_invoice_number(1, "BOLETA") == 1
+
+
+def test_huecos_de_serie(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    id_cliente = db.insert_client(1, "Cliente A", "11111111", None)
+    for _ in range(3):
+        numero = db.reserve_invoice_number(1, "BOLETA")
+        if numero != 2:  # el 2 se reservó pero nunca se guardó
+            db.insert_invoice(
+                id_cliente, 1, 10.0, 0.0, "BOLETA", f"B01-{numero:02d}",
+                f"{numero:02d}", "01/07/2025",
+            )
+
+    assert db.get_series_gaps(1, "BOLETA") == [2]
+
+
+def test_migracion_siembra_contadores_desde_boletas(monkeypatch):
+    # base "antigua": solo con la primera migración aplicada
+    manager = DatabaseManager(":memory:")
+    monkeypatch.setattr(
+        "DataBase.DatabaseManager.apply_migrations",
+        lambda conn: apply_migrations(conn, MIGRATIONS[:1]),
+    )
+    manager.create_tables()
+    monkeypatch.undo()
+
+    manager.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    id_cliente = manager.insert_client(1, "Cliente A", "11111111", None)
+    manager.insert_invoice(
+        id_cliente, 1, 10.0, 0.0, "BOLETA", "B01-07", "07", "01/07/2025"
+    )
+
+    manager.migrate()
+    assert manager.get_next_invoice_number(1, "BOLETA") == 8
+    assert manager.get_next_invoice_number(1, "FACTURA") == 1
+    manager.close()
+
+
+def test_historial_paginado_por_clave(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    ana = db.insert_client(1, "ANA", "11111111", None)
+    beto = db.insert_client(1, "BETO", "22222222", None)
+    with db.transaction():
+        for i in range(25):
+            db.insert_invoice(
+                ana if i % 2 else beto, 1, 10.0 + i, 0.0,
+                "FACTURA" if i % 5 == 0 else "BOLETA", f"B01-{i:02d}",
+                f"{i:02d}", f"{1 + i % 28:02d}/{1 + i % 3:02d}/2025",
+            )
+
+    vistos, despues = [], None
+    while True:
+        pagina = db.get_invoices_page(1, limit=10, after=despues)
+        if not pagina:
+            break
+        vistos.extend(pagina)
+        despues = (pagina[-1][7], pagina[-1][0])
+
+    claves = [(fila[7], fila[0]) for fila in vistos]
+    assert len(vistos) == 25
+    assert claves == sorted(claves, reverse=True)
+
+    facturas_ana = db.get_invoices_page(1, client="AN", tipo="FACTURA")
+    assert {fila[1] for fila in facturas_ana} == {"ANA"}
+    assert {fila[4] for fila in facturas_ana} == {"FACTURA"}
+
+    enero = db.get_invoices_page(1, date_from="2025-01-01", date_to="2025-01-31")
+    assert enero and all(fila[7].startswith("2025-01") for fila in enero)
+
+
+def test_plan_historial_paginado(db):
+    plan = plan_de_consulta(
+        db, lambda: db.get_invoices_page(1, limit=50, after=("2025-07-01", 99))
+    )
+    assert any("idx_invoices_sender_fecha" in p for p in plan)
+    assert not any("TEMP B-TREE" in p for p in plan)  # sin ordenar en memoria
+
+
+def test_resumen_diario_se_mantiene_con_triggers(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    ana = db.insert_client(1, "ANA", "11111111", None)
+    beto = db.insert_client(1, "BETO", "22222222", None)
+    ids = [
+        db.insert_invoice(ana, 1, 10.0, 0.0, "BOLETA", "B01-01", "01", "01/07/2025"),
+        db.insert_invoice(ana, 1, 30.0, 1.8, "BOLETA", "B01-02", "02", "01/07/2025"),
+        db.insert_invoice(beto, 1, 20.0, 0.0, "BOLETA", "B01-03", "03", "02/07/2025"),
+    ]
+
+    assert db.get_sales_summary(1) == (3, 60.0, 1.8, 30.0)
+    assert db.get_top_clients(1, limit=1) == [("ANA", 2, 40.0)]
+    assert db.get_sales_summary(1, "2025-07-02", "2025-07-31")[0] == 1
+
+    db.delete_invoice(ids[1])  # el máximo del día vuelve a 10.0
+    assert db.get_sales_summary(1) == (2, 30.0, 0.0, 20.0)
+    db.delete_invoice(ids[2])
+    count = db.conn.execute("SELECT COUNT(*) FROM sales_daily_agg").fetchone()[0]
+    assert count == 1  # el grupo de BETO se elimina al quedar vacío
+
+
+def test_conexion_por_hilo(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    resultado = {}
+
+    def trabajo():
+        resultado["conn"] = db.conn
+        db.insert_product(1, "Producto Hilo", "CAJA", 5.0, 0)
+        resultado["remitentes"] = db.get_senders()
+
+    hilo = threading.Thread(target=trabajo)
+    hilo.start()
+    hilo.join()
+
+    assert resultado["conn"] is not db.conn
+    assert len(resultado["remitentes"]) == 1
+    assert db.get_products()[0][2] == "Producto Hilo"
+
+
+def test_conexion_de_hilo_terminado_se_libera(db):
+    hilo = threading.Thread(target=db.get_senders)
+    hilo.start()
+    hilo.join()
+    del hilo
+
+    assert len(db._conexiones) == 1  # solo queda la del hilo principal
+
+
+def test_archivo_en_modo_wal(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "billing_system.db"))
+    manager.create_tables()
+
+    assert manager.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert manager.conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    manager.close()
+
+
+def boleta_encolada(db, numero=1):
+    """Boleta guardada con su emisión en la cola, como guardar_boleta_db."""
+    with db.transaction():
+        id_cliente = db.insert_client(1, "Cliente A", "11111111", None)
+        invoice_id = db.insert_invoice(
+            id_cliente, 1, 10.0, 0.0, "BOLETA", f"B01-{numero:02d}",
+            f"{numero:02d}", "01/07/2025",
+        )
+        db.enqueue_emission(invoice_id, 1, '{"tipo_documento": "BOLETA"}')
+    return invoice_id
+
+
+def test_cola_de_emision_en_la_misma_transaccion(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            id_cliente = db.insert_client(1, "Cliente A", "11111111", None)
+            invoice_id = db.insert_invoice(
+                id_cliente, 1, 10.0, 0.0, "BOLETA", "B01-01", "01", "01/07/2025"
+            )
+            db.enqueue_emission(invoice_id, 1, "{}")
+            raise RuntimeError("fallo antes del commit")
+
+    assert db.get_emission_outbox() == []
+
+
+def test_cola_de_emision_envio_y_reintento(db):
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    primera = boleta_encolada(db, 1)
+    segunda = boleta_encolada(db, 2)
+
+    # se toman en orden y una emisión tomada no se vuelve a entregar
+    id1, invoice1, _, payload, intentos = db.claim_next_emission()
+    assert (invoice1, intentos) == (primera, 1)
+    assert payload == '{"tipo_documento": "BOLETA"}'
+    id2, invoice2, *_ = db.claim_next_emission()
+    assert invoice2 == segunda
+    assert db.claim_next_emission() is None
+
+    db.mark_emission_sent(id1, "EB01-1")
+    # el reintento espera su turno
+    db.mark_emission_failed(id2, "timeout", retry_in=300)
+    assert db.claim_next_emission() is None
+    db.mark_emission_failed(id2, "timeout", retry_in=0)
+    assert db.claim_next_emission()[4] == 2  # segundo intento
+
+    db.mark_emission_failed(id2, "importe distinto")
+    estados = {fila[1]: fila[3:6] for fila in db.get_emission_outbox()}
+    assert estados[primera] == ("sent", 1, None)
+    assert estados[segunda] == ("failed", 2, "importe distinto")
+
+    assert db.retry_emission(id2)
+    assert db.claim_next_emission()[4] == 1
+    assert db.get_emission_outbox("sent")[0][7] == "EB01-1"
+
+
+def test_cola_de_emision_sin_confirmar(db):
+    """Sin confirmación de SUNAT no se reintenta sola: la verifica el operador."""
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    primera = boleta_encolada(db, 1)
+    boleta_encolada(db, 2)
+    id1 = db.claim_next_emission()[0]
+    id2 = db.claim_next_emission()[0]
+
+    db.mark_emission_unconfirmed(id1, "SUNAT no confirmó")
+    db.mark_emission_unconfirmed(id2, "SUNAT no confirmó")
+    assert db.claim_next_emission() is None
+    assert db.reset_in_progress_emissions() == 0
+
+    # encontrada en SUNAT: sent con su número; no encontrada: de vuelta a la cola
+    assert db.confirm_emission(id1, "EB01-7")
+    assert not db.confirm_emission(id1, "EB01-8")
+    assert db.retry_emission(id2)
+    estados = {fila[1]: (fila[3], fila[7]) for fila in db.get_emission_outbox()}
+    assert estados[primera] == ("sent", "EB01-7")
+    assert db.claim_next_emission()[0] == id2
+
+
+def test_migracion_de_la_cola_de_emision_conserva_filas(monkeypatch):
+    manager = DatabaseManager(":memory:")
+    monkeypatch.setattr(
+        "DataBase.DatabaseManager.apply_migrations",
+        lambda conn: apply_migrations(conn, [m for m in MIGRATIONS if m[0] < 9]),
+    )
+    manager.create_tables()
+    monkeypatch.undo()
+    manager.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    invoice_id = boleta_encolada(manager)
+
+    manager.migrate()
+    (fila,) = manager.get_emission_outbox()
+    assert fila[1:4] == (invoice_id, 1, "pending")
+    manager.mark_emission_unconfirmed(fila[0], "SUNAT no confirmó")
+    assert manager.get_emission_outbox("unconfirmed")[0][0] == fila[0]
+    manager.close()
+
+
+def test_cola_de_emision_reinicio(db):
+    """Lo que quedó in_progress al cerrar la app queda por verificar, no se
+    reintenta solo (pudo llegar a emitirse)."""
+    db.insert_sender("Empresa A", "12345678901", "user_a", "pass_a")
+    invoice_id = boleta_encolada(db)
+    outbox_id = db.claim_next_emission()[0]
+
+    assert db.reset_in_progress_emissions() == 1
+    assert db.claim_next_emission() is None
+    fila = db.get_emission_outbox("unconfirmed")[0]
+    assert fila[:2] == (outbox_id, invoice_id) and fila[5]
+
+    # no estaba en SUNAT: el operador la reencola
+    assert db.retry_emission(outbox_id)
+    assert db.claim_next_emission()[1] == invoice_id
+
+
+def spans_de(trace_id, *pasos):
+    return [(trace_id, 1, "B001-1", "BOLETA", p, 0.0, d, 1) for p, d in pasos]
+
+
+def test_tiempos_del_scraper_ultimas_emisiones(db):
+    for i in range(3):
+        db.insert_scraper_spans(
+            spans_de(f"t{i}", ("iniciar_sesion", float(i)), ("documento", i + 1.0))
+        )
+
+    assert db.get_scraper_spans(2) == [
+        ("iniciar_sesion", 1.0, 1),
+        ("documento", 2.0, 1),
+        ("iniciar_sesion", 2.0, 1),
+        ("documento", 3.0, 1),
+    ]
+    assert db.delete_old_scraper_spans(keep_traces=1) == 4
+    assert db.get_scraper_spans() == [("iniciar_sesion", 2.0, 1), ("documento", 3.0, 1)]
+    assert db.delete_old_scraper_spans(keep_traces=1) == 0
+
+
+def test_cola_de_ingesta(db):
+    primero = db.enqueue_ingestion("/fotos/a.jpg", "sha-a", None)
+    segundo = db.enqueue_ingestion("/fotos/b.pdf", "sha-b", 1)
+    assert db.enqueue_ingestion("/otra/a.jpg", "sha-a", None) is None  # repetido
+
+    assert db.claim_pending_ingestions(limit=1) == [(primero, "/fotos/a.jpg", None)]
+    assert db.reset_processing_ingestions() == 1
+    assert [f[0] for f in db.claim_pending_ingestions()] == [primero, segundo]
+    assert db.claim_pending_ingestions() == []
+
+    db.complete_ingestion(primero, '{"total": 1}', "[]", '["Sin productos"]', 0.5)
+    db.fail_ingestion(segundo, "sin respuesta", 0.2)
+    assert [f[0] for f in db.get_ingestion_queue("ready")] == [primero]
+    assert db.get_ingestion_queue("error")[0][7] == "sin respuesta"
+
+    db.set_ingestion_status(primero, "reviewed")
+    assert db.get_ingestion_queue("ready") == []
+
+
+def plan_de_consulta(db, llamada):
+    """Ejecuta la llamada capturando su SQL y devuelve el EXPLAIN QUERY PLAN."""
+    sentencias = []
+    db.conn.set_trace_callback(sentencias.append)
+    llamada()
+    db.conn.set_trace_callback(None)
+    select = next(sql for sql in sentencias if sql.lstrip().upper().startswith("SELECT"))
+    filas = db.conn.execute("EXPLAIN QUERY PLAN " + select).fetchall()
+    return [fila[3] for fila in filas]
+
+
+def test_ruta_de_la_base_desde_el_entorno(monkeypatch, tmp_path):
+    ruta = tmp_path / "benchmark.db"
+    monkeypatch.setenv("BILLING_DB_PATH", str(ruta))
+    manager = DatabaseManager()
+    manager.create_tables()
+    manager.close()
+    assert manager.db_path == str(ruta) and ruta.exists()
+
+
+def test_migraciones_registran_version(db):
+    version = db.conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    assert version == max(m[0] for m in MIGRATIONS)
+    # volver a migrar no aplica nada nuevo
+    assert db.migrate() == version
+
+
+def test_plan_historial_por_remitente(db):
+    plan = plan_de_consulta(db, lambda: db.get_invoices_by_sender_id(1))
+    assert any("COVERING INDEX idx_invoices_sender" in p for p in plan)
+    assert not any(p.startswith("SCAN") for p in plan)
+
+
+def test_plan_detalles_de_boleta(db):
+    plan = plan_de_consulta(db, lambda: db.get_invoice_details(1))
+    assert any("idx_invoice_details_invoice" in p for p in plan)
+    assert not any(p.startswith("SCAN") for p in plan)
+
+
+def test_plan_productos_por_remitente(db):
+    plan = plan_de_consulta(db, lambda: db.get_products_by_sender(1))
+    assert any(p.startswith("SEARCH products USING INDEX") for p in plan)
+    assert not any(p.startswith("SCAN") for p in plan)
+
+
+def test_plan_busqueda_cliente_existente(db):
+    plan = plan_de_consulta(
+        db, lambda: db.insert_client(1, "Cliente A", "11111111", "10111111111")
+    )
+    assert any("idx_clients_name" in p for p in plan)
+    assert not any(p.startswith("SCAN") for p in plan)
+
+
 if __name__ == "__main__":
     pytest.main()
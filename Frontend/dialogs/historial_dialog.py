@@ -4,13 +4,19 @@ from PyQt5.QtWidgets import (
     QHBoxLayout,
     QPushButton,
     QLabel,
+    QLineEdit,
+    QComboBox,
+    QCheckBox,
+    QDateEdit,
+    QSpinBox,
+    QTableView,
     QTableWidget,
     QTableWidgetItem,
     QHeaderView,
     QTabWidget,
     QWidget,
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QDate
 from PyQt5.QtGui import QFont
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -44,6 +50,78 @@ class InvoiceDetailsDialog(QDialog):
         layout.addWidget(tabla)
 
 
+class HistorialModel(QAbstractTableModel):
+    """Modelo del historial que trae las boletas por páginas al hacer scroll."""
+
+    COLUMNAS = [
+        "ID Boleta",
+        "Cliente",
+        "Remitente",
+        "Total",
+        "Tipo",
+        "IGV",
+        "Fecha Emisión",
+    ]
+
+    def __init__(self, controller, id_sender, tam_pagina=200, parent=None):
+        super().__init__(parent)
+        self.controller = controller
+        self.id_sender = id_sender
+        self.tam_pagina = tam_pagina
+        self.filtros = {}
+        self.filas = []
+        self._despues = None  # clave (emision_iso, id) de la última fila
+        self._hay_mas = True
+
+    def reiniciar(self, **filtros):
+        """Descarta lo cargado y vuelve a la primera página con otros filtros."""
+        self.beginResetModel()
+        self.filtros = filtros
+        self.filas = []
+        self._despues = None
+        self._hay_mas = True
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.filas)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNAS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return str(self.filas[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNAS[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._hay_mas
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._hay_mas:
+            return
+        pagina = self.controller.ver_historial_pagina(
+            self.id_sender, self.tam_pagina, self._despues, **self.filtros
+        )
+        self._hay_mas = len(pagina) == self.tam_pagina
+        if not pagina:
+            return
+        inicio = len(self.filas)
+        self.beginInsertRows(QModelIndex(), inicio, inicio + len(pagina) - 1)
+        self.filas.extend(pagina)
+        self.endInsertRows()
+        ultima = pagina[-1]
+        self._despues = (ultima[7], ultima[0])
+
+    def invoice_id(self, row):
+        return self.filas[row][0]
+
+
 class HistorialDialog(QDialog):
     def __init__(self, controller, id_sender, parent=None):
         super().__init__(parent)
@@ -66,6 +144,7 @@ class HistorialDialog(QDialog):
         self.stats_tab = QWidget()
         self._init_stats_tab()
         self.tabs.addTab(self.stats_tab, "Estadísticas")
+        self.tabs.currentChanged.connect(self._on_tab_changed)
 
         # Cargar datos iniciales
         self.cargar_historial()
@@ -73,6 +152,26 @@ class HistorialDialog(QDialog):
     def _init_historial_tab(self):
         layout = QVBoxLayout(self.historial_tab)
 
+        # Filtros
+        self.filtro_cliente = QLineEdit()
+        self.filtro_cliente.setPlaceholderText("Cliente")
+        self.filtro_tipo = QComboBox()
+        self.filtro_tipo.addItems(["Todos", "BOLETA", "FACTURA"])
+        self.filtro_fechas = QCheckBox("Desde / Hasta")
+        self.filtro_desde = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.filtro_hasta = QDateEdit(QDate.currentDate())
+        for fecha in (self.filtro_desde, self.filtro_hasta):
+            fecha.setCalendarPopup(True)
+            fecha.setDisplayFormat("dd/MM/yyyy")
+
+        filtros_layout = QHBoxLayout()
+        filtros_layout.addWidget(self.filtro_cliente)
+        filtros_layout.addWidget(self.filtro_tipo)
+        filtros_layout.addWidget(self.filtro_fechas)
+        filtros_layout.addWidget(self.filtro_desde)
+        filtros_layout.addWidget(self.filtro_hasta)
+        layout.addLayout(filtros_layout)
+
         boton_actualizar = QPushButton("Actualizar")
         boton_actualizar.clicked.connect(self.cargar_historial)
         boton_ver_detalles = QPushButton("Ver Detalles")
@@ -82,28 +181,55 @@ class HistorialDialog(QDialog):
         hlayout.addWidget(boton_ver_detalles)
         layout.addLayout(hlayout)
 
-        self.tabla = QTableWidget()
-        self.tabla.setColumnCount(7)
-        self.tabla.setHorizontalHeaderLabels(
-            [
-                "ID Boleta",
-                "Cliente",
-                "Remitente",
-                "Total",
-                "Tipo",
-                "IGV",
-                "Fecha Emisión",
-            ]
-        )
+        # Tabla virtual: solo se piden páginas a la BD al hacer scroll
+        self.modelo = HistorialModel(self.controller, self.id_sender, parent=self)
+        self.tabla = QTableView()
+        self.tabla.setModel(self.modelo)
         header = self.tabla.horizontalHeader()
-        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(QHeaderView.Interactive)
         header.setSectionResizeMode(1, QHeaderView.Stretch)  # Cliente
         header.setSectionResizeMode(2, QHeaderView.Stretch)  # Remitente
-        self.tabla.setSelectionBehavior(QTableWidget.SelectRows)
+        self.tabla.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.tabla.setSelectionBehavior(QTableView.SelectRows)
+        self.tabla.doubleClicked.connect(self.mostrar_detalles)
         layout.addWidget(self.tabla)
 
+    def _filtros(self):
+        filtros = {}
+        cliente = self.filtro_cliente.text().strip()
+        if cliente:
+            filtros["client"] = cliente.upper()
+        if self.filtro_tipo.currentText() != "Todos":
+            filtros["tipo"] = self.filtro_tipo.currentText()
+        if self.filtro_fechas.isChecked():
+            filtros["date_from"] = self.filtro_desde.date().toString("yyyy-MM-dd")
+            filtros["date_to"] = self.filtro_hasta.date().toString("yyyy-MM-dd")
+        return filtros
+
     def _init_stats_tab(self):
         layout = QVBoxLayout(self.stats_tab)
+
+        self.stats_fechas = QCheckBox("Desde / Hasta")
+        self.stats_desde = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.stats_hasta = QDateEdit(QDate.currentDate())
+        for fecha in (self.stats_desde, self.stats_hasta):
+            fecha.setCalendarPopup(True)
+            fecha.setDisplayFormat("dd/MM/yyyy")
+        self.stats_top = QSpinBox()
+        self.stats_top.setRange(1, 50)
+        self.stats_top.setValue(10)
+        self.stats_top.setPrefix("Top ")
+        boton_calcular = QPushButton("Calcular")
+        boton_calcular.clicked.connect(self._update_stats)
+
+        filtros_layout = QHBoxLayout()
+        filtros_layout.addWidget(self.stats_fechas)
+        filtros_layout.addWidget(self.stats_desde)
+        filtros_layout.addWidget(self.stats_hasta)
+        filtros_layout.addWidget(self.stats_top)
+        filtros_layout.addWidget(boton_calcular)
+        layout.addLayout(filtros_layout)
+
         self.stats_label = QLabel("Estadísticas:")
         layout.addWidget(self.stats_label)
 
@@ -112,44 +238,40 @@ class HistorialDialog(QDialog):
         layout.addWidget(self.canvas)
 
     def cargar_historial(self):
-        data = self.controller.ver_histoial_id_sender(self.id_sender)
-        self.tabla.setRowCount(0)
-        if not data:
-            return
+        self.modelo.reiniciar(**self._filtros())
 
-        for row_idx, fila in enumerate(data):
-            self.tabla.insertRow(row_idx)
-            for col_idx, dato in enumerate(fila):
-                item = QTableWidgetItem(str(dato))
-                item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
-                self.tabla.setItem(row_idx, col_idx, item)
-
-        self._update_stats(data)
+    def _on_tab_changed(self, index):
+        # las estadísticas solo se calculan cuando se abre su pestaña
+        if self.tabs.widget(index) is self.stats_tab:
+            self._update_stats()
 
     def mostrar_detalles(self):
-        row = self.tabla.currentRow()
+        row = self.tabla.currentIndex().row()
         if row < 0:
             return
-        invoice_id = int(self.tabla.item(row, 0).text())
+        invoice_id = self.modelo.invoice_id(row)
         details = self.controller.ver_invoice_details(invoice_id)
         dlg = InvoiceDetailsDialog(details, self)
         dlg.exec_()
 
-    def _update_stats(self, data):
-        # Estadísticas básicas
-        totales = [float(fila[3]) for fila in data]
-        total = sum(totales)
-        promedio = total / len(totales)
-        maximo = max(totales)
+    def _update_stats(self):
+        # Estadísticas desde el resumen diario (sales_daily_agg)
+        desde = hasta = None
+        if self.stats_fechas.isChecked():
+            desde = self.stats_desde.date().toString("yyyy-MM-dd")
+            hasta = self.stats_hasta.date().toString("yyyy-MM-dd")
+        stats = self.controller.ver_estadisticas(
+            self.id_sender, desde, hasta, self.stats_top.value()
+        )
+        if not stats:
+            return
         self.stats_label.setText(
-            f"Estadísticas: Boletas={len(totales)}, Total={total:.2f}, "
-            f"Promedio={promedio:.2f}, Máximo={maximo:.2f}"
+            f"Estadísticas: Boletas={stats['boletas']}, Total={stats['total']:.2f}, "
+            f"Promedio={stats['promedio']:.2f}, Máximo={stats['maximo']:.2f}"
         )
 
-        # Gráfico de cantidad de boletas por cliente
-        clientes = {}
-        for _, cliente, *_ in data:
-            clientes[cliente] = clientes.get(cliente, 0) + 1
+        # Gráfico de cantidad de boletas por cliente (top N)
+        clientes = {nombre: boletas for nombre, boletas, _ in stats["top_clientes"]}
 
         self.ax.clear()
         bars = self.ax.bar(
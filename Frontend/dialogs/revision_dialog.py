@@ -0,0 +1,131 @@
+"""Revisión de los documentos de la ingesta por lote antes de emitirlos."""
+
+import json
+import logging
+import os
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (
+    QDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QMessageBox,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+)
+
+
+class RevisionDialog(QDialog):
+    """Lista lo extraído (ready) y lo fallido (error) de la cola de ingesta.
+
+    "Cargar en formulario" cierra el diálogo con `seleccion` = (id, ruta,
+    data); la ventana principal llena el formulario y lo marca reviewed.
+    """
+
+    COLUMNAS = [
+        "Archivo",
+        "Estado",
+        "Cliente",
+        "Total",
+        "En catálogo",
+        "Observaciones",
+    ]
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Revisar documentos")
+        self.resize(900, 400)
+
+        self.db = db
+        self.filas = []
+        self.seleccion = None
+
+        self.init_ui()
+        self.cargar_cola()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.tabla = QTableWidget()
+        self.tabla.setColumnCount(len(self.COLUMNAS))
+        self.tabla.setHorizontalHeaderLabels(self.COLUMNAS)
+        self.tabla.setSelectionBehavior(QTableWidget.SelectRows)
+        self.tabla.setSelectionMode(QTableWidget.SingleSelection)
+        self.tabla.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.tabla.doubleClicked.connect(self.cargar_en_formulario)
+        layout.addWidget(self.tabla)
+
+        botones = QHBoxLayout()
+        for texto, accion in (
+            ("Cargar en formulario", self.cargar_en_formulario),
+            ("Reintentar", self.reintentar),
+            ("Descartar", self.descartar),
+            ("Cerrar", self.reject),
+        ):
+            boton = QPushButton(texto)
+            boton.clicked.connect(accion)
+            botones.addWidget(boton)
+        layout.addLayout(botones)
+
+    def cargar_cola(self):
+        self.filas = self.db.get_ingestion_queue("ready")
+        self.filas += self.db.get_ingestion_queue("error")
+        self.tabla.setRowCount(0)
+        for fila_idx, fila in enumerate(self.filas):
+            _, ruta, id_sender, status, data, matches, warnings, error, _ = fila
+            data = json.loads(data) if data else {}
+            matches = json.loads(matches) if matches else []
+            observaciones = json.loads(warnings) if warnings else []
+            if error:
+                observaciones = [error]
+            en_catalogo = ""  # sin remitente no se empareja
+            if id_sender is not None and matches:
+                en_catalogo = f"{sum(1 for m in matches if m)}/{len(matches)}"
+            datos = [
+                os.path.basename(ruta),
+                status,
+                data.get("cliente", {}).get("cliente", ""),
+                data.get("total", ""),
+                en_catalogo,
+                "; ".join(observaciones),
+            ]
+            self.tabla.insertRow(fila_idx)
+            for col_idx, dato in enumerate(datos):
+                item = QTableWidgetItem(str(dato))
+                item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+                self.tabla.setItem(fila_idx, col_idx, item)
+
+    def fila_seleccionada(self):
+        fila_idx = self.tabla.currentRow()
+        if fila_idx < 0:
+            QMessageBox.warning(self, "Error", "Selecciona un documento")
+            return None
+        return self.filas[fila_idx]
+
+    def cargar_en_formulario(self):
+        fila = self.fila_seleccionada()
+        if fila is None:
+            return
+        id_ingesta, ruta, _, status, data = fila[:5]
+        if status != "ready":
+            QMessageBox.warning(
+                self, "Error", "El documento no se pudo extraer; puedes reintentarlo"
+            )
+            return
+        self.seleccion = (id_ingesta, ruta, json.loads(data))
+        self.accept()
+
+    def reintentar(self):
+        fila = self.fila_seleccionada()
+        if fila is not None:
+            self.db.set_ingestion_status(fila[0], "pending")
+            logging.info(f"Ingesta de {fila[1]} reencolada")
+            self.cargar_cola()
+
+    def descartar(self):
+        fila = self.fila_seleccionada()
+        if fila is not None:
+            self.db.set_ingestion_status(fila[0], "discarded")
+            self.cargar_cola()
@@ -1,9 +1,8 @@
 """UI principal para el manejo de los componenetes y vistas"""
 
-import json
 import logging
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QFileSystemWatcher, Qt, QTimer
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import (
     QWidget,
@@ -15,6 +14,7 @@ from PyQt5.QtWidgets import (
     QGroupBox,
     QDialog,
     QMessageBox,
+    QInputDialog,
     QComboBox,
     QToolBar,
     QAction,
@@ -22,11 +22,15 @@ from PyQt5.QtWidgets import (
 )
 
 from Frontend.dialogs.historial_dialog import HistorialDialog
-from Frontend.utils.Threads import TaskWorker
+from Frontend.dialogs.revision_dialog import RevisionDialog
+from Frontend.utils.Threads import IngestaWorker, OutboxWorker, TaskWorker
 
 from Backend.BoletaController import BoletaController
-from Backend.utils.img_to_json import process_image_to_json, process_pdf_to_json
+from Backend.utils.img_to_json import obtener_cliente
+from Backend.utils.ingestion import IngestionPipeline
 from DataBase.DatabaseManager import DatabaseManager
+from Scraping.scheduler import EmissionScheduler
+from Scraping.scraper_sunat import ruta_chromedriver
 from Frontend.views.cliente_view import ClienteView
 from Frontend.views.producto_view import ProductView
 from Frontend.views.resumen_view import ResumenView
@@ -53,10 +57,48 @@ class BoletaApp(QMainWindow):
         self.worker = None  # para hilos
 
         self.db = DatabaseManager()
+        self.db.create_tables()  # crea tablas faltantes y aplica migraciones
         self.productos_cache = self.db.get_products()
         self.clientes_cache = self.db.get_clients()
 
         self.controller = BoletaController(self.db)
+
+        # cola de emisión: lo que quedó a medio enviar al cerrar pudo emitirse;
+        # queda sin confirmar y se pide verificarlo apenas abre la ventana
+        por_verificar = self.db.reset_in_progress_emissions()
+        if por_verificar:
+            logging.warning(
+                f"{por_verificar} emisiones a SUNAT quedaron a medio enviar: "
+                "verificarlas en el portal"
+            )
+            QTimer.singleShot(0, self.verificar_emisiones)
+        self.db.delete_old_scraper_spans()  # tiempos del scraper: solo los recientes
+        # varios remitentes a la vez, un navegador por proceso (SUNAT_MAX_NAVEGADORES)
+        self.scheduler = EmissionScheduler()
+        self.outbox_worker = OutboxWorker(self.enviar_cola_sunat)
+        self.outbox_worker.emision_actualizada.connect(self.on_emision_actualizada)
+        self.outbox_worker.progreso.connect(self.on_progreso_cola)
+        self.outbox_worker.error.connect(
+            lambda mensaje: logging.error(f"Cola de emisión: {mensaje}")
+        )
+        # ingesta por lote: lo que quedó a medio procesar vuelve a pending
+        self.db.reset_processing_ingestions()
+        # cliente de extracción (Gemini) configurado una vez para toda la sesión
+        self.extractor = obtener_cliente()
+        self.pipeline = IngestionPipeline(
+            self.db, self.controller, extraer=self.extractor.extraer
+        )
+        self.ingesta_worker = None
+        self._cerrando = False  # closeEvent espera a los hilos
+        self.carpeta_vigilada = None
+        self.remitente_vigilado = None
+        self.vigilancia = QFileSystemWatcher(self)
+        # se espera a que terminen de copiarse los archivos antes de encolar
+        self.espera_vigilancia = QTimer(self)
+        self.espera_vigilancia.setSingleShot(True)
+        self.espera_vigilancia.setInterval(2000)
+        self.espera_vigilancia.timeout.connect(self.encolar_carpeta_vigilada)
+        self.vigilancia.directoryChanged.connect(self.espera_vigilancia.start)
         self.img_label = None
         self.tipo_documento_combo = QComboBox()
         self.tipo_documento_combo.addItems(["Boleta", "Factura"])
@@ -68,6 +110,14 @@ class BoletaApp(QMainWindow):
         self.resumen_view = ResumenView(db=self.db)
 
         self.initUI()
+        self.outbox_worker.start()
+        # ChromeDriver se resuelve ahora y no en la primera emisión
+        self.chromedriver_worker = TaskWorker(ruta_chromedriver)
+        self.chromedriver_worker.error.connect(
+            lambda mensaje: logging.warning(f"ChromeDriver no disponible: {mensaje}")
+        )
+        self.chromedriver_worker.start()
+        self.mostrar_estado_cola()
 
     def initUI(self):
         self.crear_menubar()
@@ -218,6 +268,15 @@ class BoletaApp(QMainWindow):
         action_ver_historial = QAction("Ver historial del remitente", self)
         action_ver_historial.triggered.connect(self.abrir_historial)
         menu_historial.addAction(action_ver_historial)
+        menu_historial.addAction(
+            "Verificar emisiones sin confirmar", self.verificar_emisiones
+        )
+
+        # ─── Menú Ingesta por lote ───
+        menu_ingesta = menubar.addMenu("Ingesta por lote")
+        menu_ingesta.addAction("Procesar carpeta…", self.procesar_carpeta)
+        menu_ingesta.addAction("Vigilar carpeta…", self.vigilar_carpeta)
+        menu_ingesta.addAction("Revisar documentos", self.revisar_documentos)
 
         # ─── Menú Ayuda ───
         menu_ayuda = menubar.addMenu("Ayuda")
@@ -276,13 +335,9 @@ class BoletaApp(QMainWindow):
             if not file_path.lower().endswith(".pdf"):
                 self.display_image(file_path)
 
-            # Elegir worker según tipo de archivo
-            if file_path.lower().endswith(".pdf"):
-                logging.info(f"Procesando PDF: {file_path}")
-                self.worker = TaskWorker(process_pdf_to_json, file_path)
-            else:
-                logging.info(f"Procesando imagen: {file_path}")
-                self.worker = TaskWorker(process_image_to_json, file_path)
+            # el cliente elige el prompt según el tipo de archivo
+            logging.info(f"Procesando archivo: {file_path}")
+            self.worker = TaskWorker(self.extractor.extraer, file_path)
 
             # Conectar señales
             self.worker.finished.connect(self.on_img_processed)
@@ -297,9 +352,11 @@ class BoletaApp(QMainWindow):
             )
             QMessageBox.critical(self, "Error", f"Ocurrió un error inesperado:\n{e}")
 
-    def on_img_processed(self, result):
+    def on_img_processed(self, data):
+        if data is None:
+            QMessageBox.warning(self, "Error", "No se pudo extraer la boleta")
+            return
         try:
-            data = json.loads(result)
             self.cargar_datos_img(data)
             logging.info("Imagen procesada y datos cargados correctamente.")
         except Exception as e:
@@ -357,11 +414,89 @@ class BoletaApp(QMainWindow):
         self.worker.start()
 
     def on_boleta_resultado(self, success):
+        # la boleta consumió un número de la serie: mostrar el siguiente
+        self.resumen_view.actualizar_serie_y_numero(
+            self.selected_remitente_id, self.tipo_documento_combo.currentText()
+        )
         if success:
-            QMessageBox.information(self, "Éxito", "Boleta emitida correctamente")
+            self.outbox_worker.despertar()
+            self.mostrar_estado_cola()
+            QMessageBox.information(
+                self, "Éxito", "Boleta guardada. Se enviará a SUNAT en segundo plano."
+            )
         else:
             QMessageBox.warning(self, "Error", "No se pudo emitir la boleta.")
 
+    def on_emision_actualizada(self, resultado):
+        invoice_id, status, error = resultado
+        if status == "failed":
+            QMessageBox.warning(
+                self,
+                "Envío a SUNAT",
+                f"La boleta {invoice_id} no se pudo enviar a SUNAT:\n{error}",
+            )
+        elif status == "unconfirmed":
+            self.verificar_emision(invoice_id, error)
+        self.mostrar_estado_cola()
+
+    def verificar_emisiones(self):
+        for fila in self.db.get_emission_outbox("unconfirmed"):
+            self.verificar_emision(fila[1], fila[5])
+        self.mostrar_estado_cola()
+
+    def verificar_emision(self, invoice_id, error):
+        """SUNAT no confirmó la emisión: el operador la busca en el portal y
+        la da por emitida (con su número) o la vuelve a encolar."""
+        sin_confirmar = self.db.get_emission_outbox("unconfirmed")
+        fila = next((f for f in sin_confirmar if f[1] == invoice_id), None)
+        if fila is None:
+            return
+        mensaje = QMessageBox(self)
+        mensaje.setIcon(QMessageBox.Warning)
+        mensaje.setWindowTitle("Envío a SUNAT")
+        mensaje.setText(
+            f"SUNAT no confirmó la boleta {invoice_id}:\n{error}\n\n"
+            "Búscala en SUNAT antes de volver a enviarla."
+        )
+        emitida = mensaje.addButton("Está emitida", QMessageBox.AcceptRole)
+        no_emitida = mensaje.addButton("No está emitida", QMessageBox.DestructiveRole)
+        mensaje.addButton("Verificar después", QMessageBox.RejectRole)
+        mensaje.exec_()
+
+        if mensaje.clickedButton() is emitida:
+            numero, ok = QInputDialog.getText(
+                self, "Envío a SUNAT", "Número asignado por SUNAT (p. ej. EB01-25):"
+            )
+            if ok and numero.strip():
+                self.db.confirm_emission(fila[0], numero.strip())
+        elif mensaje.clickedButton() is no_emitida:
+            self.db.retry_emission(fila[0])
+            self.outbox_worker.despertar()
+
+    def enviar_cola_sunat(self):
+        """Corre en el hilo de OutboxWorker."""
+        return self.controller.enviar_emisiones_pendientes(
+            self.scheduler, progreso=self.outbox_worker.progreso.emit
+        )
+
+    def on_progreso_cola(self, estado):
+        self.statusBar().showMessage(
+            f"Enviando a SUNAT: {estado['terminados']}/{estado['total']} "
+            f"({estado['fallidos']} con error) - "
+            f"remitentes en curso: {len(estado['en_curso'])}"
+        )
+
+    def mostrar_estado_cola(self):
+        pendientes = len(self.db.get_emission_outbox("pending")) + len(
+            self.db.get_emission_outbox("in_progress")
+        )
+        fallidas = len(self.db.get_emission_outbox("failed"))
+        sin_confirmar = len(self.db.get_emission_outbox("unconfirmed"))
+        self.statusBar().showMessage(
+            f"Cola SUNAT: {pendientes} pendientes, {fallidas} fallidas, "
+            f"{sin_confirmar} sin confirmar"
+        )
+
     def on_boleta_error(self, mensaje):
         QMessageBox.critical(self, "Error crítico", f"Ocurrió un error:\n{mensaje}")
         self.enviar_button.setEnabled(True)
@@ -413,6 +548,27 @@ class BoletaApp(QMainWindow):
         self.enviar_button.setEnabled(True)
 
     def closeEvent(self, event):
+        # sin esperar a Chrome: los procesos del scheduler se terminan; lo que
+        # quedó a medias se registra sin confirmar y lo no enviado vuelve a la cola
+        self.outbox_worker.detener()
+        self.scheduler.cerrar()
+        hilos = [self.outbox_worker]
+        if self.ingesta_worker is not None:
+            self.ingesta_worker.detener()  # lo pendiente se retoma al reabrir
+            hilos.append(self.ingesta_worker)
+        activos = [hilo for hilo in hilos if hilo.isRunning()]
+        if activos:
+            # la base se cierra recién cuando ningún hilo la usa: la ventana
+            # se oculta y se vuelve a cerrar al terminar cada hilo
+            event.ignore()
+            self.hide()
+            if not self._cerrando:
+                self._cerrando = True
+                for hilo in activos:
+                    hilo.finished.connect(self.close)
+                if not any(hilo.isRunning() for hilo in activos):
+                    QTimer.singleShot(0, self.close)  # terminó antes de conectar
+            return
         self.db.close()  # Cerra la conexión
         event.accept()
 
@@ -452,3 +608,75 @@ class BoletaApp(QMainWindow):
             id_sender=self.selected_remitente_id,
         )
         dlg.exec_()
+
+    # ---- Ingesta por lote ----
+    def procesar_carpeta(self):
+        carpeta = QFileDialog.getExistingDirectory(self, "Seleccionar carpeta")
+        if not carpeta:
+            return
+        encolados = self.pipeline.encolar_carpeta(carpeta, self.selected_remitente_id)
+        logging.info(f"{len(encolados)} archivos encolados de {carpeta}")
+        if not encolados:
+            QMessageBox.information(
+                self, "Ingesta por lote", "No hay archivos nuevos en la carpeta"
+            )
+        self.iniciar_ingesta()
+
+    def vigilar_carpeta(self):
+        carpeta = QFileDialog.getExistingDirectory(self, "Carpeta a vigilar")
+        if not carpeta:
+            return
+        if self.carpeta_vigilada:
+            self.vigilancia.removePath(self.carpeta_vigilada)
+        self.carpeta_vigilada = carpeta
+        self.remitente_vigilado = self.selected_remitente_id
+        self.vigilancia.addPath(carpeta)
+        self.encolar_carpeta_vigilada()  # lo que ya estaba en la carpeta
+
+    def encolar_carpeta_vigilada(self):
+        if not self.carpeta_vigilada:
+            return
+        self.pipeline.encolar_carpeta(self.carpeta_vigilada, self.remitente_vigilado)
+        self.iniciar_ingesta()
+
+    def iniciar_ingesta(self):
+        if self.ingesta_worker is not None and self.ingesta_worker.isRunning():
+            return  # la vuelta en curso toma también lo recién encolado
+        self.ingesta_worker = IngestaWorker(self.pipeline)
+        self.ingesta_worker.progreso.connect(self.on_progreso_ingesta)
+        self.ingesta_worker.terminado.connect(self.on_ingesta_terminada)
+        self.ingesta_worker.error.connect(
+            lambda mensaje: logging.error(f"Ingesta por lote: {mensaje}")
+        )
+        self.ingesta_worker.start()
+
+    def on_progreso_ingesta(self, estado):
+        self.statusBar().showMessage(
+            f"Ingesta: {estado['terminados']}/{estado['total']} "
+            f"({estado['errores']} con error) - {estado['archivo']}"
+        )
+
+    def on_ingesta_terminada(self, resumen):
+        if not resumen["total"]:
+            return
+        self.statusBar().showMessage(
+            f"Ingesta terminada: {resumen['listos']} por revisar, "
+            f"{resumen['errores']} con error ({resumen['segundos']:.1f} s)"
+        )
+
+    def revisar_documentos(self):
+        dlg = RevisionDialog(self.db, parent=self)
+        aceptado = dlg.exec_() == QDialog.Accepted
+        self.iniciar_ingesta()  # por si se reintentó alguno
+        if not aceptado or dlg.seleccion is None:
+            return
+        id_ingesta, ruta, data = dlg.seleccion
+        try:
+            if not ruta.lower().endswith(".pdf"):
+                self.display_image(ruta)
+            self.cargar_datos_img(data)
+        except Exception as e:
+            logging.error(f"Error cargando documento de la ingesta: {e}")
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        self.db.set_ingestion_status(id_ingesta, "reviewed")
@@ -1,4 +1,5 @@
 import sys
+import threading
 import time
 from PyQt5.QtCore import QThread, pyqtSignal
 from PyQt5.QtWidgets import QApplication
@@ -22,6 +23,80 @@ class TaskWorker(QThread):
             self.error.emit(str(e))
 
 
+class OutboxWorker(QThread):
+    """Vacía la cola de emisión a SUNAT en segundo plano.
+
+    Llama a procesar_lote() (p. ej. BoletaController.enviar_lote_emisiones)
+    mientras haya trabajo y emite cada resultado (invoice_id, status, error).
+    Con la cola vacía espera `intervalo` segundos, o hasta despertar().
+    """
+
+    emision_actualizada = pyqtSignal(object)
+    progreso = pyqtSignal(object)  # avance del envío en curso (ver EmissionScheduler)
+    error = pyqtSignal(str)
+
+    def __init__(self, procesar_lote, intervalo=10.0):
+        super().__init__()
+        self.procesar_lote = procesar_lote
+        self.intervalo = intervalo
+        self._despertar = threading.Event()
+        self._detenido = False
+
+    def run(self):
+        while not self._detenido:
+            try:
+                resultados = self.procesar_lote()
+            except Exception as e:
+                self.error.emit(str(e))
+                resultados = []
+            for resultado in resultados:
+                self.emision_actualizada.emit(resultado)
+            if resultados:
+                continue
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+
+    def despertar(self):
+        """Revisa la cola ya (p. ej. después de encolar una boleta)."""
+        self._despertar.set()
+
+    def detener(self):
+        self._detenido = True
+        self._despertar.set()
+
+
+class IngestaWorker(QThread):
+    """Procesa la cola de ingesta por lote (ver IngestionPipeline).
+
+    Repite mientras haya pendientes, así los archivos que llegan durante el
+    proceso (carpeta vigilada) se toman en la siguiente vuelta.
+    """
+
+    progreso = pyqtSignal(object)  # estado después de cada archivo
+    terminado = pyqtSignal(object)  # resumen de todas las vueltas
+    error = pyqtSignal(str)
+
+    def __init__(self, pipeline):
+        super().__init__()
+        self.pipeline = pipeline
+
+    def run(self):
+        resumen = {"total": 0, "listos": 0, "errores": 0, "segundos": 0.0}
+        try:
+            while True:
+                vuelta = self.pipeline.procesar_pendientes(self.progreso.emit)
+                if not vuelta["total"]:
+                    break
+                for clave in resumen:
+                    resumen[clave] += vuelta[clave]
+        except Exception as e:
+            self.error.emit(str(e))
+        self.terminado.emit(resumen)
+
+    def detener(self):
+        self.pipeline.detener()
+
+
 if __name__ == "__main__":
     # TEST HILOS
     app = QApplication(sys.argv)
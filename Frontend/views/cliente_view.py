@@ -53,7 +53,7 @@ class ClienteView(QWidget):
             parent=self,
             row=0,
             cache=self.clientes_cache,
-            match_func=self.parent.controller.match_fuzzy,  # ya funciona con cualquier lista de tuplas
+            match_func=self.buscar_clientes,
             parse_func=parse_cliente,
         )
         self.ruc_cliente = QLineEdit()
@@ -94,6 +94,10 @@ class ClienteView(QWidget):
         main_layout.addWidget(cliente_box)
         self.setLayout(main_layout)
 
+    def buscar_clientes(self, cache, texto):
+        """Autocompletado del nombre con el índice de clientes del controller."""
+        return self.parent.controller.buscar_clientes(texto)
+
     def actualizar_tipo_documento(self):
         """Cambia automáticamente el tipo de documento a 'Factura' si se ingresa un RUC."""
         if self.ruc_cliente.text().strip():
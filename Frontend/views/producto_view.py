@@ -84,6 +84,14 @@ class ProductView(QWidget):
         self.productos_table.itemChanged.connect(self.recalcular_por_cambios)
         self.setLayout(productos_layout)
 
+    def buscar_productos(self, cache, texto):
+        """Busca en el catálogo del remitente seleccionado (o en la cache si no hay)."""
+        controller = self.parent.controller
+        id_sender = getattr(self.parent, "selected_remitente_id", None)
+        if id_sender is None:
+            return controller.match_fuzzy(cache, texto)
+        return controller.buscar_productos(id_sender, texto)
+
     def actualizar_producto_seleccionado(self, row, datos_producto):
         """Cuando el usuario elige un producto del QComboBox, actualiza la fila con sus datos."""
 
@@ -165,7 +173,7 @@ class ProductView(QWidget):
                     parent=self,
                     row=row,
                     cache=self.productos_cache,
-                    match_func=self.parent.controller.match_fuzzy,
+                    match_func=self.buscar_productos,
                     parse_func=parse_productos,
                 )
                 combo.setEditText(producto.get("descripcion", ""))
@@ -191,6 +199,66 @@ class ProductView(QWidget):
             logging.error(
                 f" Datos del producto problemático: {producto.get('descripcion')}"
             )
+            return
+
+        self.autocompletar_desde_catalogo(productos)
+
+    def autocompletar_desde_catalogo(self, productos):
+        """Empareja todas las líneas con el catálogo del remitente de una vez y
+        completa unidad, precio e IGV de las que superan el umbral de confianza."""
+        id_sender = getattr(self.parent, "selected_remitente_id", None)
+        if id_sender is None:
+            return
+        descripciones = [str(p.get("descripcion", "")) for p in productos]
+        coincidencias = self.parent.controller.emparejar_productos(
+            id_sender, descripciones
+        )
+
+        self.productos_table.blockSignals(True)
+        try:
+            for row, coincidencia in enumerate(coincidencias):
+                if coincidencia:
+                    self._aplicar_coincidencia(row, coincidencia)
+        finally:
+            self.productos_table.blockSignals(False)
+        logging.info(
+            "Autocompletadas %s de %s lineas desde el catalogo",
+            sum(1 for c in coincidencias if c),
+            len(coincidencias),
+        )
+        self.actualizar_resumen()
+
+    def _aplicar_coincidencia(self, row, coincidencia):
+        id_producto, _, nombre, unidad, precio, igv, score = coincidencia
+        cantidad_item = self.productos_table.item(row, 0)
+        try:
+            cantidad = float(cantidad_item.text()) if cantidad_item else 1
+        except ValueError:
+            cantidad = 1
+
+        combo = self.productos_table.cellWidget(row, 2)
+        if combo:
+            combo.setEditText(nombre)
+            combo.setToolTip(f"Producto del catálogo (coincidencia {score}%)")
+        unidad_combo = self.productos_table.cellWidget(row, 1)
+        if unidad_combo:
+            unidad_combo.setCurrentText(unidad)
+        igv_combo = self.productos_table.cellWidget(row, 4)
+        if igv_combo:
+            igv_combo.blockSignals(True)
+            igv_combo.setCurrentText("Sí" if igv == 1 else "No")
+            igv_combo.blockSignals(False)
+
+        total_producto = cantidad * precio
+        igv_producto = total_producto * 0.18 if igv == 1 else 0
+        self.productos_table.setItem(row, 3, QTableWidgetItem(f"S/ {precio:.2f}"))
+        self.productos_table.setItem(
+            row, 5, QTableWidgetItem(f"S/ {igv_producto:.2f}")
+        )
+        self.productos_table.setItem(
+            row, 6, QTableWidgetItem(f"S/ {total_producto:.2f}")
+        )
+        logging.debug(f"Fila {row} emparejada con producto {id_producto} ({score}%)")
 
     def obtener_datos_producto(self):
         """Toma los valores actuales de los campos y los guarda en self.data"""
@@ -526,7 +594,7 @@ class ProductView(QWidget):
             parent=self,
             row=fila,
             cache=self.productos_cache,
-            match_func=self.parent.controller.match_fuzzy,
+            match_func=self.buscar_productos,
             parse_func=parse_productos,
         )
         combo.setEditText("")
@@ -58,7 +58,8 @@ class ResumenView(QWidget):
 
         if id_sender is None:
             return
-        num_documento = self.db.get_next_invoice_number(id_sender)
+        tipo_documento = tipo_documento.upper()
+        num_documento = self.db.get_next_invoice_number(id_sender, tipo_documento)
         if num_documento is None:
             logging.error(
                 f" No se pudo obtener el número de documento para el remitente {id_sender}"
@@ -68,10 +69,10 @@ class ResumenView(QWidget):
             )
             return  # No se pudo obtener el número
 
-        # Determinar el prefijo según el tipo de documento
-        prefijo = "B" if tipo_documento == "BOLETA" else "F"
+        # Prefijo según el tipo de documento (B01 / F01)
+        prefijo = self.db.series_prefix(id_sender, tipo_documento)
 
-        serie = f"{prefijo}{id_sender:02d}-{num_documento:02d}"
+        serie = f"{prefijo}-{num_documento:02d}"
         numero = f"{num_documento:02d}"
 
         # guardar los datos
@@ -0,0 +1,199 @@
+"""Benchmark del scraper contra el portal SUNAT de prueba (mock_portal).
+
+Mide cada paso (configurar_driver, iniciar_sesion, emitir_boleta,
+agregar_producto, validate_importe_all, ...) y el tiempo total por
+documento en tres escenarios:
+  1. en frío: primera emisión (abre Chrome e inicia sesión)
+  2. en caliente: emisión con el navegador del pool ya logueado
+  3. lote: send_billing_batch con N documentos
+
+Con --comparar-llenado repite el lote con el llenado de ítems por teclado
+(SUNAT_LLENADO_JS=0) y por JavaScript, y compara el tiempo por línea.
+
+Con --perfil emision usa el Chrome headless y recortado (SUNAT_PERFIL_CHROME)
+para compararlo con el completo.
+
+No toca la instalación real: la base (donde guardar_tiempos deja los
+tiempos), las sesiones guardadas y los perfiles de Chrome van a una carpeta
+temporal que se borra al terminar.
+
+Requiere Chrome instalado. Uso:
+    python -m Scraping.benchmark --documentos 10 --productos 3 --latencia 0.2
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+PASOS = [
+    "configurar_driver",
+    "iniciar_sesion",
+    "sesion_activa",
+    "emitir_boleta",
+    "agregar_producto",
+    "validate_importe_all",
+    "grabar_documento",
+]
+
+
+class Cronometro:
+    """Reemplaza funciones de un módulo por versiones que miden su duración."""
+
+    def __init__(self):
+        self.tiempos = defaultdict(list)
+
+    def envolver(self, modulo, nombre):
+        original = getattr(modulo, nombre)
+
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.tiempos[nombre].append(time.perf_counter() - inicio)
+
+        medida.__wrapped__ = original
+        setattr(modulo, nombre, medida)
+
+    def medir(self, nombre, funcion, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        self.tiempos[nombre].append(time.perf_counter() - inicio)
+        return resultado
+
+    def resumen(self):
+        filas = []
+        for nombre, tiempos in self.tiempos.items():
+            ordenados = sorted(tiempos)
+            p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+            filas.append(
+                (nombre, len(tiempos), sum(tiempos), statistics.median(tiempos), p95)
+            )
+        return filas
+
+
+def documento_de_prueba(numero, productos=3, sender_id=1, con_dni=True):
+    items = [
+        {
+            "cantidad": 2.0,
+            "descripcion": f"PRODUCTO DE PRUEBA {i}",
+            "unidad_medida": "KILOGRAMO",
+            "precio_base": 5.0 + i,
+            "igv": 0.0,
+            "igv_total": 0.0,
+            "precio_total": 2.0 * (5.0 + i),
+        }
+        for i in range(1, productos + 1)
+    ]
+    total = round(sum(p["precio_total"] for p in items), 2)
+    return {
+        "cliente": {
+            "nombre": "CLIENTE DE PRUEBA",
+            "dni": "12345678" if con_dni else None,
+            "ruc": None,
+        },
+        "productos": items,
+        "resumen": {
+            "serie": f"B01-{numero:02d}",
+            "numero": f"{numero:02d}",
+            "sub_total": total,
+            "igv_total": 0.0,
+            "total": total,
+        },
+        "fecha": time.strftime("%d/%m/%Y"),
+        "id_remitente": str(sender_id),
+        "id_cliente": "None",
+        "tipo_documento": "BOLETA",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documentos", type=int, default=10)
+    parser.add_argument("--productos", type=int, default=3)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--comparar-llenado", action="store_true")
+    parser.add_argument("--perfil", choices=["completo", "emision"])
+    args = parser.parse_args()
+    if args.perfil:
+        os.environ["SUNAT_PERFIL_CHROME"] = args.perfil
+
+    # antes de importar el scraper, que abre su base al importarse
+    temporal = tempfile.TemporaryDirectory(prefix="benchmark_sunat_")
+    os.environ["BILLING_DB_PATH"] = os.path.join(temporal.name, "billing_system.db")
+    os.environ["SUNAT_COOKIES_DIR"] = os.path.join(temporal.name, "sesiones")
+    os.environ["SUNAT_CHROME_DATOS"] = os.path.join(temporal.name, "chrome")
+    # contra el portal de prueba siempre se emite, para medir el paso final
+    os.environ["SUNAT_EMITIR"] = "1"
+
+    from Scraping import scraper_sunat
+    from Scraping.mock_portal import crear_app, iniciar_servidor
+
+    servidor, url = iniciar_servidor(crear_app(latencia=args.latencia))
+    os.environ["URL"] = url
+    # credenciales fijas: el portal de prueba acepta cualquiera (la base
+    # temporal no tiene remitentes)
+    scraper_sunat.get_client = lambda sender_id: ("20123456789", "PRUEBA", "clave")
+
+    cronometro = Cronometro()
+    for paso in PASOS:
+        cronometro.envolver(scraper_sunat, paso)
+    scraper_sunat._pool = None  # el pool toma las funciones ya envueltas
+
+    documentos = [
+        documento_de_prueba(i, args.productos) for i in range(1, args.documentos + 3)
+    ]
+    try:
+        enviado = cronometro.medir(
+            "documento en frío",
+            scraper_sunat.send_billing_sunat,
+            documentos[0],
+            mantener_revision=False,
+        )
+        print(f"Emisión en frío: {'ok' if enviado else 'FALLÓ'}")
+        enviado = cronometro.medir(
+            "documento en caliente",
+            scraper_sunat.send_billing_sunat,
+            documentos[1],
+            mantener_revision=False,
+        )
+        print(f"Emisión en caliente: {'ok' if enviado else 'FALLÓ'}")
+
+        inicio = time.perf_counter()
+        resultados = scraper_sunat.send_billing_batch(1, documentos[2:])
+        duracion = time.perf_counter() - inicio
+        for r in resultados:
+            cronometro.tiempos["documento en lote"].append(r["segundos"])
+        enviados = sum(r["enviado"] for r in resultados)
+        print(
+            f"Lote: {enviados}/{len(resultados)} enviados en {duracion:.2f} s "
+            f"({len(resultados) / duracion * 60:.1f} documentos/min)"
+        )
+
+        if args.comparar_llenado:
+            print(f"\n{'llenado de ítems':<24}{'líneas':>7}{'p50 s':>9}{'p95 s':>9}")
+            for modo, nombre in (("0", "teclado"), ("1", "javascript")):
+                os.environ["SUNAT_LLENADO_JS"] = modo
+                lineas = Cronometro()
+                lineas.envolver(scraper_sunat, "agregar_producto")
+                scraper_sunat.send_billing_batch(1, documentos[2:])
+                medida = scraper_sunat.agregar_producto
+                scraper_sunat.agregar_producto = medida.__wrapped__
+                ((_, n, _, p50, p95),) = lineas.resumen()
+                print(f"{nombre:<24}{n:>7}{p50:>9.3f}{p95:>9.3f}")
+    finally:
+        scraper_sunat.obtener_pool().cerrar()
+        servidor.shutdown()
+        scraper_sunat.db.close()
+        temporal.cleanup()
+
+    print(f"\n{'paso':<24}{'n':>5}{'total s':>10}{'p50 s':>9}{'p95 s':>9}")
+    for nombre, n, total, p50, p95 in cronometro.resumen():
+        print(f"{nombre:<24}{n:>5}{total:>10.2f}{p50:>9.3f}{p95:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
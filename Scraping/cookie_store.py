@@ -0,0 +1,169 @@
+"""Sesiones SUNAT guardadas por remitente, cifradas en disco.
+
+Después de iniciar sesión se guardan las cookies del navegador (cifradas
+con Fernet) para que un navegador nuevo, p. ej. tras reiniciar la app,
+pueda restaurar la sesión sin volver a pasar por el formulario de login.
+Si la sesión ya expiró en SUNAT el scraper la descarta y hace el login
+completo.
+
+La clave nunca se guarda junto a las sesiones: se toma de
+SUNAT_COOKIES_CLAVE (una clave Fernet) o del almacén de credenciales del
+sistema (keyring: Credential Manager, Keychain o Secret Service), donde se
+genera la primera vez. cryptography y keyring son opcionales: sin ellas (o
+sin clave) no se guarda nada y siempre se inicia sesión con usuario y clave.
+"""
+
+import json
+import logging
+import os
+import time
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # dependencia opcional
+    Fernet = None
+    InvalidToken = ValueError
+
+try:
+    import keyring
+    from keyring.errors import KeyringError
+except ImportError:  # dependencia opcional
+    keyring = None
+    KeyringError = Exception
+
+# entrada de la clave Fernet en el keyring del sistema
+SERVICIO_KEYRING = "billing_system"
+USUARIO_KEYRING = "sesiones_sunat"
+
+# campos de Network.getAllCookies que acepta Network.setCookies
+CAMPOS_COOKIE = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite")
+
+
+def carpeta_por_defecto():
+    return os.getenv(
+        "SUNAT_COOKIES_DIR",
+        os.path.join(os.path.expanduser("~"), ".billing_system", "sesiones"),
+    )
+
+
+def clave_del_sistema():
+    """Clave Fernet del keyring del sistema (se genera la primera vez), o
+    None si keyring no está instalado o no hay un almacén disponible."""
+    if keyring is None:
+        return None
+    try:
+        clave = keyring.get_password(SERVICIO_KEYRING, USUARIO_KEYRING)
+        if not clave:
+            nueva = Fernet.generate_key().decode("ascii")
+            keyring.set_password(SERVICIO_KEYRING, USUARIO_KEYRING, nueva)
+            # otro proceso pudo guardar la suya al mismo tiempo: vale la última
+            clave = keyring.get_password(SERVICIO_KEYRING, USUARIO_KEYRING)
+        return clave
+    except KeyringError as e:
+        logging.warning(f"No se pudo usar el keyring del sistema: {e}")
+        return None
+
+
+def cookies_para_restaurar(cookies):
+    """Cookies de CDP listas para Network.setCookies (sin campos de solo
+    lectura como size o session)."""
+    restaurables = []
+    for cookie in cookies:
+        limpia = {campo: cookie[campo] for campo in CAMPOS_COOKIE if campo in cookie}
+        if not cookie.get("session") and cookie.get("expires", -1) > 0:
+            limpia["expires"] = cookie["expires"]
+        restaurables.append(limpia)
+    return restaurables
+
+
+class CookieStore:
+    """Una sesión cifrada por remitente: sesion_<sender_id>.bin.
+
+    Cada sesión guarda las cookies, la URL del menú y la cuenta (RUC y
+    usuario) con la que se inició, para no restaurarla si el remitente
+    cambió de credenciales. Las de más de max_edad segundos no se usan.
+    """
+
+    def __init__(self, carpeta=None, clave=None, max_edad=8 * 3600, reloj=time.time):
+        self.carpeta = carpeta or carpeta_por_defecto()
+        self.max_edad = max_edad
+        self._reloj = reloj
+        self._fernet = None
+        if Fernet is None:
+            logging.info("cryptography no está instalado: no se guardan sesiones")
+            return
+        self._borrar_clave_antigua()
+        clave = clave or os.getenv("SUNAT_COOKIES_CLAVE") or clave_del_sistema()
+        if not clave:
+            logging.info("Sin SUNAT_COOKIES_CLAVE ni keyring: no se guardan sesiones")
+            return
+        self._fernet = Fernet(clave)
+
+    @property
+    def disponible(self):
+        return self._fernet is not None
+
+    def guardar(self, sender_id, cookies, url, cuenta):
+        if not self.disponible:
+            return
+        datos = {
+            "cookies": cookies,
+            "url": url,
+            "cuenta": list(cuenta),
+            "guardado": self._reloj(),
+        }
+        cifrado = self._fernet.encrypt(json.dumps(datos).encode("utf-8"))
+        ruta = self._ruta(sender_id)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            with open(temporal, "wb") as archivo:
+                archivo.write(cifrado)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la sesión de {sender_id}: {e}")
+
+    def cargar(self, sender_id, cuenta):
+        """{"cookies", "url"} de la sesión guardada, o None si no hay, es de
+        otra cuenta, está vencida o no se puede descifrar."""
+        if not self.disponible:
+            return None
+        try:
+            with open(self._ruta(sender_id), "rb") as archivo:
+                datos = json.loads(self._fernet.decrypt(archivo.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, InvalidToken, ValueError) as e:
+            logging.warning(f"Sesión guardada ilegible del remitente {sender_id}: {e}")
+            self.borrar(sender_id)
+            return None
+        if datos.get("cuenta") != list(cuenta):
+            self.borrar(sender_id)  # cambiaron el RUC o el usuario del remitente
+            return None
+        if self._reloj() - datos.get("guardado", 0) > self.max_edad:
+            self.borrar(sender_id)
+            return None
+        return {"cookies": datos["cookies"], "url": datos["url"]}
+
+    def borrar(self, sender_id):
+        try:
+            os.remove(self._ruta(sender_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"No se pudo borrar la sesión de {sender_id}: {e}")
+
+    # -- internos --
+    def _ruta(self, sender_id):
+        return os.path.join(self.carpeta, f"sesion_{sender_id}.bin")
+
+    def _borrar_clave_antigua(self):
+        # versiones anteriores dejaban la clave junto a las sesiones; sus
+        # sesiones ya no se pueden descifrar y se descartan al cargarlas
+        try:
+            os.remove(os.path.join(self.carpeta, "clave.key"))
+            logging.info("Clave de sesiones antigua borrada de la carpeta de sesiones")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"No se pudo borrar la clave antigua de sesiones: {e}")
@@ -0,0 +1,319 @@
+"""Portal SUNAT de prueba (Flask) para correr el scraper sin el sitio real.
+
+Reproduce lo que usa Scraping/scraper_sunat.py: los IDs del login y del
+menú, el iframe iframeApplication con los formularios de boleta y factura,
+el overlay waitMessage_underlay, el autollenado de inicio.razonSocial al
+salir de inicio.numeroDocumento, el diálogo de ítems, el total
+(boleta.totalGeneral / factura.totalGeneral) y la emisión final, que
+muestra el número asignado en boleta.numeroComprobante /
+factura.numeroComprobante. La latencia del login, de
+cada página, de la consulta al padrón y del overlay es configurable para
+que los benchmarks sean repetibles.
+
+Uso:
+    python -m Scraping.mock_portal --latencia 0.3
+    # y en .env: URL=http://127.0.0.1:5005/
+"""
+
+import argparse
+import threading
+import time
+
+from flask import Flask, jsonify, redirect, render_template_string, request, session
+
+IGV = 0.18
+SERIES = {"boleta": "EB01", "factura": "E001"}  # series del emisor electrónico SOL
+
+LOGIN_HTML = """<!doctype html>
+<html><head><title>SUNAT - Operaciones en Línea</title></head>
+<body>
+  <form method="post" action="/login">
+    <input id="txtRuc" name="ruc" maxlength="11">
+    <input id="txtUsuario" name="usuario">
+    <input id="txtContrasena" name="contrasena" type="password">
+    <button id="btnAceptar" type="submit">Iniciar sesión</button>
+  </form>
+  {% if error %}<div id="divMensajeError">{{ error }}</div>{% endif %}
+</body></html>
+"""
+
+MENU_HTML = """<!doctype html>
+<html><head><title>SUNAT - Menú SOL</title>
+<style>.opcion { display: none; cursor: pointer; }</style></head>
+<body>
+  <input id="txtBusca" placeholder="Buscar opción">
+  <div id="menu">
+    <div class="opcion" data-clave="boleta">
+      <span onclick="abrir('boleta')">Emitir Boleta de Venta</span>
+    </div>
+    <div class="opcion" id="nivel4_11_5_3_1_1" data-clave="factura">
+      <span><span onclick="abrir('factura')">Emitir Factura</span></span>
+    </div>
+  </div>
+  <iframe id="iframeApplication" name="iframeApplication"
+          style="width: 100%; height: 900px; border: 0"></iframe>
+  <script>
+    // las opciones aparecen al escribir en el buscador, como en SOL
+    document.getElementById("txtBusca").addEventListener("input", function () {
+      var texto = this.value.toLowerCase();
+      document.querySelectorAll(".opcion").forEach(function (opcion) {
+        var visible = texto && texto.indexOf(opcion.dataset.clave) >= 0;
+        opcion.style.display = visible ? "block" : "none";
+      });
+    });
+    function abrir(tipo) {
+      document.getElementById("iframeApplication").src = "/app/" + tipo;
+    }
+  </script>
+</body></html>
+"""
+
+DOCUMENTO_HTML = """<!doctype html>
+<html><head><title>Emisión de {{ tipo }}</title>
+<style>
+  #waitMessage_underlay { display: none; position: fixed; inset: 0;
+                          background: rgba(0, 0, 0, .3); z-index: 100; }
+  #documento, #item, #emitido { display: none; }
+  [id$="_label"] { cursor: pointer; border: 1px solid #888; padding: 2px 6px; }
+</style></head>
+<body>
+  <div id="waitMessage_underlay"></div>
+
+  <div id="inicio">
+    {% if tipo == "boleta" %}
+    <input id="inicio.tipoDocumento">
+    {% endif %}
+    <input id="inicio.numeroDocumento">
+    <input id="inicio.razonSocial" readonly>
+    {% if tipo == "factura" %}
+    <input type="radio" id="inicio.subTipoEstEmi00" name="establecimiento">
+    {% endif %}
+    <span id="inicio.botonGrabarDocumento_label" onclick="continuar()">Continuar</span>
+  </div>
+
+  <div id="documento">
+    <input id="{{ tipo }}.fechaEmision">
+    {% if tipo == "boleta" %}
+    <button id="boleta.addItemButton" onclick="abrirItem()">Adicionar</button>
+    {% else %}
+    <span id="factura.addItemButton_label" onclick="abrirItem()">Adicionar</span>
+    {% endif %}
+    <table id="items"></table>
+    <input id="{{ tipo }}.totalGeneral" value="S/ 0.00" readonly>
+    <span id="{{ tipo }}.botonGrabarDocumento_label" onclick="emitir()">Emitir</span>
+  </div>
+
+  <div id="emitido">
+    {{ tipo|capitalize }} emitida: <span id="{{ tipo }}.numeroComprobante"></span>
+  </div>
+
+  <div id="item">
+    <input type="radio" id="item.subTipoTI01" name="subTipo" value="BIEN">
+    <input id="item.cantidad" name="cantidad">
+    <input id="item.unidadMedida">
+    <textarea id="item.descripcion"></textarea>
+    <input id="item.precioUnitario">
+    <input type="checkbox" id="item.subTipoTB01">
+    <span id="item.botonAceptar_label" onclick="aceptarItem()">Aceptar</span>
+  </div>
+
+  <script>
+    var LATENCIA_MS = {{ latencia_ms }};
+    var total = 0;
+    function $(id) { return document.getElementById(id); }
+
+    // overlay de "procesando" mientras el portal trabaja
+    function ocupado(despues) {
+      $("waitMessage_underlay").style.display = "block";
+      setTimeout(function () {
+        $("waitMessage_underlay").style.display = "none";
+        if (despues) despues();
+      }, LATENCIA_MS);
+    }
+
+    var tipoDocumento = $("inicio.tipoDocumento");
+    if (tipoDocumento) {
+      tipoDocumento.addEventListener("keydown", function (e) {
+        if (e.key !== "Enter") return;
+        // SIN DOCUMENTO: la razón social se escribe a mano
+        $("inicio.razonSocial").readOnly = this.value.indexOf("SIN DOCUMENTO") < 0;
+      });
+    }
+
+    // al salir del número de documento se consulta el padrón
+    $("inicio.numeroDocumento").addEventListener("change", function () {
+      var numero = this.value.trim();
+      $("inicio.razonSocial").value = "";
+      fetch("/api/padron?numero=" + encodeURIComponent(numero))
+        .then(function (r) { return r.json(); })
+        .then(function (datos) { $("inicio.razonSocial").value = datos.razonSocial; });
+    });
+
+    function continuar() {
+      if (!$("inicio.razonSocial").value.trim()) return;
+      ocupado(function () {
+        $("inicio").style.display = "none";
+        $("documento").style.display = "block";
+      });
+    }
+
+    function emitir() {
+      if (!(total > 0)) return;
+      $("waitMessage_underlay").style.display = "block";
+      fetch("/api/emitir/{{ tipo }}", { method: "POST" })
+        .then(function (r) { return r.json(); })
+        .then(function (datos) {
+          $("waitMessage_underlay").style.display = "none";
+          $("documento").style.display = "none";
+          $("{{ tipo }}.numeroComprobante").textContent = datos.numero;
+          $("emitido").style.display = "block";
+        });
+    }
+
+    function abrirItem() {
+      ocupado(function () { $("item").style.display = "block"; });
+    }
+
+    function aceptarItem() {
+      var cantidad = parseFloat($("item.cantidad").value);
+      var precio = parseFloat($("item.precioUnitario").value);
+      if (!$("item.subTipoTI01").checked || !(cantidad > 0) || isNaN(precio)) return;
+      var exonerado = $("item.subTipoTB01").checked;
+      var importe = cantidad * precio * (exonerado ? 1 : 1 + {{ igv }});
+      total += Math.round(importe * 100) / 100;
+
+      var fila = $("items").insertRow();
+      fila.insertCell().textContent = $("item.descripcion").value;
+      fila.insertCell().textContent = importe.toFixed(2);
+
+      ["item.cantidad", "item.unidadMedida", "item.descripcion",
+       "item.precioUnitario"].forEach(function (id) { $(id).value = ""; });
+      $("item.subTipoTI01").checked = false;
+      $("item.subTipoTB01").checked = false;
+      $("item").style.display = "none";
+      ocupado(function () {
+        $("{{ tipo }}.totalGeneral").value = "S/ " + total.toFixed(2);
+      });
+    }
+  </script>
+</body></html>
+"""
+
+
+def crear_app(latencia=0.0, duracion_sesion=None, credenciales=None, padron=None):
+    """Crea el portal de prueba.
+
+    latencia: segundos que tardan el login, cada página del iframe, la
+        consulta al padrón y el overlay.
+    duracion_sesion: segundos hasta que la sesión expira (None = no expira).
+    credenciales: {ruc: (usuario, contraseña)}; None acepta cualquiera.
+    padron: {dni_o_ruc: razón social} para el autollenado.
+    """
+    app = Flask(__name__)
+    app.secret_key = "portal-sunat-de-prueba"
+    app.config.update(
+        LATENCIA=latencia,
+        DURACION_SESION=duracion_sesion,
+        CREDENCIALES=credenciales,
+        PADRON=padron or {},
+        EMITIDOS={"boleta": 0, "factura": 0},
+    )
+    lock_emision = threading.Lock()
+
+    def esperar():
+        if app.config["LATENCIA"]:
+            time.sleep(app.config["LATENCIA"])
+
+    def sesion_valida():
+        inicio = session.get("inicio")
+        if inicio is None:
+            return False
+        duracion = app.config["DURACION_SESION"]
+        return duracion is None or time.time() - inicio < duracion
+
+    @app.route("/")
+    def login():
+        return render_template_string(LOGIN_HTML, error=None)
+
+    @app.route("/login", methods=["POST"])
+    def autenticar():
+        esperar()
+        ruc = request.form.get("ruc", "")
+        usuario = request.form.get("usuario", "")
+        contrasena = request.form.get("contrasena", "")
+        credenciales = app.config["CREDENCIALES"]
+        if credenciales is None:
+            valido = bool(ruc and usuario and contrasena)
+        else:
+            valido = credenciales.get(ruc) == (usuario, contrasena)
+        if not valido:
+            error = "El número de RUC, usuario o clave SOL no es correcto"
+            return render_template_string(LOGIN_HTML, error=error), 401
+        session["inicio"] = time.time()
+        session["ruc"] = ruc
+        return redirect("/menu")
+
+    @app.route("/menu")
+    def menu():
+        if not sesion_valida():
+            return redirect("/")
+        return render_template_string(MENU_HTML)
+
+    @app.route("/app/<tipo>")
+    def documento(tipo):
+        if tipo not in ("boleta", "factura"):
+            return "Opción no encontrada", 404
+        if not sesion_valida():
+            return redirect("/")
+        esperar()
+        return render_template_string(
+            DOCUMENTO_HTML,
+            tipo=tipo,
+            igv=IGV,
+            latencia_ms=int(app.config["LATENCIA"] * 1000),
+        )
+
+    @app.route("/api/padron")
+    def consultar_padron():
+        if not sesion_valida():
+            return jsonify(error="Sesión expirada"), 401
+        esperar()
+        numero = request.args.get("numero", "").strip()
+        razon_social = app.config["PADRON"].get(numero, f"CLIENTE {numero}")
+        return jsonify(numero=numero, razonSocial=razon_social)
+
+    @app.route("/api/emitir/<tipo>", methods=["POST"])
+    def emitir(tipo):
+        if tipo not in SERIES:
+            return jsonify(error="Opción no encontrada"), 404
+        if not sesion_valida():
+            return jsonify(error="Sesión expirada"), 401
+        esperar()
+        with lock_emision:
+            app.config["EMITIDOS"][tipo] += 1
+            correlativo = app.config["EMITIDOS"][tipo]
+        return jsonify(numero=f"{SERIES[tipo]}-{correlativo}")
+
+    return app
+
+
+def iniciar_servidor(app, host="127.0.0.1", port=0):
+    """Sirve la app en un hilo en segundo plano. Retorna (servidor, url);
+    servidor.shutdown() lo detiene."""
+    from werkzeug.serving import make_server
+
+    servidor = make_server(host, port, app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    return servidor, f"http://{host}:{servidor.server_port}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Portal SUNAT de prueba")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--duracion-sesion", type=float, default=None)
+    args = parser.parse_args()
+
+    print(f"URL=http://127.0.0.1:{args.port}/")
+    crear_app(args.latencia, args.duracion_sesion).run(port=args.port, threaded=True)
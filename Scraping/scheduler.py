@@ -0,0 +1,324 @@
+"""Emisión en paralelo para varios remitentes, con un navegador por proceso.
+
+Cada proceso atiende un remitente a la vez (su navegador y su sesión SUNAT
+nunca se mezclan con los de otro RUC), y cada remitente va siempre al mismo
+proceso, así su navegador logueado se reutiliza y nunca hay dos del mismo
+remitente. Los documentos de cada remitente se parten en lotes y los lotes
+se reparten por turnos entre remitentes, para que uno con 100 boletas no
+deje esperando a los demás. El número de procesos (= navegadores abiertos)
+se limita con SUNAT_MAX_NAVEGADORES: cada Chrome usa entre 300 y 500 MB de
+RAM.
+
+Cada documento se informa apenas se emite (por una cola desde el proceso),
+no al terminar su lote: si el proceso muere a mitad del lote, lo ya emitido
+queda registrado y lo que no se llegó a informar queda sin confirmar.
+"""
+
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from itertools import count
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+_avisos = None  # en cada proceso: la cola hacia el scheduler (ver _Aviso)
+
+
+def emitir_lote(sender_id, documentos, al_emitir=None):
+    """Tarea de cada proceso: emite un lote del remitente con su navegador."""
+    from Scraping import scraper_sunat
+
+    pool = scraper_sunat.obtener_pool()
+    # un navegador por proceso: se cierra el de un remitente anterior
+    for otro in pool.remitentes():
+        if otro != str(sender_id):
+            pool.descartar(otro)
+    return scraper_sunat.send_billing_batch(sender_id, documentos, al_emitir=al_emitir)
+
+
+class _Aviso:
+    """al_emitir(posicion, resultado) de un lote: manda el resultado del
+    documento al scheduler apenas se emite. Se pasa al proceso con el lote,
+    así que solo lleva el id del lote; la cola la recibe el proceso al
+    iniciar (con un executor inyectado se usa la del scheduler)."""
+
+    def __init__(self, lote_id, cola=None):
+        self.lote_id = lote_id
+        self.cola = cola
+
+    def __call__(self, posicion, resultado):
+        cola = self.cola if self.cola is not None else _avisos
+        if cola is not None:
+            cola.put((self.lote_id, posicion, resultado))
+
+
+def _cerrar_navegadores():
+    from Scraping import scraper_sunat
+
+    if scraper_sunat._pool is not None:
+        scraper_sunat._pool.cerrar()
+    scraper_sunat.cerrar_revisiones()
+
+
+def _terminar_proceso(*_):
+    # en otro hilo: el principal pudo quedar a mitad de una llamada al pool
+    hilo = threading.Thread(target=_cerrar_navegadores, daemon=True)
+    hilo.start()
+    hilo.join(10)
+    os._exit(0)
+
+
+def _inicializar_proceso(avisos=None):
+    global _avisos
+    _avisos = avisos
+    # los procesos del pool no corren atexit: el navegador se cierra al salir
+    multiprocessing.util.Finalize(None, _cerrar_navegadores, exitpriority=10)
+    # terminate() en Linux/macOS (SIGTERM): cerrar Chrome antes de salir; en
+    # Windows terminate() no avisa al proceso
+    signal.signal(signal.SIGTERM, _terminar_proceso)
+
+
+class EmissionScheduler:
+    """Reparte lotes de documentos de varios remitentes en max_procesos
+    procesos; cada remitente queda asignado a uno (ver proceso_de).
+
+    tarea(sender_id, documentos, al_emitir) -> lista de resultados alineada
+    con documentos (por defecto emitir_lote, que usa send_billing_batch);
+    al_emitir(posicion, resultado) informa cada documento apenas se emite. Se
+    puede inyectar otra tarea o un executor (p. ej. ThreadPoolExecutor o
+    contra el portal de prueba) para los tests; con él se conserva el
+    reparto por proceso, pero todo corre en ese executor.
+    """
+
+    def __init__(
+        self, max_procesos=None, tamano_lote=20, tarea=emitir_lote, executor=None
+    ):
+        if max_procesos is None:
+            max_procesos = int(os.getenv("SUNAT_MAX_NAVEGADORES", "2"))
+        self.max_procesos = max(1, max_procesos)
+        self.tamano_lote = max(1, tamano_lote)
+        self.tarea = tarea
+        self._executor = executor
+        self._executor_propio = executor is None
+        self._procesos = [None] * self.max_procesos  # un executor de 1 proceso c/u
+        self._asignados = {}  # sender_id -> índice del proceso
+        self._cerrado = False
+        self._lock = threading.Lock()  # entre ejecutar (otro hilo) y cerrar
+        self._lotes = count()
+        # resultados que los procesos informan documento a documento;
+        # SimpleQueue escribe al instante (sin hilo aparte), así lo informado
+        # no se pierde si el proceso muere justo después
+        if executor is None:
+            self._avisos = multiprocessing.get_context("spawn").SimpleQueue()
+        else:
+            self._avisos = queue.Queue()
+
+    def ejecutar(self, documentos_por_remitente, progreso=None, al_terminar=None):
+        """Emite todos los documentos y retorna {sender_id: [resultado, ...]}.
+
+        progreso(estado) se llama a medida que terminan los documentos con el
+        avance total: {"total", "terminados", "enviados", "fallidos",
+        "en_curso", "por_remitente": {sender_id: (terminados, total)}}.
+        al_terminar(sender_id, desde, resultados) registra resultados apenas
+        se conocen (uno a uno o el resto del lote al terminar), con la
+        posición del primero en la lista del remitente; cada documento se
+        informa una sola vez. Si el lote se pierde (el proceso murió o lo
+        cortó cerrar()), lo que no se llegó a informar vuelve con
+        "sin_confirmar": pudo emitirse. Después de cerrar() no se envían más
+        lotes: lo que no se envió queda como None en los resultados.
+        """
+        colas = {}
+        resultados = {}
+        for sender_id, documentos in documentos_por_remitente.items():
+            documentos = list(documentos)
+            if not documentos:
+                continue
+            resultados[sender_id] = [None] * len(documentos)
+            colas[sender_id] = deque(
+                (desde, documentos[desde : desde + self.tamano_lote])
+                for desde in range(0, len(documentos), self.tamano_lote)
+            )
+
+        estado = {
+            "total": sum(len(r) for r in resultados.values()),
+            "terminados": 0,
+            "enviados": 0,
+            "fallidos": 0,
+            "en_curso": [],
+            "por_remitente": {s: (0, len(r)) for s, r in resultados.items()},
+        }
+        turnos = deque(colas)  # remitentes con lotes por enviar, por turno
+        en_curso = {}  # future -> (sender_id, desde, lote, lote_id)
+        lotes = {}  # lote_id -> (sender_id, desde)
+        informados = {}  # lote_id -> posiciones ya registradas
+
+        def anotar(sender_id, desde, parcial):
+            resultados[sender_id][desde : desde + len(parcial)] = parcial
+            enviados = sum(1 for r in parcial if r.get("enviado"))
+            estado["terminados"] += len(parcial)
+            estado["enviados"] += enviados
+            estado["fallidos"] += len(parcial) - enviados
+            hechos, total = estado["por_remitente"][sender_id]
+            estado["por_remitente"][sender_id] = (hechos + len(parcial), total)
+            if al_terminar is not None:
+                al_terminar(sender_id, desde, parcial)
+
+        def recibir_avisos(espera=0.0):
+            recibidos = False
+            for lote_id, posicion, resultado in self._recibir_avisos(espera):
+                if lote_id not in lotes or posicion in informados[lote_id]:
+                    continue  # de otra ejecución, o ya registrado
+                informados[lote_id].add(posicion)
+                sender_id, desde = lotes[lote_id]
+                anotar(sender_id, desde + posicion, [resultado])
+                recibidos = True
+            return recibidos
+
+        while (turnos and not self._cerrado) or en_curso:
+            # llenar los procesos libres dando un lote a cada remitente por turno
+            with self._lock:
+                for _ in range(len(turnos)):
+                    if self._cerrado or len(en_curso) >= self.max_procesos:
+                        break
+                    sender_id = turnos.popleft()
+                    proceso = self.proceso_de(sender_id)
+                    ocupados = {self.proceso_de(s) for s, *_ in en_curso.values()}
+                    if proceso in ocupados:
+                        turnos.append(sender_id)  # su proceso está con otro lote
+                        continue
+                    desde, lote = colas[sender_id].popleft()
+                    executor = self._executor_activo(proceso)
+                    lote_id = next(self._lotes)
+                    # en un proceso propio la cola la pone _inicializar_proceso
+                    cola = None if self._executor_propio else self._avisos
+                    aviso = _Aviso(lote_id, cola)
+                    futuro = executor.submit(self.tarea, sender_id, lote, aviso)
+                    en_curso[futuro] = (sender_id, desde, lote, lote_id)
+                    lotes[lote_id] = (sender_id, desde)
+                    informados[lote_id] = set()
+                    if colas[sender_id]:
+                        turnos.append(sender_id)
+            if not en_curso:
+                break  # cerrado antes de enviar el siguiente lote
+            estado["en_curso"] = sorted({s for s, *_ in en_curso.values()}, key=str)
+
+            terminados, _ = wait(en_curso, timeout=0.2, return_when=FIRST_COMPLETED)
+            perdidos = any(
+                not f.cancelled() and f.exception() is not None for f in terminados
+            )
+            # si un lote se perdió, esperar lo que su proceso alcanzó a informar
+            avances = recibir_avisos(0.5 if perdidos else 0.0)
+            rotos = set()
+            for futuro in terminados:
+                sender_id, desde, lote, lote_id = en_curso.pop(futuro)
+                try:
+                    parcial = list(futuro.result())
+                    sin_confirmar, error = False, None
+                except Exception as e:
+                    logging.error(f"Falló el lote del remitente {sender_id}: {e}")
+                    if isinstance(e, BrokenProcessPool):
+                        rotos.add(self.proceso_de(sender_id))
+                    # cancelado: no llegó a empezar; si no, pudo emitir algo
+                    sin_confirmar = not futuro.cancelled()
+                    error = str(e) or type(e).__name__
+                    parcial = [None] * len(lote)
+                # lo que no se informó documento a documento, por tramos seguidos
+                tramo = []
+                for posicion, (doc, r) in enumerate(zip(lote, parcial)):
+                    if posicion in informados[lote_id]:
+                        if tramo:
+                            anotar(sender_id, desde + posicion - len(tramo), tramo)
+                        tramo = []
+                        continue
+                    informados[lote_id].add(posicion)
+                    if r is None:
+                        r = {
+                            "serie": doc.get("resumen", {}).get("serie"),
+                            "tipo_documento": doc.get("tipo_documento"),
+                            "enviado": False,
+                            "numero": None,
+                            "sin_confirmar": sin_confirmar,
+                            "error": error,
+                            "segundos": 0.0,
+                        }
+                    tramo.append(r)
+                if tramo:
+                    anotar(sender_id, desde + len(parcial) - len(tramo), tramo)
+            estado["en_curso"] = sorted({s for s, *_ in en_curso.values()}, key=str)
+            if progreso is not None and (terminados or avances):
+                progreso(dict(estado, por_remitente=dict(estado["por_remitente"])))
+            with self._lock:
+                for proceso in rotos:
+                    # el proceso murió (p. ej. Chrome sin memoria): uno nuevo
+                    self._reiniciar_executor(proceso)
+
+        return resultados
+
+    def proceso_de(self, sender_id):
+        """Índice del proceso del remitente: se asigna la primera vez (al que
+        tenga menos remitentes) y no cambia mientras viva el scheduler."""
+        if sender_id not in self._asignados:
+            carga = [0] * self.max_procesos
+            for proceso in self._asignados.values():
+                carga[proceso] += 1
+            self._asignados[sender_id] = carga.index(min(carga))
+        return self._asignados[sender_id]
+
+    def cerrar(self):
+        """Termina los procesos (y con ellos sus navegadores) sin esperarlos,
+        así no bloquea la interfaz. Los lotes que no empezaron se cancelan y
+        los que estaban en curso se cortan: ejecutar() da lo que no
+        alcanzaron a informar por sin confirmar y retorna enseguida. Si la
+        app se cierra antes de registrarlos, sus emisiones siguen in_progress
+        y al reiniciar quedan sin confirmar."""
+        with self._lock:
+            self._cerrado = True
+            if not self._executor_propio:
+                return
+            for proceso in range(self.max_procesos):
+                self._reiniciar_executor(proceso, terminar=True)
+
+    # -- internos --
+    def _recibir_avisos(self, espera=0.0):
+        """Los resultados que llegaron de los procesos; espera (s) al primero."""
+        limite = time.monotonic() + espera
+        avisos = []
+        while True:
+            while not self._avisos.empty():
+                avisos.append(self._avisos.get())
+            if avisos or time.monotonic() >= limite:
+                return avisos
+            time.sleep(0.05)
+
+    def _executor_activo(self, proceso):
+        if not self._executor_propio:
+            return self._executor
+        if self._procesos[proceso] is None:
+            # spawn: los procesos no heredan las conexiones SQLite ni Qt del padre
+            self._procesos[proceso] = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inicializar_proceso,
+                initargs=(self._avisos,),
+            )
+        return self._procesos[proceso]
+
+    def _reiniciar_executor(self, proceso, terminar=False):
+        executor = self._procesos[proceso]
+        if executor is None:
+            return
+        self._procesos[proceso] = None
+        # ProcessPoolExecutor no expone sus procesos hasta Python 3.14
+        vivos = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        if terminar:
+            for p in vivos:
+                if p.is_alive():
+                    p.terminate()
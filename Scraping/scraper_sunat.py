@@ -1,33 +1,139 @@
 """Scraping de la pagina de Sunat para enviar una boleta con .json"""
 
+import atexit
+import itertools
+import json
 import logging
 import os
+import shutil
+import threading
 import time
 
 from dotenv import load_dotenv
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    TimeoutException,
+    WebDriverException,
+)
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
 from DataBase.DatabaseManager import DatabaseManager
+from Scraping import tracing
+from Scraping.cookie_store import CookieStore, cookies_para_restaurar
+from Scraping.session_pool import SunatSessionPool
+from Scraping.tracing import WebDriverWait, medido  # mide cada espera
 
 db = DatabaseManager()
+_pool = None
+_en_revision = {}  # driver -> Timer que lo cierra al terminar la revisión
+_lock_revision = threading.Lock()
+_chromedriver = None  # ruta resuelta en este proceso
+_cookie_store = None
+_lock_chromedriver = threading.Lock()
+_perfiles = itertools.count(1)  # n de remitente_<id>_<pid>_<n>
 
 logging.getLogger("selenium").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
 
+# botón final que emite el documento llenado y campo donde el portal
+# muestra el número asignado ("EB01-25") cuando SUNAT lo acepta. No están
+# verificados contra el portal real: siguen el patrón de los IDs que sí se
+# usan ("inicio.botonGrabarDocumento_label" del paso de datos del cliente,
+# "boleta.fechaEmision", "factura.totalGeneral") y solo se prueban contra
+# Scraping/mock_portal.py. Por eso la emisión automática es opcional
+# (SUNAT_EMITIR=1, ver emision_automatica).
+BOTON_EMITIR = "{tipo}.botonGrabarDocumento_label"
+NUMERO_EMITIDO = "{tipo}.numeroComprobante"
+
+
+class EmisionSinConfirmar(Exception):
+    """Se pulsó el botón de emitir pero SUNAT no mostró la confirmación: el
+    documento pudo quedar emitido, así que no se debe reintentar solo."""
+
+
+class EmisionPendiente(EmisionSinConfirmar):
+    """Sin emisión automática: el documento quedó llenado y validado en el
+    navegador para que el operador lo emita a mano (y luego lo confirme)."""
+
 
 def slow_typing(element, text):
     """tipear lento para undected"""
     element.send_keys(text)
 
 
+def esperar_overlay(driver, timeout=20):
+    """Espera a que desaparezca el overlay de "procesando" del portal."""
+    WebDriverWait(driver, timeout).until(
+        EC.invisibility_of_element_located((By.ID, "waitMessage_underlay"))
+    )
+
+
+def leer_importe(texto):
+    """"S/ 1,234.50" -> 1234.5 (None si el campo aún no tiene un número)."""
+    try:
+        return float(str(texto).replace("S/", "").replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+class importe_listo:
+    """Condición para WebDriverWait: el total del formulario ya es definitivo.
+
+    Retorna el importe apenas coincide con el esperado; si no coincide,
+    cuando no cambió en `lecturas` consultas seguidas (el portal terminó de
+    recalcular y el total es otro).
+    """
+
+    def __init__(self, locator, esperado, lecturas=4):
+        self.locator = locator
+        self.esperado = float(esperado)
+        self.lecturas = lecturas
+        self._ultimo = None
+        self._iguales = 0
+
+    def __call__(self, driver):
+        valor = leer_importe(driver.find_element(*self.locator).get_attribute("value"))
+        if valor is not None and abs(valor - self.esperado) < 0.001:
+            return valor
+        if valor == self._ultimo:
+            self._iguales += 1
+        else:
+            self._ultimo, self._iguales = valor, 1
+        if valor is not None and self._iguales >= self.lecturas:
+            return valor
+        return False
+
+
+class valor_cargado:
+    """Condición para WebDriverWait: el campo ya tiene un valor (p. ej. la
+    razón social que el portal completa al consultar el DNI/RUC)."""
+
+    def __init__(self, locator):
+        self.locator = locator
+
+    def __call__(self, driver):
+        valor = driver.find_element(*self.locator).get_attribute("value")
+        return bool(valor and valor.strip())
+
+
+class texto_cargado:
+    """Condición para WebDriverWait: el elemento ya muestra un texto (p. ej.
+    el número del documento emitido); retorna ese texto."""
+
+    def __init__(self, locator):
+        self.locator = locator
+
+    def __call__(self, driver):
+        texto = driver.find_element(*self.locator).text
+        return texto.strip() if texto and texto.strip() else False
+
+
 def get_client(id_sender):
     """Obtiene los datos del cliente desde DB"""
 
@@ -40,7 +146,125 @@ def get_client(id_sender):
         return ruc, user, password
 
 
+# Llena el diálogo de ítem en una sola llamada (en vez de ~8 esperas y
+# clear/send_keys por campo). Usa el widget Dojo si el campo lo es, dispara
+# input/change/blur para que el portal recalcule y devuelve lo que quedó en
+# cada campo para validarlo desde Python.
+LLENAR_ITEM_JS = """
+var v = arguments[0];
+function campo(selector) { return document.querySelector(selector); }
+function asignar(el, valor) {
+    var widget = window.dijit && dijit.byId && dijit.byId(el.id);
+    if (widget) { widget.set("value", valor); } else { el.value = valor; }
+    ["input", "change", "blur"].forEach(function (tipo) {
+        el.dispatchEvent(new Event(tipo, {bubbles: true}));
+    });
+}
+var tipo = campo("input[id='item.subTipoTI01']");
+var cantidad = campo("input[name='cantidad']");
+var unidad = campo("[id='item.unidadMedida']");
+var descripcion = campo("[id='item.descripcion']");
+var precio = campo("[id='item.precioUnitario']");
+var exonerado = campo("[id='item.subTipoTB01']");
+if (!tipo || !cantidad || !unidad || !descripcion || !precio || !exonerado) {
+    return null;
+}
+if (!tipo.checked) { tipo.click(); }
+asignar(cantidad, v.cantidad);
+asignar(unidad, v.unidad_medida);
+asignar(descripcion, v.descripcion);
+asignar(precio, v.precio);
+if (exonerado.checked !== v.exonerado) { exonerado.click(); }
+return {
+    tipo: tipo.checked,
+    cantidad: cantidad.value,
+    unidad_medida: unidad.value,
+    descripcion: descripcion.value,
+    precio: precio.value,
+    exonerado: exonerado.checked
+};
+"""
+
+
+def llenado_js_activo():
+    """El llenado por JavaScript se puede apagar con SUNAT_LLENADO_JS=0."""
+    return os.getenv("SUNAT_LLENADO_JS", "1") != "0"
+
+
+def llenar_item_js(driver, valores):
+    """Llena el diálogo de ítem con un solo execute_script.
+
+    Retorna True si todos los campos quedaron con los valores pedidos; si no
+    (campo que no existe, widget que rechazó el valor) retorna False para
+    que se use el llenado por teclado.
+    """
+    try:
+        leido = driver.execute_script(LLENAR_ITEM_JS, valores)
+    except WebDriverException as e:
+        logging.warning(f"Llenado por JavaScript falló: {e}")
+        return False
+    if not leido:
+        return False
+    try:
+        return (
+            leido["tipo"]
+            and abs(float(leido["cantidad"]) - float(valores["cantidad"])) < 1e-6
+            and leido["unidad_medida"] == valores["unidad_medida"]
+            and leido["descripcion"] == valores["descripcion"]
+            and abs(float(leido["precio"]) - float(valores["precio"])) < 1e-6
+            and leido["exonerado"] == valores["exonerado"]
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def llenar_item_teclado(driver, valores):
+    """Llena el diálogo de ítem campo por campo, como lo haría una persona."""
+    # Seleccionar tipo de ítem
+    radio_button = WebDriverWait(driver, 20).until(
+        EC.element_to_be_clickable((By.XPATH, "//input[@id='item.subTipoTI01']"))
+    )
+    radio_button.click()
+
+    # Ingresar cantidad
+    campo_cantidad = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.XPATH, "//input[@name='cantidad']"))
+    )
+    campo_cantidad.clear()
+    campo_cantidad.send_keys(valores["cantidad"])
+
+    # Ingresar unidad de medida
+    unidad_medida_input = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "item.unidadMedida"))
+    )
+    unidad_medida_input.clear()
+    unidad_medida_input.send_keys(valores["unidad_medida"])
+
+    # Ingresar descripción
+    descripcion_textarea = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "item.descripcion"))
+    )
+    descripcion_textarea.clear()
+    descripcion_textarea.send_keys(valores["descripcion"])
+
+    # Ingresar precio base
+    precio_unitario_input = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "item.precioUnitario"))
+    )
+    precio_unitario_input.clear()
+    precio_unitario_input.send_keys(valores["precio"])
+
+    # sin efecto IGV: se marca (si un intento por JavaScript ya lo marcó, no
+    # se vuelve a hacer clic para no desmarcarlo)
+    igv_wait = WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.ID, "item.subTipoTB01"))
+    )
+    if igv_wait.is_selected() != valores["exonerado"]:
+        igv_wait.click()
+
+
 # Función para agregar productos
+@medido()
 def agregar_producto(driver, producto, tipo_documento):
     """Agregar un producto al sistema."""
     try:
@@ -58,10 +282,18 @@ def agregar_producto(driver, producto, tipo_documento):
         logging.debug(f"IGV: {igv}")
         logging.debug("-" * 30)
 
+        valores = {
+            "cantidad": str(cantidad),
+            "unidad_medida": unidad_medida,
+            "descripcion": descripcion,
+            # el portal pide el precio con 4 decimales
+            "precio": "{:.4f}".format(float(precio_base)),
+            # igv == 0: el producto no tiene efecto IGV
+            "exonerado": igv == 0,
+        }
+
         # Esperar que el overlay desaparezca
-        WebDriverWait(driver, 20).until(
-            EC.invisibility_of_element_located((By.ID, "waitMessage_underlay"))
-        )
+        esperar_overlay(driver)
         # entrar al agregar producto
         if tipo_documento == "Boleta":
             boton_adicionar = WebDriverWait(driver, 20).until(
@@ -73,59 +305,23 @@ def agregar_producto(driver, producto, tipo_documento):
             )
         boton_adicionar.click()
 
-        # Seleccionar tipo de ítem
-        radio_button = WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.XPATH, "//input[@id='item.subTipoTI01']"))
-        )
-        radio_button.click()
-
-        # Ingresar cantidad
-        campo_cantidad = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.XPATH, "//input[@name='cantidad']"))
-        )
-        campo_cantidad.clear()
-        campo_cantidad.send_keys(str(cantidad))
-
-        # Ingresar unidad de medida
-        unidad_medida_input = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "item.unidadMedida"))
-        )
-        unidad_medida_input.clear()
-        unidad_medida_input.send_keys(unidad_medida)
-
-        # Ingresar descripción
-        descripcion_textarea = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "item.descripcion"))
-        )
-        descripcion_textarea.clear()
-        descripcion_textarea.send_keys(descripcion)
-
-        # Ingresar precio base
-        precio_unitario_input = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "item.precioUnitario"))
+        # el diálogo está abierto cuando el tipo de ítem se puede marcar
+        WebDriverWait(driver, 20).until(
+            EC.element_to_be_clickable((By.ID, "item.subTipoTI01"))
         )
-
-        precio_unitario_input.clear()
-
-        # hacer 4 ficras para ingresar
-        precio_formateado = "{:.4f}".format(
-            float(precio_base)
-        )  # Convertir a 4 decimales
-        precio_unitario_input.send_keys(precio_formateado)
-
-        # verificar el ingresar igv antes ingresar preico base
-        if igv == 0:
-            logging.debug(f"el producto :{descripcion}  -> no tiene efecto igv")
-            # tiene efecto igv
-            igv_wait = WebDriverWait(driver, 20).until(
-                EC.presence_of_element_located((By.ID, "item.subTipoTB01"))
-            )
-            igv_wait.click()
+        if not (llenado_js_activo() and llenar_item_js(driver, valores)):
+            if llenado_js_activo():
+                logging.info("Llenado por JavaScript no validó, se usa el teclado")
+            llenar_item_teclado(driver, valores)
 
         boton_aceptar = WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.ID, "item.botonAceptar_label"))
         )
         boton_aceptar.click()
+        # el ítem quedó registrado cuando el diálogo se cierra
+        WebDriverWait(driver, 20).until(
+            EC.invisibility_of_element_located((By.ID, "item.botonAceptar_label"))
+        )
         logging.info("Producto agregado con éxito")
 
     except Exception as e:
@@ -133,34 +329,251 @@ def agregar_producto(driver, producto, tipo_documento):
 
 
 # Función para configurar el WebDriver
-def configurar_driver():
-    """Configurar el WebDriver de Chrome con las opciones adecuadas."""
-    logging.info("Configurando Drivers")
-    load_dotenv()
-
-    chrome_driver_path = ChromeDriverManager().install()
-    service = Service(executable_path=chrome_driver_path)
-
-    # Opciones de Chrome
+# Perfil "emision" (SUNAT_PERFIL_CHROME=emision): Chrome sin ventana y sin
+# descargar imágenes, fuentes ni analítica. El portal funciona igual sin ellas
+# y Chrome usa bastante menos memoria y carga más rápido en equipos livianos.
+URLS_BLOQUEADAS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.svg",
+    "*.ico",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.eot",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*hotjar.com*",
+]
+
+
+def perfil_chrome():
+    """Perfil de Chrome de la instalación: "completo" (por defecto, ventana
+    maximizada como siempre) o "emision" (headless y recortado)."""
+    perfil = os.getenv("SUNAT_PERFIL_CHROME", "completo").strip().lower()
+    if perfil not in ("completo", "emision"):
+        logging.warning(f"SUNAT_PERFIL_CHROME desconocido: {perfil}, se usa completo")
+        return "completo"
+    return perfil
+
+
+def chrome_sin_ventana():
+    """True si el perfil de emisión corre headless (SUNAT_CHROME_HEADLESS=0
+    lo muestra, p. ej. para depurar)."""
+    headless = os.getenv("SUNAT_CHROME_HEADLESS", "1") != "0"
+    return perfil_chrome() == "emision" and headless
+
+
+def carpeta_datos_chrome():
+    """Carpeta base de los perfiles (SUNAT_CHROME_DATOS; vacío = sin perfil)."""
+    return os.getenv(
+        "SUNAT_CHROME_DATOS",
+        os.path.join(os.path.expanduser("~"), ".billing_system", "chrome"),
+    )
+
+
+def carpeta_perfil(sender_id):
+    """user-data-dir para un navegador nuevo del remitente, o None si
+    SUNAT_CHROME_DATOS está vacío.
+
+    Chrome no abre dos navegadores sobre el mismo perfil, y puede haber dos
+    del mismo remitente a la vez (uno en revisión y el de la siguiente
+    emisión, o dos procesos del EmissionScheduler): cada navegador usa su
+    carpeta remitente_<id>_<pid>_<n>, que se borra al cerrarlo. La caché de
+    disco del portal sí es del remitente (carpeta_cache) y sobrevive.
+    """
+    base = carpeta_datos_chrome()
+    if not base:
+        return None
+    nombre = f"remitente_{sender_id}_{os.getpid()}_{next(_perfiles)}"
+    return os.path.abspath(os.path.join(base, nombre))
+
+
+def carpeta_cache(sender_id):
+    """--disk-cache-dir compartido por los navegadores del remitente."""
+    base = carpeta_datos_chrome()
+    if not base:
+        return None
+    return os.path.abspath(os.path.join(base, "cache", f"remitente_{sender_id}"))
+
+
+def opciones_chrome(perfil="completo", sender_id=None, carpeta=None):
+    """Options de Chrome para el perfil indicado. carpeta: user-data-dir
+    (por defecto una nueva de carpeta_perfil)."""
     chrome_options = Options()
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-infobars")
     chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--start-maximized")
     chrome_options.add_argument("--log-level=3")
 
+    if perfil == "emision":
+        if chrome_sin_ventana():
+            chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-background-networking")
+        chrome_options.add_argument("--mute-audio")
+        chrome_options.add_argument("--window-size=1280,900")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+        if carpeta is None and sender_id is not None:
+            carpeta = carpeta_perfil(sender_id)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+            chrome_options.add_argument(f"--user-data-dir={carpeta}")
+            cache = carpeta_cache(sender_id)
+            if cache:
+                os.makedirs(cache, exist_ok=True)
+                chrome_options.add_argument(f"--disk-cache-dir={cache}")
+    else:
+        chrome_options.add_argument("--start-maximized")
+
     lista = ["enable-automation", "enable-logging"]
     chrome_options.add_experimental_option("excludeSwitches", lista)
+    return chrome_options
+
+
+def bloquear_recursos(driver):
+    """Bloquea imágenes, fuentes y analítica con CDP (Network.setBlockedURLs)."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": URLS_BLOQUEADAS})
+    except WebDriverException as e:
+        logging.warning(f"No se pudieron bloquear recursos: {e}")
+
+
+def archivo_cache_chromedriver():
+    """JSON con la ruta del ChromeDriver resuelto y la versión de Chrome."""
+    return os.getenv(
+        "SUNAT_CHROMEDRIVER_CACHE",
+        os.path.join(os.path.expanduser("~"), ".billing_system", "chromedriver.json"),
+    )
+
+
+def version_chrome():
+    """Versión del Chrome instalado (consulta local, sin red) o None."""
+    try:
+        return ChromeDriverManager().driver.get_browser_version_from_os()
+    except Exception as e:
+        logging.warning(f"No se pudo leer la versión de Chrome: {e}")
+        return None
+
+
+def _leer_cache_chromedriver():
+    try:
+        with open(archivo_cache_chromedriver(), encoding="utf-8") as archivo:
+            guardado = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(guardado, dict) or not os.path.isfile(guardado.get("ruta", "")):
+        return None
+    return guardado
+
+
+def _guardar_cache_chromedriver(ruta, version):
+    archivo = archivo_cache_chromedriver()
+    try:
+        os.makedirs(os.path.dirname(archivo) or ".", exist_ok=True)
+        temporal = f"{archivo}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as salida:
+            json.dump({"ruta": ruta, "version_chrome": version}, salida)
+        os.replace(temporal, archivo)  # otros procesos nunca leen un JSON a medias
+    except OSError as e:
+        logging.warning(f"No se pudo guardar la caché de ChromeDriver: {e}")
+
+
+def ruta_chromedriver():
+    """Ruta del ChromeDriver, resuelta una sola vez por proceso.
+
+    ChromeDriverManager().install() consulta versiones por red en cada
+    llamada, así que la ruta se guarda en memoria y en disco junto con la
+    versión de Chrome; mientras Chrome no cambie de versión no se vuelve a
+    llamar. Con SUNAT_CHROMEDRIVER_OFFLINE=1 se usa el binario guardado sin
+    ninguna consulta (ni siquiera la versión de Chrome).
+    """
+    global _chromedriver
+    with _lock_chromedriver:
+        if _chromedriver is not None and os.path.isfile(_chromedriver):
+            return _chromedriver
+
+        guardado = _leer_cache_chromedriver()
+        if os.getenv("SUNAT_CHROMEDRIVER_OFFLINE", "0") == "1":
+            if guardado is None:
+                raise FileNotFoundError(
+                    "SUNAT_CHROMEDRIVER_OFFLINE=1 pero no hay ChromeDriver en "
+                    f"{archivo_cache_chromedriver()}"
+                )
+            _chromedriver = guardado["ruta"]
+            return _chromedriver
+
+        version = version_chrome()
+        # si no se puede leer la versión de Chrome se confía en lo guardado
+        if guardado is not None and version in (None, guardado.get("version_chrome")):
+            _chromedriver = guardado["ruta"]
+            return _chromedriver
+
+        logging.info(f"Resolviendo ChromeDriver para Chrome {version}")
+        _chromedriver = ChromeDriverManager().install()
+        _guardar_cache_chromedriver(_chromedriver, version)
+        return _chromedriver
+
+
+@medido()
+def configurar_driver(sender_id=None):
+    """Configurar el WebDriver de Chrome con las opciones adecuadas."""
+    logging.info("Configurando Drivers")
+    load_dotenv()
+
+    service = Service(executable_path=ruta_chromedriver())
 
-    driver = webdriver.Chrome(options=chrome_options, service=service)
+    perfil = perfil_chrome()
+    carpeta = None
+    if perfil == "emision" and sender_id is not None:
+        carpeta = carpeta_perfil(sender_id)
+    chrome_options = opciones_chrome(perfil, sender_id, carpeta)
+    try:
+        driver = webdriver.Chrome(options=chrome_options, service=service)
+    except Exception:
+        borrar_perfil(carpeta)
+        raise
+    if carpeta:
+        # el perfil es de este navegador: se borra al cerrarlo
+        cerrar_driver = driver.quit
+
+        def quit():
+            try:
+                cerrar_driver()
+            finally:
+                borrar_perfil(carpeta)
+
+        driver.quit = quit
+    if perfil == "emision":
+        bloquear_recursos(driver)
     return driver
 
 
+def borrar_perfil(carpeta):
+    if carpeta:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+
 # Función para iniciar sesión
+@medido()
 def iniciar_sesion(driver, sender_id=1):
     """Iniciar sesión en la página utilizando credenciales de entorno."""
     try:
+        # Obtener credenciales
+        MY_RUC, MY_USER, MY_PASS = get_client(sender_id)
+        if restaurar_sesion(driver, sender_id, (MY_RUC, MY_USER)):
+            return True
+
         logging.info("Iniciando Secion en la Pagina")
         url = os.getenv("URL")
         driver.get(url)
@@ -179,9 +592,6 @@ def iniciar_sesion(driver, sender_id=1):
             EC.element_to_be_clickable((By.ID, "btnAceptar"))
         )
 
-        # Obtener credenciales
-        MY_RUC, MY_USER, MY_PASS = get_client(sender_id)
-
         # Ingresar credenciales
         slow_typing(ruc_input, MY_RUC)
         slow_typing(usuario_input, MY_USER)
@@ -189,15 +599,158 @@ def iniciar_sesion(driver, sender_id=1):
 
         # Clic en "Aceptar"
         iniciar_sesion_button.click()
+
+        # la sesión está iniciada cuando aparece el buscador del menú
+        WebDriverWait(driver, 20).until(
+            EC.presence_of_element_located((By.ID, "txtBusca"))
+        )
         logging.info("Inicio de sesión exitoso")
+        guardar_sesion(driver, sender_id, (MY_RUC, MY_USER))
+        return True
     except TimeoutException:
         logging.error("Tiempo de espera excedido durante el inicio de sesión")
     except NoSuchElementException:
         logging.critical("No se encontraron los elementos de inicio de sesión")
+    return False
+
+
+def obtener_cookie_store():
+    """Sesiones guardadas por remitente, o None si SUNAT_COOKIES=0."""
+    global _cookie_store
+    if os.getenv("SUNAT_COOKIES", "1") == "0":
+        return None
+    if _cookie_store is None:
+        _cookie_store = CookieStore(
+            max_edad=float(os.getenv("SUNAT_COOKIES_MAX_EDAD", str(8 * 3600)))
+        )
+    return _cookie_store
+
+
+@medido()
+def restaurar_sesion(driver, sender_id, cuenta):
+    """Restaura en un navegador recién abierto la sesión guardada del
+    remitente y verifica con el menú que siga activa en SUNAT. Si no hay
+    sesión guardada o expiró retorna False (y hay que iniciar sesión)."""
+    store = obtener_cookie_store()
+    if store is None or not store.disponible:
+        return False
+    if driver.current_url not in ("data:,", "about:blank", ""):
+        return False  # navegador ya usado: su sesión acaba de expirar
+    guardada = store.cargar(sender_id, cuenta)
+    if guardada is None:
+        return False
+    try:
+        cookies = cookies_para_restaurar(guardada["cookies"])
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+        driver.get(guardada["url"])
+    except WebDriverException as e:
+        logging.warning(f"No se pudo restaurar la sesión guardada: {e}")
+        store.borrar(sender_id)
+        return False
+    if sesion_activa(driver):
+        logging.info(f"Sesión SUNAT restaurada para el remitente {sender_id}")
+        return True
+    logging.info("La sesión guardada expiró, se inicia sesión con usuario y clave")
+    store.borrar(sender_id)
+    return False
+
+
+def guardar_sesion(driver, sender_id, cuenta):
+    """Guarda (cifradas) las cookies de la sesión recién iniciada."""
+    store = obtener_cookie_store()
+    if store is None or not store.disponible:
+        return
+    try:
+        cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        store.guardar(sender_id, cookies, driver.current_url, cuenta)
+    except WebDriverException as e:
+        logging.warning(f"No se pudo guardar la sesión: {e}")
+
+
+@medido()
+def sesion_activa(driver):
+    """True si el navegador sigue en el menú de SUNAT con la sesión iniciada."""
+    try:
+        driver.switch_to.default_content()
+        if driver.find_elements(By.ID, "txtRuc"):
+            return False  # la sesión expiró y volvió al login
+        return bool(driver.find_elements(By.ID, "txtBusca"))
+    except WebDriverException:
+        return False  # el navegador se cerró o no responde
+
+
+def obtener_pool():
+    """Pool de navegadores logueados, compartido por todas las emisiones."""
+    global _pool
+    if _pool is None:
+        _pool = SunatSessionPool(
+            configurar_driver,
+            iniciar_sesion,
+            sesion_activa,
+            max_inactividad=float(os.getenv("SUNAT_SESION_INACTIVIDAD", "600")),
+        )
+        _pool.iniciar_limpieza()
+        atexit.register(_pool.cerrar)
+    return _pool
+
+
+@medido()
+def grabar_documento(driver, tipo_documento="Boleta", timeout=60):
+    """Emite el documento ya llenado con el botón final del portal y espera
+    la confirmación de SUNAT. Retorna el número asignado (p. ej. "EB01-25").
+
+    Si el botón no aparece se lanza TimeoutException (no se envió nada); si
+    se pulsó y la confirmación no llega en `timeout` s, EmisionSinConfirmar.
+    """
+    tipo = tipo_documento.lower()
+    esperar_overlay(driver)
+    boton_emitir = WebDriverWait(driver, 20).until(
+        EC.element_to_be_clickable((By.ID, BOTON_EMITIR.format(tipo=tipo)))
+    )
+    boton_emitir.click()
+    try:
+        return WebDriverWait(driver, timeout).until(
+            texto_cargado((By.ID, NUMERO_EMITIDO.format(tipo=tipo)))
+        )
+    except (TimeoutException, NoSuchElementException) as e:
+        raise EmisionSinConfirmar(
+            f"SUNAT no confirmó la emisión de la {tipo_documento.lower()}"
+        ) from e
+
+
+def emision_automatica():
+    """True con SUNAT_EMITIR=1: se pulsa el botón final y se espera el número
+    de SUNAT (grabar_documento). Por defecto no: el documento queda llenado
+    en el navegador para revisarlo y emitirlo a mano, como antes."""
+    return os.getenv("SUNAT_EMITIR", "0") == "1"
 
 
+def finalizar_documento(driver, tipo_documento="Boleta"):
+    """Último paso del documento ya llenado y con el importe validado.
+
+    Con emisión automática lo emite y retorna el número de SUNAT. Si no,
+    lanza EmisionPendiente y el navegador queda en revisión; sin ventana
+    (Chrome headless) nadie podría emitirlo, así que retorna False.
+    """
+    if emision_automatica():
+        return grabar_documento(driver, tipo_documento=tipo_documento)
+    if chrome_sin_ventana():
+        logging.critical(
+            "Sin SUNAT_EMITIR=1 el documento se emite a mano y Chrome corre sin ventana"
+        )
+        return False
+    raise EmisionPendiente(
+        f"La {tipo_documento.lower()} quedó llenada en SUNAT; falta emitirla a mano"
+    )
+
+
+@medido()
 def emitir_boleta(driver, data):
-    """Función para emitir una boleta a través de la interfaz web."""
+    """Emite una boleta a través de la interfaz web.
+
+    Retorna el número que SUNAT le asignó, o False si no se emitió (ver
+    finalizar_documento para la emisión a mano).
+    """
     try:
         logging.info("emitiendo boleta")
         logging.info(f"data recibida en emitir boleta: {data}")
@@ -211,6 +764,7 @@ def emitir_boleta(driver, data):
         campo_busqueda = WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.ID, "txtBusca"))
         )
+        campo_busqueda.clear()  # el navegador se reutiliza entre emisiones
         campo_busqueda.send_keys("BOLETA")
 
         # Hacer clic en "Emitir Boleta de Venta"
@@ -244,12 +798,8 @@ def emitir_boleta(driver, data):
             # sacar el foco
             input_nro_dni.send_keys(Keys.TAB)
 
-            WebDriverWait(driver, 20).until(
-                lambda d: d.find_element(By.ID, "inicio.razonSocial")
-                .get_attribute("value")
-                .strip()
-                != ""
-            )
+            razon_social_cargada = valor_cargado((By.ID, "inicio.razonSocial"))
+            WebDriverWait(driver, 20).until(razon_social_cargada)
 
             razon_social = driver.find_element(
                 By.ID, "inicio.razonSocial"
@@ -266,7 +816,9 @@ def emitir_boleta(driver, data):
             )
             input_razon_social.send_keys(cliente)
 
-        time.sleep(1)
+        # listo para continuar: razón social cargada y sin overlay
+        WebDriverWait(driver, 20).until(valor_cargado((By.ID, "inicio.razonSocial")))
+        esperar_overlay(driver)
 
         # continuar con el proceso de ingreso
         boton_continuar = WebDriverWait(driver, 20).until(
@@ -286,19 +838,27 @@ def emitir_boleta(driver, data):
         total = data["resumen"]["total"]
         succes = validate_importe_all(driver, total)
         if not succes:
-            return None
+            return False
 
-        logging.info("boleta emitido correctamente")
+        numero = finalizar_documento(driver, tipo_documento="Boleta")
+        logging.info(f"boleta emitida correctamente: {numero}")
+        return numero
     except TimeoutException:
         logging.error("Tiempo de espera excedido durante la emisión de la boleta")
     except NoSuchElementException:
         logging.critical(
             "No se encontraron los elementos necesarios para la emisión de la boleta"
         )
+    return False
 
 
+@medido()
 def emitir_factura(driver, data):
-    """Función para emitir una factura a través de la interfaz web."""
+    """Emite una factura a través de la interfaz web.
+
+    Retorna el número que SUNAT le asignó, o False si no se emitió (ver
+    finalizar_documento para la emisión a mano).
+    """
     try:
         logging.info("emitiendo Factura")
         # datos de cliente
@@ -310,6 +870,7 @@ def emitir_factura(driver, data):
         campo_busqueda = WebDriverWait(driver, 20).until(
             EC.presence_of_element_located((By.ID, "txtBusca"))
         )
+        campo_busqueda.clear()
         campo_busqueda.send_keys("factura")
 
         # Hacer clic en "Emitir Factura"
@@ -337,12 +898,7 @@ def emitir_factura(driver, data):
         # tab para sacar el foco
         input_ruc.send_keys(Keys.TAB)
         # Esperar a que el campo de razón social se llene automáticamente
-        WebDriverWait(driver, 20).until(
-            lambda d: d.find_element(By.ID, "inicio.razonSocial")
-            .get_attribute("value")
-            .strip()
-            != ""
-        )
+        WebDriverWait(driver, 20).until(valor_cargado((By.ID, "inicio.razonSocial")))
         razon_social = driver.find_element(By.ID, "inicio.razonSocial").get_attribute(
             "value"
         )
@@ -376,33 +932,101 @@ def emitir_factura(driver, data):
 
         # Validar importe total TODO: Revisar si es necesario
         total = data["resumen"]["total"]
-        succes = validate_importe_all(driver, total)
+        succes = validate_importe_all(driver, total, tipo_documento="Factura")
         if not succes:
-            return None
+            return False
 
+        numero = finalizar_documento(driver, tipo_documento="Factura")
+        logging.info(f"factura emitida correctamente: {numero}")
+        return numero
     except TimeoutException:
         logging.error("Tiempo de espera excedido durante la emisión de la factura")
     except NoSuchElementException:
         logging.critical(
             "No se encontraron los elementos necesarios para la emisión de la factura"
         )
+    except EmisionSinConfirmar:
+        raise
     except Exception as e:
         logging.critical(f"Error inesperado: {e}")
+    return False
+
+
+def segundos_revision(mantener_revision=None):
+    """Segundos que el navegador queda abierto para revisión manual.
+
+    None toma SUNAT_MANTENER_REVISION; sin ella, 900 s si el documento se
+    emite a mano y 0 con emisión automática (SUNAT ya confirmó su número en
+    grabar_documento). True equivale a 900 s y False a 0.
+    """
+    if chrome_sin_ventana():
+        return 0.0  # sin ventana no hay nada que revisar
+    if mantener_revision is None:
+        por_defecto = "0" if emision_automatica() else "900"
+        try:
+            return max(0.0, float(os.getenv("SUNAT_MANTENER_REVISION", por_defecto)))
+        except ValueError:
+            return 0.0
+    if mantener_revision is True:
+        return 900.0
+    return max(0.0, float(mantener_revision or 0))
+
+
+def dejar_en_revision(pool, sender_id, driver, segundos):
+    """Saca el navegador del pool y lo deja abierto `segundos` para revisar
+    (o corregir) el documento a mano; después se cierra solo. No bloquea."""
+    pool.descartar(sender_id, cerrar=False)
+    logging.info(f"Navegador abierto {segundos:.0f} s para revisión manual")
+    timer = threading.Timer(segundos, _cerrar_revision, args=(driver,))
+    timer.daemon = True
+    with _lock_revision:
+        _en_revision[driver] = timer
+    timer.start()
+
+
+def _cerrar_revision(driver):
+    with _lock_revision:
+        _en_revision.pop(driver, None)
+    try:
+        driver.quit()
+    except Exception as e:
+        logging.warning(f"No se pudo cerrar el navegador en revisión: {e}")
 
 
-def send_billing_sunat(data):
-    """Envía la boleta a la SUNAT utilizando un navegador automatizado."""
+def cerrar_revisiones():
+    """Cierra los navegadores que siguen en revisión (al salir de la app)."""
+    with _lock_revision:
+        pendientes = list(_en_revision.items())
+        _en_revision.clear()
+    for driver, timer in pendientes:
+        timer.cancel()
+        _cerrar_revision(driver)
+
+
+atexit.register(cerrar_revisiones)
+
+
+def send_billing_sunat(data, mantener_revision=None):
+    """Envía la boleta a la SUNAT utilizando un navegador automatizado.
+
+    Retorna el número que SUNAT asignó al documento (solo si el portal
+    confirmó la emisión) o False si no se emitió. Lanza EmisionSinConfirmar
+    si se pulsó emitir y no llegó la confirmación, o EmisionPendiente si el
+    documento quedó llenado para emitirlo a mano. El hilo queda libre apenas
+    termina; si se pidió revisión manual (ver segundos_revision) el
+    navegador queda abierto aparte y se cierra solo.
+    """
     logging.info("Iniciando proceso de emisión en SUNAT...")
     sender_id = data.get("id_remitente", None)
     if sender_id is None:
         logging.critical("No se ha proporcionado un ID de remitente.")
-        return
+        return False
     logging.info(f"Datos cargados correctamente: {data}")
     if "productos" not in data or len(data["productos"]) == 0:
         logging.critical(
             "[ERROR] La boleta no contiene productos. No se puede enviar a SUNAT."
         )
-        return
+        return False
 
     cliente = data.get("cliente", {})
     resumen = data.get("resumen", {})
@@ -412,41 +1036,163 @@ def send_billing_sunat(data):
     logging.info(f"   - RUC: {cliente.get('ruc', 'N/A')}")
     logging.info(f"   - Total: S/ {resumen.get('total', 0):.2f}")
 
+    pool = obtener_pool()
+    driver = None
+    enviado = False
+    sin_confirmar = None
     try:
-        driver = configurar_driver()  # Configurar e iniciar el driver
-        iniciar_sesion(driver, sender_id)  # Iniciar sesión
-        if data["tipo_documento"] == "BOLETA":
-            emitir_boleta(driver, data)
-        if data["tipo_documento"] == "FACTURA":
-            emitir_factura(driver, data)
-
-        logging.info(f"{data['tipo_documento']} enviado correctamente a sunat")
-        # Tiempo para revisión manual si es necesario
-        logging.debug(
-            "Manteniendo navegador abierto por 900 segundos para revisión manual..."
-        )
-        time.sleep(900)
+        with tracing.documento(data, guardar_tiempos) as traza:
+            # navegador ya logueado del remitente (se crea solo la primera vez)
+            driver = pool.adquirir(sender_id)
+            enviado = emitir_documento(driver, data)
+            traza.ok = bool(enviado)
+
+        if enviado:
+            logging.info(f"{data['tipo_documento']} {enviado} emitido en sunat")
+        else:
+            logging.error(f"No se pudo completar la {data['tipo_documento']} en sunat")
+    except EmisionSinConfirmar as e:
+        logging.error(f"{e}; revisa el documento en SUNAT antes de reintentar")
+        sin_confirmar = e
     except Exception as e:
         logging.error(
             f"Ocurrió un error durante el proceso de facturación en SUNAT: {e}"
         )
-        logging.info("-----Corrigiendo Manualmente-------------")
-        time.sleep(900)
-    finally:
-        logging.info("Finalizando proceso de emisión en SUNAT.")
-        driver.quit()
 
+    if driver is None:
+        return False
+    revision = segundos_revision(mantener_revision)
+    if revision:
+        dejar_en_revision(pool, sender_id, driver, revision)
+    elif sin_confirmar is not None:
+        pool.descartar(sender_id)  # no se sabe en qué página quedó
+    else:
+        # el navegador vuelve al pool para la siguiente emisión
+        pool.liberar(sender_id)
+    logging.info("Finalizando proceso de emisión en SUNAT.")
+    if sin_confirmar is not None:
+        raise sin_confirmar
+    return enviado
+
+
+def guardar_tiempos(filas):
+    """Guarda los pasos medidos de un documento (ver Scraping/tracing.py)."""
+    db.insert_scraper_spans(filas)
+
+
+def emitir_documento(driver, data):
+    """Emite la boleta o factura según data["tipo_documento"]; retorna el
+    número asignado por SUNAT o False."""
+    if data["tipo_documento"] == "BOLETA":
+        return emitir_boleta(driver, data)
+    if data["tipo_documento"] == "FACTURA":
+        return emitir_factura(driver, data)
+    return False
+
+
+def send_billing_batch(sender_id, documents, mantener_revision=None, al_emitir=None):
+    """Emite varios documentos del mismo remitente con un solo inicio de sesión.
+
+    Cada documento se emite y se espera la confirmación de SUNAT antes de
+    pasar al siguiente; entonces el navegador vuelve al menú (fuera del
+    iframe) y, si la sesión expiró a mitad del lote, se vuelve a iniciar
+    sesión. Si un documento se emitió sin confirmación, su navegador se
+    descarta y el lote sigue en uno nuevo. Con revisión manual cada
+    documento queda en su propio navegador y el siguiente se emite en uno
+    nuevo. Retorna una lista alineada con documents, un dict por documento:
+    {"serie", "tipo_documento", "enviado", "numero", "sin_confirmar",
+    "error", "segundos"}; "enviado" solo es True con el número confirmado.
+    al_emitir(posicion, resultado) se llama apenas se conoce el resultado de
+    cada documento, sin esperar al resto del lote.
+    """
+    logging.info(f"Emitiendo lote de {len(documents)} documentos en SUNAT...")
+    resultados = []
+
+    def registrar(data, numero, error, inicio, sin_confirmar=False):
+        resultados.append(
+            {
+                "serie": data.get("resumen", {}).get("serie"),
+                "tipo_documento": data.get("tipo_documento"),
+                "enviado": bool(numero),
+                "numero": numero or None,
+                "sin_confirmar": sin_confirmar,
+                "error": error,
+                "segundos": round(time.perf_counter() - inicio, 3),
+            }
+        )
+        if al_emitir is not None:
+            al_emitir(len(resultados) - 1, resultados[-1])
 
-def validate_importe_all(driver, total):
+    pool = obtener_pool()
+    revision = segundos_revision(mantener_revision)
+    driver = None
+    try:
+        for data in documents:
+            inicio = time.perf_counter()
+            if str(data.get("id_remitente")) != str(sender_id):
+                registrar(data, False, "El documento es de otro remitente", inicio)
+                continue
+            if not data.get("productos"):
+                registrar(data, False, "El documento no contiene productos", inicio)
+                continue
+
+            with tracing.documento(data, guardar_tiempos) as traza:
+                numero, error, sin_confirmar = None, None, False
+                if driver is None:
+                    driver = pool.adquirir(sender_id)
+                # de vuelta al menú para buscar el formulario del siguiente documento
+                elif not sesion_activa(driver) and not iniciar_sesion(driver, sender_id):
+                    error = "La sesión de SUNAT expiró y no se pudo volver a ingresar"
+                if error is None:
+                    try:
+                        numero = emitir_documento(driver, data)
+                        if not numero:
+                            error = "No se pudo completar el documento en SUNAT"
+                    except EmisionSinConfirmar as e:
+                        error, sin_confirmar = str(e), True
+                    except Exception as e:
+                        error = str(e)
+                traza.ok = bool(numero)
+            registrar(data, numero, error, inicio, sin_confirmar)
+            logging.info(
+                f"{data['tipo_documento']} {resultados[-1]['serie']}: "
+                f"{numero or error} ({resultados[-1]['segundos']} s)"
+            )
+            if revision:
+                dejar_en_revision(pool, sender_id, driver, revision)
+                driver = None
+            elif sin_confirmar:
+                pool.descartar(sender_id)  # no se sabe en qué página quedó
+                driver = None
+    except Exception as e:
+        # sin sesión o el navegador dejó de responder: lo que falta queda sin enviar
+        logging.error(f"Lote interrumpido: {e}")
+        for data in documents[len(resultados):]:
+            registrar(data, False, str(e), time.perf_counter())
+        if driver is not None:
+            pool.descartar(sender_id)
+    else:
+        if driver is not None:
+            pool.liberar(sender_id)
+
+    enviados = sum(r["enviado"] for r in resultados)
+    logging.info(f"Lote terminado: {enviados}/{len(documents)} enviados")
+    return resultados
+
+
+@medido()
+def validate_importe_all(driver, total, tipo_documento="Boleta"):
     """validar importe del scraping con total de data"""
     try:
-        time.sleep(1)
-        input_total = WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.ID, "boleta.totalGeneral"))
+        esperar_overlay(driver)
+        # el formulario de factura usa el prefijo "factura." en sus IDs
+        locator = (By.ID, f"{tipo_documento.lower()}.totalGeneral")
+        WebDriverWait(driver, 20).until(EC.presence_of_element_located(locator))
+        # sin espera fija: listo apenas coincide o cuando deja de cambiar
+        actual_value = WebDriverWait(driver, 20, poll_frequency=0.25).until(
+            importe_listo(locator, total)
         )
 
-        actual_value = float(input_total.get_attribute("value").replace("S/ ", ""))
-
         if abs(actual_value - float(total)) < 0.001:
             logging.info(f"Importe correcto: {actual_value} ≈ {total}")
             return True
@@ -456,6 +1202,7 @@ def validate_importe_all(driver, total):
 
     except Exception as e:
         logging.critical(f"Error al validar el valor: {e}")
+        return False
 
 
 # Ejecutar el de prueba
@@ -0,0 +1,199 @@
+"""Pool de sesiones del portal SUNAT: un navegador logueado por remitente.
+
+Levantar Chrome e iniciar sesión toma 15-30 s, así que el navegador de cada
+remitente se mantiene abierto entre emisiones. Antes de reutilizarlo se
+verifica que la sesión siga activa (si expiró se vuelve a iniciar sesión, y
+si el navegador murió se crea otro). Los navegadores sin uso por más de
+max_inactividad segundos se cierran.
+"""
+
+import logging
+import threading
+import time
+
+
+class SesionSunatError(RuntimeError):
+    """No se pudo obtener una sesión iniciada para el remitente."""
+
+
+class _Sesion:
+    def __init__(self, driver=None):
+        self.driver = driver
+        self.en_uso = True
+        self.ultimo_uso = None
+
+
+class SunatSessionPool:
+    """Navegadores logueados por remitente, reutilizados entre emisiones.
+
+    Las funciones de Selenium se inyectan para poder probar el pool sin
+    navegador:
+      crear_driver(sender_id) -> driver
+      iniciar_sesion(driver, sender_id) -> bool
+      sesion_activa(driver) -> bool (por defecto se asume activa)
+      cerrar_driver(driver) (por defecto driver.quit())
+
+    Cada remitente tiene a lo sumo un navegador y lo usa una emisión a la
+    vez: adquirir() espera si otra emisión del mismo remitente lo tiene.
+    """
+
+    def __init__(
+        self,
+        crear_driver,
+        iniciar_sesion,
+        sesion_activa=None,
+        cerrar_driver=None,
+        max_inactividad=600.0,
+        intervalo_limpieza=60.0,
+        reloj=time.monotonic,
+    ):
+        self._crear_driver = crear_driver
+        self._iniciar_sesion = iniciar_sesion
+        self._sesion_activa = sesion_activa or (lambda driver: True)
+        self._cerrar_driver = cerrar_driver or (lambda driver: driver.quit())
+        self.max_inactividad = max_inactividad
+        self.intervalo_limpieza = intervalo_limpieza
+        self._reloj = reloj
+
+        self._sesiones = {}  # str(sender_id) -> _Sesion
+        self._cond = threading.Condition()
+        self._detener = threading.Event()
+        self._hilo_limpieza = None
+        self.estadisticas = {"creados": 0, "reutilizados": 0, "relogins": 0}
+
+    def __len__(self):
+        with self._cond:
+            return len(self._sesiones)
+
+    def remitentes(self):
+        """Remitentes (como str) con navegador en el pool."""
+        with self._cond:
+            return list(self._sesiones)
+
+    def adquirir(self, sender_id):
+        """Devuelve el navegador logueado del remitente (lo crea si no hay)."""
+        clave = str(sender_id)
+        with self._cond:
+            while clave in self._sesiones and self._sesiones[clave].en_uso:
+                self._cond.wait()
+            sesion = self._sesiones.get(clave)
+            if sesion is None:
+                # se reserva el lugar antes de crear el driver (fuera del lock)
+                sesion = self._sesiones[clave] = _Sesion()
+            sesion.en_uso = True
+
+        try:
+            sesion.driver = self._preparar(sesion.driver, sender_id)
+        except Exception:
+            with self._cond:
+                self._sesiones.pop(clave, None)
+                self._cond.notify_all()
+            raise
+        return sesion.driver
+
+    def liberar(self, sender_id):
+        """Devuelve el navegador al pool para la siguiente emisión."""
+        with self._cond:
+            sesion = self._sesiones.get(str(sender_id))
+            if sesion is not None:
+                sesion.en_uso = False
+                sesion.ultimo_uso = self._reloj()
+            self._cond.notify_all()
+
+    def descartar(self, sender_id, cerrar=True):
+        """Saca el navegador del pool (p. ej. tras un error en la emisión).
+
+        Con cerrar=False el navegador queda abierto y deja de ser del pool.
+        """
+        with self._cond:
+            sesion = self._sesiones.pop(str(sender_id), None)
+            self._cond.notify_all()
+        if sesion is not None and sesion.driver is not None and cerrar:
+            self._cerrar(sesion.driver)
+
+    def limpiar_inactivas(self):
+        """Cierra los navegadores sin uso por más de max_inactividad segundos."""
+        ahora = self._reloj()
+        with self._cond:
+            vencidas = [
+                clave
+                for clave, sesion in self._sesiones.items()
+                if not sesion.en_uso
+                and ahora - sesion.ultimo_uso > self.max_inactividad
+            ]
+            drivers = [self._sesiones.pop(clave).driver for clave in vencidas]
+        for clave, driver in zip(vencidas, drivers):
+            logging.info(f"Cerrando navegador inactivo del remitente {clave}")
+            self._cerrar(driver)
+        return len(vencidas)
+
+    def iniciar_limpieza(self):
+        """Hilo en segundo plano que llama a limpiar_inactivas periódicamente."""
+        if self._hilo_limpieza is not None:
+            return
+        self._detener.clear()
+
+        def bucle():
+            while not self._detener.wait(self.intervalo_limpieza):
+                self.limpiar_inactivas()
+
+        self._hilo_limpieza = threading.Thread(
+            target=bucle, name="sunat-pool-limpieza", daemon=True
+        )
+        self._hilo_limpieza.start()
+
+    def cerrar(self):
+        """Detiene la limpieza y cierra todos los navegadores."""
+        self._detener.set()
+        if self._hilo_limpieza is not None:
+            self._hilo_limpieza.join(timeout=5)
+            self._hilo_limpieza = None
+        with self._cond:
+            drivers = [s.driver for s in self._sesiones.values() if s.driver]
+            self._sesiones.clear()
+            self._cond.notify_all()
+        for driver in drivers:
+            self._cerrar(driver)
+
+    # -- internos --
+    def _preparar(self, driver, sender_id):
+        """Sesión lista para emitir: reutiliza, vuelve a loguear o recrea."""
+        if driver is not None:
+            if self._activa(driver):
+                self.estadisticas["reutilizados"] += 1
+                return driver
+            logging.info(f"Sesión SUNAT expirada del remitente {sender_id}")
+            if self._login(driver, sender_id):
+                self.estadisticas["relogins"] += 1
+                return driver
+            # el navegador no responde o no acepta el login: se reemplaza
+            self._cerrar(driver)
+
+        driver = self._crear_driver(sender_id)
+        self.estadisticas["creados"] += 1
+        if not self._login(driver, sender_id):
+            self._cerrar(driver)
+            raise SesionSunatError(
+                f"No se pudo iniciar sesión en SUNAT para el remitente {sender_id}"
+            )
+        return driver
+
+    def _activa(self, driver):
+        try:
+            return bool(self._sesion_activa(driver))
+        except Exception as e:
+            logging.warning(f"No se pudo verificar la sesión: {e}")
+            return False
+
+    def _login(self, driver, sender_id):
+        try:
+            return bool(self._iniciar_sesion(driver, sender_id))
+        except Exception as e:
+            logging.error(f"Error al iniciar sesión: {e}")
+            return False
+
+    def _cerrar(self, driver):
+        try:
+            self._cerrar_driver(driver)
+        except Exception as e:
+            logging.warning(f"No se pudo cerrar el navegador: {e}")
@@ -0,0 +1,154 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from Scraping import cookie_store
+from Scraping.cookie_store import CookieStore, cookies_para_restaurar
+
+COOKIES = [
+    {
+        "name": "ITMENUSESSION",
+        "value": "secreto-de-sesion",
+        "domain": "e-menu.sunat.gob.pe",
+        "path": "/",
+        "expires": -1,
+        "size": 30,
+        "httpOnly": True,
+        "secure": True,
+        "session": True,
+    },
+    {
+        "name": "TS01",
+        "value": "abc",
+        "domain": ".sunat.gob.pe",
+        "path": "/",
+        "expires": 1893456000.5,
+        "size": 7,
+        "httpOnly": False,
+        "secure": True,
+        "session": False,
+        "sameSite": "Lax",
+    },
+]
+CUENTA = ("20123456789", "USUARIO1")
+MENU = "https://e-menu.sunat.gob.pe/cl-ti-itmenu/MenuInternet.htm"
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+class Keyring:
+    """Almacén de credenciales del sistema falso."""
+
+    def __init__(self):
+        self.claves = {}
+
+    def get_password(self, servicio, usuario):
+        return self.claves.get((servicio, usuario))
+
+    def set_password(self, servicio, usuario, clave):
+        self.claves[(servicio, usuario)] = clave
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+@pytest.fixture
+def almacen(monkeypatch):
+    monkeypatch.delenv("SUNAT_COOKIES_CLAVE", raising=False)
+    almacen = Keyring()
+    monkeypatch.setattr(cookie_store, "keyring", almacen)
+    return almacen
+
+
+@pytest.fixture
+def store(tmp_path, reloj, almacen):
+    return CookieStore(tmp_path, max_edad=3600, reloj=reloj)
+
+
+def test_guarda_cifrado_y_restaura(store, tmp_path, reloj, almacen):
+    store.guardar(5, COOKIES, MENU, CUENTA)
+
+    contenido = (tmp_path / "sesion_5.bin").read_bytes()
+    assert b"secreto-de-sesion" not in contenido
+    assert b"20123456789" not in contenido
+    # la clave queda en el keyring, no junto a las sesiones
+    assert os.listdir(tmp_path) == ["sesion_5.bin"]
+    assert list(almacen.claves) == [("billing_system", "sesiones_sunat")]
+
+    # otro proceso (o la app reiniciada) usa la misma clave guardada
+    otro = CookieStore(tmp_path, max_edad=3600, reloj=reloj)
+    assert otro.cargar(5, CUENTA) == {"cookies": COOKIES, "url": MENU}
+    assert otro.cargar(6, CUENTA) is None
+
+
+def test_no_restaura_si_cambio_la_cuenta(store, tmp_path):
+    store.guardar(5, COOKIES, MENU, CUENTA)
+    assert store.cargar(5, ("20123456789", "OTROUSER")) is None
+    assert not (tmp_path / "sesion_5.bin").exists()
+
+
+def test_sesion_vencida(store, reloj, tmp_path):
+    store.guardar(5, COOKIES, MENU, CUENTA)
+    reloj.ahora += 3601
+    assert store.cargar(5, CUENTA) is None
+    assert not (tmp_path / "sesion_5.bin").exists()
+
+
+def test_archivo_ilegible_se_descarta(store, tmp_path):
+    store.guardar(5, COOKIES, MENU, CUENTA)
+    otra_clave = CookieStore(tmp_path, clave=Fernet.generate_key(), max_edad=3600)
+    assert otra_clave.cargar(5, CUENTA) is None
+    assert not (tmp_path / "sesion_5.bin").exists()
+
+
+def test_sin_keyring_ni_clave_no_guarda(tmp_path, monkeypatch):
+    monkeypatch.delenv("SUNAT_COOKIES_CLAVE", raising=False)
+    monkeypatch.setattr(cookie_store, "keyring", None)
+    store = CookieStore(tmp_path)
+    assert not store.disponible
+    store.guardar(5, COOKIES, MENU, CUENTA)
+    assert os.listdir(tmp_path) == []
+
+
+def test_clave_de_entorno_y_clave_antigua_borrada(tmp_path, almacen, monkeypatch):
+    (tmp_path / "clave.key").write_bytes(Fernet.generate_key())
+    clave = Fernet.generate_key()
+    monkeypatch.setenv("SUNAT_COOKIES_CLAVE", clave.decode())
+
+    store = CookieStore(tmp_path)
+    store.guardar(5, COOKIES, MENU, CUENTA)
+    assert not (tmp_path / "clave.key").exists()
+    assert almacen.claves == {}  # con SUNAT_COOKIES_CLAVE no se usa el keyring
+    assert CookieStore(tmp_path, clave=clave).cargar(5, CUENTA)["url"] == MENU
+
+
+def test_cookies_para_set_cookies():
+    assert cookies_para_restaurar(COOKIES) == [
+        {
+            "name": "ITMENUSESSION",
+            "value": "secreto-de-sesion",
+            "domain": "e-menu.sunat.gob.pe",
+            "path": "/",
+            "secure": True,
+            "httpOnly": True,
+        },
+        {
+            "name": "TS01",
+            "value": "abc",
+            "domain": ".sunat.gob.pe",
+            "path": "/",
+            "secure": True,
+            "httpOnly": False,
+            "sameSite": "Lax",
+            "expires": 1893456000.5,
+        },
+    ]
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from Scraping.benchmark import documento_de_prueba
+from Scraping.mock_portal import crear_app, iniciar_servidor
+
+
+def ids_en(html, ids):
+    return [i for i in ids if f'id="{i}"' not in html]
+
+
+@pytest.fixture
+def cliente():
+    app = crear_app(padron={"12345678": "JUAN PEREZ"})
+    return app.test_client()
+
+
+def iniciar(cliente):
+    return cliente.post(
+        "/login", data={"ruc": "20123456789", "usuario": "USER", "contrasena": "clave"}
+    )
+
+
+def test_login_con_los_ids_del_portal(cliente):
+    html = cliente.get("/").get_data(as_text=True)
+    assert ids_en(html, ["txtRuc", "txtUsuario", "txtContrasena", "btnAceptar"]) == []
+
+    respuesta = iniciar(cliente)
+    assert respuesta.status_code == 302
+    assert respuesta.headers["Location"].endswith("/menu")
+
+
+def test_menu_con_buscador_e_iframe(cliente):
+    iniciar(cliente)
+    html = cliente.get("/menu").get_data(as_text=True)
+    assert ids_en(html, ["txtBusca", "iframeApplication", "nivel4_11_5_3_1_1"]) == []
+    assert "Emitir Boleta de Venta" in html
+
+
+@pytest.mark.parametrize(
+    "tipo, ids",
+    [
+        (
+            "boleta",
+            ["inicio.tipoDocumento", "boleta.addItemButton", "boleta.fechaEmision",
+             "boleta.totalGeneral", "boleta.botonGrabarDocumento_label",
+             "boleta.numeroComprobante"],
+        ),
+        (
+            "factura",
+            ["inicio.subTipoEstEmi00", "factura.addItemButton_label",
+             "factura.fechaEmision", "factura.totalGeneral",
+             "factura.botonGrabarDocumento_label", "factura.numeroComprobante"],
+        ),
+    ],
+)
+def test_formularios_de_emision(cliente, tipo, ids):
+    iniciar(cliente)
+    html = cliente.get(f"/app/{tipo}").get_data(as_text=True)
+    comunes = [
+        "waitMessage_underlay", "inicio.numeroDocumento", "inicio.razonSocial",
+        "inicio.botonGrabarDocumento_label", "item.subTipoTI01", "item.unidadMedida",
+        "item.descripcion", "item.precioUnitario", "item.subTipoTB01",
+        "item.botonAceptar_label",
+    ]
+    assert ids_en(html, comunes + ids) == []
+    assert 'name="cantidad"' in html
+
+
+def test_padron_autocompleta_razon_social_con_latencia():
+    app = crear_app(latencia=0.1, padron={"12345678": "JUAN PEREZ"})
+    cliente = app.test_client()
+    iniciar(cliente)
+
+    inicio = time.perf_counter()
+    datos = cliente.get("/api/padron?numero=12345678").get_json()
+    assert time.perf_counter() - inicio >= 0.1
+    assert datos["razonSocial"] == "JUAN PEREZ"
+    assert cliente.get("/api/padron?numero=999").get_json()["razonSocial"] == "CLIENTE 999"
+
+
+def test_emision_asigna_numeros_correlativos(cliente):
+    assert cliente.post("/api/emitir/boleta").status_code == 401
+    iniciar(cliente)
+    numeros = [cliente.post(f"/api/emitir/{tipo}").get_json()["numero"]
+               for tipo in ("boleta", "boleta", "factura")]
+    assert numeros == ["EB01-1", "EB01-2", "E001-1"]
+    assert cliente.post("/api/emitir/nota").status_code == 404
+
+
+def test_credenciales_incorrectas():
+    app = crear_app(credenciales={"20123456789": ("USER", "clave")})
+    cliente = app.test_client()
+    respuesta = cliente.post(
+        "/login", data={"ruc": "20123456789", "usuario": "USER", "contrasena": "otra"}
+    )
+    assert respuesta.status_code == 401
+    assert cliente.get("/menu").status_code == 302
+
+
+def test_sesion_expirada_vuelve_al_login():
+    cliente = crear_app(duracion_sesion=0).test_client()
+    iniciar(cliente)
+    respuesta = cliente.get("/menu")
+    assert respuesta.status_code == 302
+    assert respuesta.headers["Location"].endswith("/")
+    assert cliente.get("/api/padron?numero=1").status_code == 401
+
+
+def test_servidor_en_segundo_plano():
+    import urllib.request
+
+    servidor, url = iniciar_servidor(crear_app())
+    try:
+        html = urllib.request.urlopen(url, timeout=5).read().decode()
+        assert 'id="txtRuc"' in html
+    finally:
+        servidor.shutdown()
+
+
+def test_documento_de_prueba_valido():
+    from Backend.models import BoletaData
+
+    BoletaData(**documento_de_prueba(1, productos=4))
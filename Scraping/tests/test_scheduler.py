@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Scraping.scheduler import EmissionScheduler
+
+
+def documentos(sender_id, n):
+    return [
+        {"id_remitente": sender_id, "resumen": {"serie": f"B{sender_id}-{i:02d}"}}
+        for i in range(1, n + 1)
+    ]
+
+
+def emitir_lento(sender_id, lote, al_emitir=None):
+    """Tarea falsa: 'emite' cada documento en 50 ms y anota proceso y tiempos."""
+    inicio = time.monotonic()
+    time.sleep(0.05 * len(lote))
+    fin = time.monotonic()
+    return [
+        {
+            "serie": doc["resumen"]["serie"],
+            "enviado": True,
+            "error": None,
+            "pid": os.getpid(),
+            "inicio": inicio,
+            "fin": fin,
+        }
+        for doc in lote
+    ]
+
+
+def emitir_o_caer(sender_id, lote, al_emitir=None):
+    if sender_id == 2:
+        raise RuntimeError("chrome sin memoria")
+    return [{"serie": doc["resumen"]["serie"], "enviado": True} for doc in lote]
+
+
+def test_procesos_en_paralelo_con_limite():
+    scheduler = EmissionScheduler(max_procesos=2, tamano_lote=2, tarea=emitir_lento)
+    avances = []
+    try:
+        resultados = scheduler.ejecutar(
+            {1: documentos(1, 4), 2: documentos(2, 4), 3: documentos(3, 2)},
+            progreso=avances.append,
+        )
+    finally:
+        scheduler.cerrar()
+
+    # resultados alineados con los documentos de cada remitente
+    for sender_id, n in ((1, 4), (2, 4), (3, 2)):
+        assert [r["serie"] for r in resultados[sender_id]] == [
+            d["resumen"]["serie"] for d in documentos(sender_id, n)
+        ]
+    registros = [r for lista in resultados.values() for r in lista]
+    assert len({r["pid"] for r in registros}) <= 2
+    assert os.getpid() not in {r["pid"] for r in registros}
+
+    # nunca más de 2 lotes a la vez, ni dos lotes del mismo remitente
+    lotes = {(s, r["inicio"], r["fin"]) for s, lista in resultados.items() for r in lista}
+    for s, inicio, _ in lotes:
+        activos = [l for l in lotes if l[1] <= inicio < l[2]]
+        assert len(activos) <= 2
+        assert len({l[0] for l in activos}) == len(activos)
+
+    assert avances[-1]["terminados"] == avances[-1]["total"] == 10
+    assert avances[-1]["enviados"] == 10
+    assert avances[-1]["por_remitente"] == {1: (4, 4), 2: (4, 4), 3: (2, 2)}
+
+
+def emitir_con_pid(sender_id, lote, al_emitir=None):
+    return [{"enviado": True, "pid": os.getpid()} for _ in lote]
+
+
+def emitir_sin_fin(sender_id, lote, al_emitir=None):
+    time.sleep(60)
+    return [{"enviado": True} for _ in lote]
+
+
+def test_cada_remitente_siempre_en_su_proceso():
+    scheduler = EmissionScheduler(max_procesos=2, tamano_lote=1, tarea=emitir_con_pid)
+    try:
+        primera = scheduler.ejecutar(
+            {1: documentos(1, 3), 2: documentos(2, 3), 3: documentos(3, 2)}
+        )
+        segunda = scheduler.ejecutar({3: documentos(3, 2), 1: documentos(1, 1)})
+    finally:
+        scheduler.cerrar()
+
+    pids = {
+        s: {r["pid"] for r in primera[s] + segunda.get(s, [])} for s in primera
+    }
+    assert all(len(p) == 1 for p in pids.values())
+    assert pids[1] != pids[2]
+    assert [scheduler.proceso_de(s) for s in (1, 2, 3)] == [0, 1, 0]
+
+
+def test_cerrar_no_espera_el_lote_en_curso():
+    scheduler = EmissionScheduler(max_procesos=1, tarea=emitir_sin_fin)
+    resultados = {}
+    hilo = threading.Thread(
+        target=lambda: resultados.update(
+            scheduler.ejecutar({1: documentos(1, 1), 2: documentos(2, 1)})
+        )
+    )
+    hilo.start()
+    limite = time.monotonic() + 20
+    while not getattr(scheduler._procesos[0], "_processes", None):
+        assert time.monotonic() < limite
+        time.sleep(0.05)
+    vivos = list(scheduler._procesos[0]._processes.values())
+
+    inicio = time.monotonic()
+    scheduler.cerrar()
+    assert time.monotonic() - inicio < 1
+    hilo.join(10)
+    assert not hilo.is_alive()
+    assert resultados[1][0]["enviado"] is False
+    assert resultados[1][0]["sin_confirmar"]  # se cortó en curso: pudo emitirse
+    assert resultados[2] == [None]  # ya no se envió
+    time.sleep(0.5)
+    assert not any(p.is_alive() for p in vivos)
+
+
+def test_turnos_entre_remitentes():
+    orden = []
+
+    def tarea(sender_id, lote, al_emitir=None):
+        orden.append(sender_id)
+        return [{"enviado": True} for _ in lote]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = EmissionScheduler(
+            max_procesos=1, tamano_lote=2, tarea=tarea, executor=executor
+        )
+        scheduler.ejecutar({"A": documentos("A", 6), "B": documentos("B", 2), "C": documentos("C", 3)})
+
+    # el remitente con más boletas no acapara el navegador
+    assert orden == ["A", "B", "C", "A", "C", "A"]
+
+
+def test_lote_fallido_no_frena_a_los_demas():
+    llamados = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = EmissionScheduler(
+            max_procesos=2, tarea=emitir_o_caer, executor=executor
+        )
+        resultados = scheduler.ejecutar(
+            {1: documentos(1, 2), 2: documentos(2, 2)},
+            al_terminar=lambda s, desde, parcial: llamados.append((s, desde, len(parcial))),
+        )
+
+    assert all(r["enviado"] for r in resultados[1])
+    assert [r["enviado"] for r in resultados[2]] == [False, False]
+    assert all(r["sin_confirmar"] for r in resultados[2])
+    assert resultados[2][0]["error"] == "chrome sin memoria"
+    assert resultados[2][1]["serie"] == "B2-02"
+    assert sorted(llamados) == [(1, 0, 2), (2, 0, 2)]
+
+
+def emitir_y_morir(sender_id, lote, al_emitir=None):
+    """Emite el primer documento y el proceso muere (p. ej. sin memoria)."""
+    serie = lote[0]["resumen"]["serie"]
+    al_emitir(0, {"serie": serie, "enviado": True, "numero": "EB01-1"})
+    os._exit(1)
+
+
+def test_proceso_muerto_a_mitad_del_lote():
+    scheduler = EmissionScheduler(max_procesos=1, tarea=emitir_y_morir)
+    llamados = []
+    try:
+        resultados = scheduler.ejecutar(
+            {1: documentos(1, 3)},
+            al_terminar=lambda s, desde, parcial: llamados.append(
+                (desde, [r.get("numero") for r in parcial])
+            ),
+        )
+    finally:
+        scheduler.cerrar()
+
+    # lo emitido llega apenas se emite; lo demás no se sabe: sin confirmar
+    assert llamados == [(0, ["EB01-1"]), (1, [None, None])]
+    assert resultados[1][0]["enviado"] and not resultados[1][0].get("sin_confirmar")
+    assert [r["sin_confirmar"] for r in resultados[1][1:]] == [True, True]
+    assert [r["serie"] for r in resultados[1][1:]] == ["B1-02", "B1-03"]
+
+
+def test_sin_documentos():
+    assert EmissionScheduler(tarea=emitir_lento).ejecutar({1: []}) == {}
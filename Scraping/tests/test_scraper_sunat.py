@@ -0,0 +1,612 @@
+import json
+import os
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+import Scraping.scraper_sunat as scraper
+from Scraping.session_pool import SunatSessionPool
+
+
+class FakeDriver:
+    cerrado = False
+
+    def quit(self):
+        self.cerrado = True
+
+
+def documento(serie, id_remitente="5", productos=1):
+    return {
+        "id_remitente": id_remitente,
+        "tipo_documento": "BOLETA",
+        "resumen": {"serie": serie},
+        "productos": [{"descripcion": "ARROZ"}] * productos,
+    }
+
+
+@pytest.fixture
+def portal(monkeypatch):
+    """Pool con drivers falsos y emitir_documento simulado (emisión automática)."""
+    monkeypatch.setenv("SUNAT_EMITIR", "1")
+    estado = {
+        "logins": 0, "emitidos": [], "activa": [], "fallar": set(), "sin_confirmar": set()
+    }
+
+    def iniciar_sesion(driver, sender_id):
+        estado["logins"] += 1
+        return True
+
+    def sesion_activa(driver):
+        return estado["activa"].pop(0) if estado["activa"] else True
+
+    def emitir_documento(driver, data):
+        serie = data["resumen"]["serie"]
+        estado["emitidos"].append(serie)
+        if serie in estado["sin_confirmar"]:
+            raise scraper.EmisionSinConfirmar("SUNAT no confirmó la emisión")
+        return False if serie in estado["fallar"] else f"EB01-{len(estado['emitidos'])}"
+
+    pool = SunatSessionPool(
+        lambda sender_id: FakeDriver(), iniciar_sesion, sesion_activa
+    )
+    monkeypatch.setattr(scraper, "_pool", pool)
+    monkeypatch.setattr(scraper, "iniciar_sesion", iniciar_sesion)
+    monkeypatch.setattr(scraper, "sesion_activa", sesion_activa)
+    monkeypatch.setattr(scraper, "emitir_documento", emitir_documento)
+    yield estado
+    pool.cerrar()
+
+
+def test_lote_con_un_solo_inicio_de_sesion(portal):
+    portal["fallar"] = {"B01-02"}
+    documentos = [
+        documento("B01-01"),
+        documento("B01-02"),
+        documento("B01-03", id_remitente="7"),
+        documento("B01-04", productos=0),
+        documento("B01-05"),
+    ]
+
+    resultados = scraper.send_billing_batch(5, documentos)
+
+    assert portal["logins"] == 1
+    assert portal["emitidos"] == ["B01-01", "B01-02", "B01-05"]
+    assert [r["serie"] for r in resultados] == [d["resumen"]["serie"] for d in documentos]
+    assert [r["enviado"] for r in resultados] == [True, False, False, False, True]
+    assert [r["numero"] for r in resultados] == ["EB01-1", None, None, None, "EB01-3"]
+    assert resultados[0]["error"] is None
+    assert all(r["error"] for r in resultados[1:4])
+    assert all(r["segundos"] >= 0 for r in resultados)
+
+
+def test_lote_sin_confirmacion_sigue_en_otro_navegador(portal):
+    portal["sin_confirmar"] = {"B01-02"}
+    resultados = scraper.send_billing_batch(
+        5, [documento("B01-01"), documento("B01-02"), documento("B01-03")]
+    )
+
+    assert [r["enviado"] for r in resultados] == [True, False, True]
+    assert [r["sin_confirmar"] for r in resultados] == [False, True, False]
+    assert resultados[1]["numero"] is None and resultados[1]["error"]
+    # el navegador del documento sin confirmar se descartó
+    assert portal["logins"] == 2
+    assert len(scraper._pool) == 1
+
+
+def test_lote_vuelve_a_iniciar_sesion_si_expira(portal):
+    # el primer documento usa la sesión recién iniciada; antes del segundo ya expiró
+    portal["activa"] = [False]
+    scraper.send_billing_batch(5, [documento("B01-01"), documento("B01-02")])
+    assert portal["logins"] == 2
+    assert portal["emitidos"] == ["B01-01", "B01-02"]
+
+
+def test_lote_guarda_los_tiempos_de_cada_documento(portal, monkeypatch):
+    monkeypatch.delenv("SUNAT_TRAZAS", raising=False)
+    guardadas = []
+    monkeypatch.setattr(scraper, "guardar_tiempos", guardadas.append)
+    portal["fallar"].add("B1-2")
+
+    scraper.send_billing_batch(5, [documento("B1-1"), documento("B1-2")])
+
+    documentos = [
+        (filas[-1][2], filas[-1][4], filas[-1][7]) for filas in guardadas
+    ]
+    assert documentos == [("B1-1", "documento", 1), ("B1-2", "documento", 0)]
+
+
+def test_revision_manual_no_bloquea(portal, monkeypatch):
+    monkeypatch.setenv("SUNAT_MANTENER_REVISION", "0.2")
+    pool = scraper._pool
+
+    inicio = time.perf_counter()
+    resultados = scraper.send_billing_batch(5, [documento("B01-01"), documento("B01-02")])
+    assert time.perf_counter() - inicio < 0.2
+    assert all(r["enviado"] for r in resultados)
+
+    # cada documento quedó en su navegador, fuera del pool, y se cierra solo
+    assert portal["logins"] == 2
+    assert len(pool) == 0
+    en_revision = list(scraper._en_revision)
+    assert len(en_revision) == 2 and not any(d.cerrado for d in en_revision)
+    time.sleep(0.4)
+    assert all(d.cerrado for d in en_revision)
+    assert scraper._en_revision == {}
+
+
+def test_sin_revision_el_navegador_vuelve_al_pool(portal, monkeypatch):
+    monkeypatch.delenv("SUNAT_MANTENER_REVISION", raising=False)
+    assert scraper.send_billing_sunat(documento("B01-01"))
+    assert len(scraper._pool) == 1
+    assert scraper._en_revision == {}
+
+
+def test_emision_sin_confirmar_descarta_el_navegador(portal, monkeypatch):
+    monkeypatch.delenv("SUNAT_MANTENER_REVISION", raising=False)
+
+    def emitir_documento(driver, data):
+        raise scraper.EmisionSinConfirmar("SUNAT no confirmó la emisión de la boleta")
+
+    monkeypatch.setattr(scraper, "emitir_documento", emitir_documento)
+    with pytest.raises(scraper.EmisionSinConfirmar):
+        scraper.send_billing_sunat(documento("B01-01"))
+    assert len(scraper._pool) == 0
+
+
+class FormularioEmitido:
+    """Driver falso con el botón de emitir y el número que muestra SUNAT."""
+
+    def __init__(self, numero):
+        self.numero = numero
+        self.clics = 0
+        self.text = ""
+
+    def find_element(self, by, valor):
+        self.text = self.numero if self.clics else ""
+        return self
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.clics += 1
+
+
+def test_grabar_documento_retorna_el_numero_confirmado(monkeypatch):
+    monkeypatch.setattr(scraper, "esperar_overlay", lambda driver: None)
+    driver = FormularioEmitido("EB01-25")
+    assert scraper.grabar_documento(driver, "Boleta") == "EB01-25"
+    assert driver.clics == 1
+
+
+def test_grabar_documento_sin_confirmacion(monkeypatch):
+    monkeypatch.setattr(scraper, "esperar_overlay", lambda driver: None)
+    with pytest.raises(scraper.EmisionSinConfirmar):
+        scraper.grabar_documento(FormularioEmitido(""), "Factura", timeout=0.2)
+
+
+def test_sin_emision_automatica_queda_para_emitir_a_mano(monkeypatch):
+    monkeypatch.delenv("SUNAT_EMITIR", raising=False)
+    monkeypatch.delenv("SUNAT_MANTENER_REVISION", raising=False)
+    monkeypatch.delenv("SUNAT_PERFIL_CHROME", raising=False)
+    driver = FormularioEmitido("EB01-25")
+
+    with pytest.raises(scraper.EmisionPendiente):
+        scraper.finalizar_documento(driver, "Boleta")
+    assert driver.clics == 0  # no se pulsó emitir
+    assert scraper.segundos_revision() == 900  # el navegador queda para revisar
+
+    # headless: nadie podría emitirlo a mano
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "emision")
+    assert scraper.finalizar_documento(driver, "Boleta") is False
+
+    monkeypatch.setenv("SUNAT_EMITIR", "1")
+    monkeypatch.setattr(scraper, "esperar_overlay", lambda driver: None)
+    assert scraper.finalizar_documento(driver, "Boleta") == "EB01-25"
+
+
+def test_segundos_revision(monkeypatch):
+    monkeypatch.setenv("SUNAT_MANTENER_REVISION", "120")
+    assert scraper.segundos_revision() == 120
+    assert scraper.segundos_revision(False) == 0
+    assert scraper.segundos_revision(True) == 900
+    monkeypatch.setenv("SUNAT_MANTENER_REVISION", "no")
+    assert scraper.segundos_revision() == 0
+
+
+class CampoTotal:
+    """Driver falso cuyo total cambia en cada lectura hasta estabilizarse."""
+
+    def __init__(self, valores):
+        self.valores = list(valores)
+
+    def find_element(self, *locator):
+        return self
+
+    def get_attribute(self, nombre):
+        return self.valores.pop(0) if len(self.valores) > 1 else self.valores[0]
+
+
+def esperar_importe(valores, esperado):
+    condicion = scraper.importe_listo(("id", "boleta.totalGeneral"), esperado)
+    driver = CampoTotal(valores)
+    for lectura in range(1, 20):
+        valor = condicion(driver)
+        if valor is not False:
+            return valor, lectura
+    return None, lectura
+
+
+def test_importe_listo_apenas_coincide():
+    assert esperar_importe(["", "S/ 5.00", "S/ 10.00"], 10) == (10.0, 3)
+
+
+def test_importe_distinto_cuando_deja_de_cambiar():
+    valor, lecturas = esperar_importe(["S/ 5.00", "S/ 1,210.00"], 10)
+    assert valor == 1210.0
+    assert lecturas == 5  # una lectura nueva y cuatro iguales
+
+
+class Elemento:
+    def __init__(self, driver, id_elemento):
+        self.driver = driver
+        self.id = id_elemento
+        self.visible = id_elemento != "waitMessage_underlay"
+        self.seleccionado = False
+
+    def is_displayed(self):
+        return self.visible
+
+    def is_enabled(self):
+        return True
+
+    def is_selected(self):
+        return self.seleccionado
+
+    def click(self):
+        self.driver.acciones.append(("click", self.id))
+        self.seleccionado = not self.seleccionado
+        if self.id == "item.botonAceptar_label":
+            self.visible = False  # el diálogo se cierra
+
+    def clear(self):
+        pass
+
+    def send_keys(self, texto):
+        self.driver.acciones.append(("send_keys", self.id, texto))
+
+
+class DriverFormulario:
+    """Diálogo de ítem falso: registra clics, teclas y execute_script."""
+
+    XPATHS = {
+        "//input[@id='item.subTipoTI01']": "item.subTipoTI01",
+        "//input[@name='cantidad']": "cantidad",
+    }
+
+    def __init__(self, respuesta_js):
+        self.respuesta_js = respuesta_js
+        self.elementos = {}
+        self.acciones = []
+
+    def find_element(self, by, valor):
+        clave = self.XPATHS.get(valor, valor)
+        return self.elementos.setdefault(clave, Elemento(self, clave))
+
+    def execute_script(self, script, valores):
+        self.acciones.append(("execute_script", valores))
+        return self.respuesta_js(valores)
+
+
+PRODUCTO = {
+    "cantidad": 2.0,
+    "descripcion": "ARROZ EXTRA",
+    "unidad_medida": "KILOGRAMO",
+    "precio_base": 5.5,
+    "igv": 0,
+}
+
+
+def leido_por_js(valores):
+    return dict(valores, tipo=True, precio="5.5000", cantidad="2")
+
+
+def test_item_en_una_llamada_de_javascript(monkeypatch):
+    monkeypatch.delenv("SUNAT_LLENADO_JS", raising=False)
+    driver = DriverFormulario(leido_por_js)
+    scraper.agregar_producto(driver, PRODUCTO, "Boleta")
+
+    tipos = [a[0] for a in driver.acciones]
+    assert tipos == ["click", "execute_script", "click"]
+    assert driver.acciones[1][1] == {
+        "cantidad": "2.0",
+        "unidad_medida": "KILOGRAMO",
+        "descripcion": "ARROZ EXTRA",
+        "precio": "5.5000",
+        "exonerado": True,
+    }
+    assert driver.acciones[-1] == ("click", "item.botonAceptar_label")
+
+
+@pytest.mark.parametrize(
+    "respuesta",
+    [
+        lambda valores: None,  # el formulario no tiene los campos esperados
+        lambda valores: dict(leido_por_js(valores), unidad_medida=""),  # widget lo rechazó
+    ],
+)
+def test_item_por_teclado_si_javascript_no_valida(monkeypatch, respuesta):
+    monkeypatch.delenv("SUNAT_LLENADO_JS", raising=False)
+    driver = DriverFormulario(respuesta)
+    scraper.agregar_producto(driver, PRODUCTO, "Boleta")
+
+    teclas = {a[1]: a[2] for a in driver.acciones if a[0] == "send_keys"}
+    assert teclas == {
+        "cantidad": "2.0",
+        "item.unidadMedida": "KILOGRAMO",
+        "item.descripcion": "ARROZ EXTRA",
+        "item.precioUnitario": "5.5000",
+    }
+    assert ("click", "item.subTipoTB01") in driver.acciones
+    assert driver.acciones[-1] == ("click", "item.botonAceptar_label")
+
+
+def test_llenado_js_desactivado(monkeypatch):
+    monkeypatch.setenv("SUNAT_LLENADO_JS", "0")
+    driver = DriverFormulario(leido_por_js)
+    scraper.agregar_producto(driver, dict(PRODUCTO, igv=1), "Factura")
+
+    assert not any(a[0] == "execute_script" for a in driver.acciones)
+    assert ("click", "item.subTipoTB01") not in driver.acciones  # con IGV
+    assert ("click", "factura.addItemButton_label") in driver.acciones
+
+
+def test_perfil_completo_por_defecto(monkeypatch):
+    monkeypatch.delenv("SUNAT_PERFIL_CHROME", raising=False)
+    assert scraper.perfil_chrome() == "completo"
+    argumentos = scraper.opciones_chrome("completo", sender_id=5).arguments
+    assert "--start-maximized" in argumentos
+    assert not any(a.startswith(("--headless", "--user-data-dir")) for a in argumentos)
+
+
+def test_perfil_de_emision(monkeypatch, tmp_path):
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "emision")
+    monkeypatch.setenv("SUNAT_CHROME_DATOS", str(tmp_path))
+    monkeypatch.delenv("SUNAT_CHROME_HEADLESS", raising=False)
+
+    opciones = scraper.opciones_chrome(scraper.perfil_chrome(), sender_id=5)
+    (carpeta,) = tmp_path.glob(f"remitente_5_{os.getpid()}_*")
+    cache = tmp_path / "cache" / "remitente_5"
+    assert "--headless=new" in opciones.arguments
+    assert "--window-size=1280,900" in opciones.arguments
+    assert f"--user-data-dir={carpeta}" in opciones.arguments
+    assert f"--disk-cache-dir={cache}" in opciones.arguments
+    assert "--start-maximized" not in opciones.arguments
+    assert carpeta.is_dir() and cache.is_dir()
+    assert scraper.segundos_revision(True) == 0  # headless: no hay ventana
+
+
+def test_cada_navegador_con_su_perfil(monkeypatch, tmp_path):
+    """Dos navegadores del mismo remitente a la vez (p. ej. uno en revisión):
+    perfiles distintos, la misma caché, y el perfil se borra al cerrar."""
+
+    class Chrome:
+        def __init__(self, options, service):
+            self.arguments = options.arguments
+
+        def execute_cdp_cmd(self, comando, parametros):
+            pass
+
+        def quit(self):
+            pass
+
+    monkeypatch.setattr(scraper.webdriver, "Chrome", Chrome)
+    monkeypatch.setattr(scraper, "ruta_chromedriver", lambda: "chromedriver")
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "emision")
+    monkeypatch.setenv("SUNAT_CHROME_DATOS", str(tmp_path))
+
+    primero, segundo = scraper.configurar_driver(5), scraper.configurar_driver(5)
+
+    def argumento(driver, prefijo):
+        return next(a for a in driver.arguments if a.startswith(prefijo))
+
+    perfiles = {argumento(d, "--user-data-dir") for d in (primero, segundo)}
+    caches = {argumento(d, "--disk-cache-dir") for d in (primero, segundo)}
+    assert len(perfiles) == 2 and len(caches) == 1
+    perfil = argumento(primero, "--user-data-dir=").split("=", 1)[1]
+    primero.quit()
+    assert not os.path.exists(perfil)
+    assert len(list(tmp_path.glob("remitente_5_*"))) == 1
+
+
+def test_perfil_de_emision_con_ventana_y_sin_carpeta(monkeypatch):
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "emision")
+    monkeypatch.setenv("SUNAT_CHROME_HEADLESS", "0")
+    monkeypatch.setenv("SUNAT_CHROME_DATOS", "")
+
+    argumentos = scraper.opciones_chrome("emision", sender_id=5).arguments
+    assert not any(a.startswith(("--headless", "--user-data-dir")) for a in argumentos)
+    assert scraper.segundos_revision(True) == 900
+
+
+def test_configurar_driver_bloquea_recursos_en_emision(monkeypatch, tmp_path):
+    comandos = []
+
+    class Chrome:
+        def __init__(self, options, service):
+            self.options = options
+
+        def execute_cdp_cmd(self, comando, parametros):
+            comandos.append((comando, parametros))
+
+        def quit(self):
+            pass
+
+    monkeypatch.setattr(scraper.webdriver, "Chrome", Chrome)
+    monkeypatch.setattr(scraper, "ruta_chromedriver", lambda: "chromedriver")
+    monkeypatch.setenv("SUNAT_CHROME_DATOS", str(tmp_path))
+
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "completo")
+    scraper.configurar_driver(5)
+    assert comandos == []
+
+    monkeypatch.setenv("SUNAT_PERFIL_CHROME", "emision")
+    scraper.configurar_driver(5)
+    assert comandos == [
+        ("Network.enable", {}),
+        ("Network.setBlockedURLs", {"urls": scraper.URLS_BLOQUEADAS}),
+    ]
+
+
+class DriverManager:
+    """ChromeDriverManager falso: cuenta las instalaciones (llamadas de red)."""
+
+    carpeta = None
+    version = "120.0.6099"
+    instalaciones = 0
+    creados = 0
+
+    def __init__(self):
+        DriverManager.creados += 1
+        self.driver = self
+
+    def get_browser_version_from_os(self):
+        return DriverManager.version
+
+    def install(self):
+        DriverManager.instalaciones += 1
+        ruta = DriverManager.carpeta / f"chromedriver-{DriverManager.version}"
+        ruta.write_text("binario")
+        return str(ruta)
+
+
+@pytest.fixture
+def driver_manager(monkeypatch, tmp_path):
+    monkeypatch.setattr(DriverManager, "carpeta", tmp_path)
+    monkeypatch.setattr(DriverManager, "instalaciones", 0)
+    monkeypatch.setattr(DriverManager, "creados", 0)
+    monkeypatch.setattr(scraper, "ChromeDriverManager", DriverManager)
+    monkeypatch.setattr(scraper, "_chromedriver", None)
+    monkeypatch.setenv("SUNAT_CHROMEDRIVER_CACHE", str(tmp_path / "cache.json"))
+    monkeypatch.delenv("SUNAT_CHROMEDRIVER_OFFLINE", raising=False)
+    return tmp_path / "cache.json"
+
+
+def test_chromedriver_se_resuelve_una_vez_por_proceso(driver_manager):
+    ruta = scraper.ruta_chromedriver()
+    assert scraper.ruta_chromedriver() == ruta
+    assert DriverManager.instalaciones == 1
+    assert json.loads(driver_manager.read_text()) == {
+        "ruta": ruta,
+        "version_chrome": "120.0.6099",
+    }
+
+
+def test_chromedriver_desde_disco_si_chrome_no_cambia(driver_manager, monkeypatch):
+    ruta = scraper.ruta_chromedriver()
+    monkeypatch.setattr(scraper, "_chromedriver", None)  # otro proceso
+    assert scraper.ruta_chromedriver() == ruta
+    assert DriverManager.instalaciones == 1
+
+    monkeypatch.setattr(scraper, "_chromedriver", None)
+    monkeypatch.setattr(DriverManager, "version", "121.0.6167")
+    assert scraper.ruta_chromedriver() != ruta
+    assert DriverManager.instalaciones == 2
+
+
+def test_chromedriver_sin_conexion(driver_manager, monkeypatch):
+    monkeypatch.setenv("SUNAT_CHROMEDRIVER_OFFLINE", "1")
+    with pytest.raises(FileNotFoundError):
+        scraper.ruta_chromedriver()
+
+    monkeypatch.delenv("SUNAT_CHROMEDRIVER_OFFLINE")
+    ruta = scraper.ruta_chromedriver()
+    monkeypatch.setattr(scraper, "_chromedriver", None)
+    monkeypatch.setattr(DriverManager, "creados", 0)
+    monkeypatch.setenv("SUNAT_CHROMEDRIVER_OFFLINE", "1")
+    assert scraper.ruta_chromedriver() == ruta
+    assert DriverManager.creados == 0  # ni siquiera consulta la versión
+
+
+class DriverRestaurado:
+    """Navegador recién abierto: registra comandos CDP y navegación."""
+
+    def __init__(self, current_url="data:,"):
+        self.current_url = current_url
+        self.comandos = []
+        self.visitadas = []
+
+    def execute_cdp_cmd(self, comando, parametros):
+        self.comandos.append((comando, parametros))
+        if comando == "Network.getAllCookies":
+            return {"cookies": [{"name": "ITMENUSESSION", "value": "x"}]}
+        return {}
+
+    def get(self, url):
+        self.visitadas.append(url)
+        self.current_url = url
+
+
+@pytest.fixture
+def sesiones(monkeypatch, tmp_path):
+    monkeypatch.delenv("SUNAT_COOKIES", raising=False)
+    monkeypatch.setenv("SUNAT_COOKIES_CLAVE", Fernet.generate_key().decode())
+    monkeypatch.setenv("SUNAT_COOKIES_DIR", str(tmp_path))
+    monkeypatch.setattr(scraper, "_cookie_store", None)
+    return scraper.obtener_cookie_store()
+
+
+CUENTA = ("20123456789", "USUARIO1")
+
+
+def test_restaura_la_sesion_guardada(sesiones, monkeypatch):
+    monkeypatch.setattr(scraper, "sesion_activa", lambda driver: True)
+    scraper.guardar_sesion(DriverRestaurado("http://sunat/menu"), 5, CUENTA)
+
+    driver = DriverRestaurado()
+    assert scraper.restaurar_sesion(driver, 5, CUENTA)
+    assert driver.comandos == [
+        (
+            "Network.setCookies",
+            {"cookies": [{"name": "ITMENUSESSION", "value": "x"}]},
+        )
+    ]
+    assert driver.visitadas == ["http://sunat/menu"]
+
+
+def test_sesion_guardada_expirada_inicia_sesion(sesiones, monkeypatch):
+    monkeypatch.setattr(scraper, "sesion_activa", lambda driver: False)
+    scraper.guardar_sesion(DriverRestaurado("http://sunat/menu"), 5, CUENTA)
+
+    assert not scraper.restaurar_sesion(DriverRestaurado(), 5, CUENTA)
+    assert sesiones.cargar(5, CUENTA) is None  # se descartó
+
+
+def test_no_restaura_en_un_navegador_ya_usado(sesiones, monkeypatch):
+    monkeypatch.setattr(scraper, "sesion_activa", lambda driver: True)
+    scraper.guardar_sesion(DriverRestaurado("http://sunat/menu"), 5, CUENTA)
+
+    driver = DriverRestaurado("http://sunat/login")  # su sesión expiró
+    assert not scraper.restaurar_sesion(driver, 5, CUENTA)
+    assert driver.comandos == []
+
+
+def test_iniciar_sesion_sin_formulario_si_restaura(sesiones, monkeypatch):
+    monkeypatch.setattr(scraper, "get_client", lambda sender_id: CUENTA + ("clave",))
+    monkeypatch.setattr(scraper, "restaurar_sesion", lambda d, s, cuenta: True)
+
+    driver = DriverRestaurado()
+    assert scraper.iniciar_sesion(driver, 5)
+    assert driver.visitadas == []  # ni siquiera abrió la página de login
+
+
+def test_sin_cookies_guardadas(monkeypatch):
+    monkeypatch.setenv("SUNAT_COOKIES", "0")
+    driver = DriverRestaurado()
+    assert not scraper.restaurar_sesion(driver, 5, CUENTA)
+    scraper.guardar_sesion(driver, 5, CUENTA)
+    assert driver.comandos == []
@@ -0,0 +1,160 @@
+import threading
+import time
+
+import pytest
+
+from Scraping.session_pool import SesionSunatError, SunatSessionPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.logueado = False
+        self.cerrado = False
+
+    def quit(self):
+        self.cerrado = True
+
+
+class Portal:
+    """Simula configurar_driver / iniciar_sesion / sesion_activa."""
+
+    def __init__(self, login_ok=True):
+        self.login_ok = login_ok
+        self.drivers = []
+        self.logins = []
+
+    def crear_driver(self, sender_id):
+        driver = FakeDriver()
+        driver.sender_id = sender_id
+        self.drivers.append(driver)
+        return driver
+
+    def iniciar_sesion(self, driver, sender_id):
+        if driver.cerrado:
+            raise RuntimeError("invalid session id")
+        self.logins.append(sender_id)
+        driver.logueado = self.login_ok
+        return self.login_ok
+
+    def sesion_activa(self, driver):
+        if driver.cerrado:
+            raise RuntimeError("invalid session id")
+        return driver.logueado
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def portal():
+    return Portal()
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+@pytest.fixture
+def pool(portal, reloj):
+    pool = SunatSessionPool(
+        portal.crear_driver,
+        portal.iniciar_sesion,
+        portal.sesion_activa,
+        max_inactividad=60,
+        reloj=reloj,
+    )
+    yield pool
+    pool.cerrar()
+
+
+def test_reutiliza_el_navegador_del_remitente(pool, portal):
+    for _ in range(3):
+        driver = pool.adquirir(5)
+        pool.liberar(5)
+
+    assert portal.drivers == [driver]
+    assert driver.sender_id == 5
+    assert portal.logins == [5]
+    assert pool.estadisticas == {"creados": 1, "reutilizados": 2, "relogins": 0}
+
+
+def test_un_navegador_por_remitente(pool, portal):
+    d1 = pool.adquirir(1)
+    d2 = pool.adquirir("2")
+    assert d1 is not d2
+    pool.liberar(1)
+    pool.liberar("2")
+    assert pool.adquirir("1") is d1  # el id puede llegar como str o int
+    assert len(pool) == 2
+
+
+def test_sesion_expirada_vuelve_a_iniciar_sesion(pool, portal):
+    driver = pool.adquirir(5)
+    pool.liberar(5)
+    driver.logueado = False  # SUNAT cerró la sesión
+
+    assert pool.adquirir(5) is driver
+    assert driver.logueado
+    assert len(portal.drivers) == 1
+    assert pool.estadisticas["relogins"] == 1
+
+
+def test_navegador_muerto_se_reemplaza(pool, portal):
+    driver = pool.adquirir(5)
+    pool.liberar(5)
+    driver.cerrado = True  # el usuario cerró la ventana
+
+    nuevo = pool.adquirir(5)
+    assert nuevo is not driver
+    assert nuevo.logueado
+    assert len(portal.drivers) == 2
+
+
+def test_login_fallido_no_deja_sesion(reloj):
+    portal = Portal(login_ok=False)
+    pool = SunatSessionPool(portal.crear_driver, portal.iniciar_sesion, reloj=reloj)
+
+    with pytest.raises(SesionSunatError):
+        pool.adquirir(5)
+    assert len(pool) == 0
+    assert portal.drivers[0].cerrado
+
+
+def test_cierra_navegadores_inactivos(pool, portal, reloj):
+    d1 = pool.adquirir(1)
+    pool.liberar(1)
+    reloj.ahora = 30
+    d2 = pool.adquirir(2)
+    pool.liberar(2)
+    d3 = pool.adquirir(3)  # en uso: nunca se cierra
+
+    reloj.ahora = 70
+    assert pool.limpiar_inactivas() == 1
+    assert d1.cerrado and not d2.cerrado and not d3.cerrado
+    assert len(pool) == 2
+
+
+def test_descartar_sin_cerrar(pool):
+    driver = pool.adquirir(5)
+    pool.descartar(5, cerrar=False)
+    assert len(pool) == 0
+    assert not driver.cerrado
+
+
+def test_misma_sesion_se_usa_de_a_una_emision(pool):
+    driver = pool.adquirir(5)
+    obtenido = []
+    hilo = threading.Thread(target=lambda: obtenido.append(pool.adquirir(5)))
+    hilo.start()
+    time.sleep(0.05)
+    assert obtenido == []  # espera a que la primera emisión termine
+
+    pool.liberar(5)
+    hilo.join(timeout=2)
+    assert obtenido == [driver]
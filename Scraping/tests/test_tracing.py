@@ -0,0 +1,128 @@
+import pytest
+
+from Scraping import tracing
+
+
+class Elemento:
+    def __init__(self, valor):
+        self.valor = valor
+
+    def get_attribute(self, nombre):
+        return self.valor
+
+
+class Driver:
+    def find_element(self, by, valor):
+        return Elemento("CLIENTE 12345678")
+
+
+@tracing.medido()
+def iniciar_sesion(ok=True):
+    return ok
+
+
+@tracing.medido("producto")
+def agregar_producto():
+    raise RuntimeError("no se pudo")
+
+
+def pasos(guardadas):
+    (filas,) = guardadas
+    return [(fila[4], fila[7]) for fila in filas]
+
+
+def test_traza_registra_los_pasos_del_documento(monkeypatch):
+    monkeypatch.delenv("SUNAT_TRAZAS", raising=False)
+    guardadas = []
+    data = {
+        "id_remitente": "5",
+        "tipo_documento": "BOLETA",
+        "resumen": {"serie": "B1"},
+    }
+
+    with tracing.documento(data, guardadas.append) as traza:
+        iniciar_sesion()
+        iniciar_sesion(False)
+        with pytest.raises(RuntimeError):
+            agregar_producto()
+        with tracing.tramo("menu"):
+            pass
+        traza.ok = False
+
+    assert pasos(guardadas) == [
+        ("iniciar_sesion", 1),
+        ("iniciar_sesion", 0),
+        ("producto", 0),
+        ("menu", 1),
+        ("documento", 0),
+    ]
+    trace_id, sender_id, serie, tipo = guardadas[0][0][:4]
+    assert (sender_id, serie, tipo) == ("5", "B1", "BOLETA")
+    assert {fila[0] for fila in guardadas[0]} == {trace_id}
+    assert tracing.traza_actual() is None
+
+
+def test_esperas_con_el_locator(monkeypatch):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+
+    from Scraping.scraper_sunat import valor_cargado
+
+    monkeypatch.delenv("SUNAT_TRAZAS", raising=False)
+    guardadas = []
+    driver = Driver()
+    with tracing.documento({}, guardadas.append):
+        tracing.WebDriverWait(driver, 1).until(
+            valor_cargado((By.ID, "inicio.razonSocial"))
+        )
+        tracing.WebDriverWait(driver, 1).until(
+            EC.presence_of_element_located((By.ID, "txtBusca"))
+        )
+        tracing.WebDriverWait(driver, 1).until(lambda d: True)
+
+    assert [paso for paso, _ in pasos(guardadas)] == [
+        "espera inicio.razonSocial",
+        "espera txtBusca",
+        "espera <lambda>",
+        "documento",
+    ]
+
+
+def test_sin_traza_no_se_mide_nada(monkeypatch):
+    assert iniciar_sesion() is True  # fuera de un documento
+
+    monkeypatch.setenv("SUNAT_TRAZAS", "0")
+    guardadas = []
+    with tracing.documento({}, guardadas.append) as traza:
+        assert tracing.traza_actual() is None
+        iniciar_sesion()
+        traza.ok = False
+    assert guardadas == []
+
+
+def test_error_al_guardar_no_interrumpe_la_emision(monkeypatch):
+    monkeypatch.delenv("SUNAT_TRAZAS", raising=False)
+
+    def guardar(filas):
+        raise OSError("database is locked")
+
+    with tracing.documento({}, guardar):
+        iniciar_sesion()
+
+
+def test_resumen_p50_p95():
+    spans = [("agregar_producto", float(i), 1) for i in range(1, 21)]
+    spans += [("iniciar_sesion", 10.0, 1), ("iniciar_sesion", 30.0, 0)]
+
+    assert tracing.resumen(spans) == [
+        ("agregar_producto", 20, 10.0, 19.0, 0),
+        ("iniciar_sesion", 2, 10.0, 30.0, 1),
+    ]
+    texto = tracing.formatear_resumen(tracing.resumen(spans))
+    assert texto.splitlines()[1].split() == [
+        "agregar_producto",
+        "20",
+        "10.000",
+        "19.000",
+        "0",
+    ]
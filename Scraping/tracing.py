@@ -0,0 +1,199 @@
+"""Tiempos por paso del scraper SUNAT.
+
+Cada documento emitido abre una traza con documento(); dentro de ella se
+mide cada función decorada con @medido (iniciar_sesion, agregar_producto,
+validate_importe_all, ...), cada bloque `with tramo(...)` y cada espera de
+WebDriverWait (con el locator que esperaba, p. ej. "espera
+inicio.razonSocial"). Al terminar el documento sus pasos se guardan (en el
+scraper, en la tabla scraper_spans) y `python main.py --tiempos` muestra el
+p50/p95 de cada paso en las últimas emisiones.
+
+Fuera de una traza no se mide nada. SUNAT_TRAZAS=0 desactiva las trazas.
+"""
+
+import functools
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from selenium.webdriver.support.ui import WebDriverWait as _WebDriverWait
+
+_local = threading.local()
+
+
+class Traza:
+    """Pasos medidos de un documento: (paso, inicio, duracion, ok), con inicio
+    en segundos desde que empezó el documento."""
+
+    def __init__(self, sender_id=None, serie=None, tipo=None):
+        self.trace_id = uuid.uuid4().hex
+        self.sender_id = sender_id
+        self.serie = serie
+        self.tipo = tipo
+        self.ok = True  # el que emite lo pone en False si el documento falló
+        self.inicio = time.perf_counter()
+        self.tramos = []
+
+    def registrar(self, paso, inicio, ok=True):
+        duracion = time.perf_counter() - inicio
+        self.tramos.append((paso, inicio - self.inicio, duracion, ok))
+
+    def filas(self):
+        """Filas para DatabaseManager.insert_scraper_spans."""
+        return [
+            (
+                self.trace_id,
+                self.sender_id,
+                self.serie,
+                self.tipo,
+                paso,
+                round(inicio, 4),
+                round(duracion, 4),
+                int(bool(ok)),
+            )
+            for paso, inicio, duracion, ok in self.tramos
+        ]
+
+
+def traza_actual():
+    return getattr(_local, "traza", None)
+
+
+@contextmanager
+def documento(data, guardar=None):
+    """Traza de la emisión de `data`; al salir llama a guardar(filas)."""
+    traza = Traza(
+        data.get("id_remitente"),
+        data.get("resumen", {}).get("serie"),
+        data.get("tipo_documento"),
+    )
+    if os.getenv("SUNAT_TRAZAS", "1") == "0":
+        yield traza  # no queda activa: no se mide ni se guarda nada
+        return
+    anterior = traza_actual()
+    _local.traza = traza
+    ok = False
+    try:
+        yield traza
+        ok = traza.ok
+    finally:
+        traza.registrar("documento", traza.inicio, ok)
+        _local.traza = anterior
+        if guardar is not None:
+            try:
+                guardar(traza.filas())
+            except Exception as e:
+                logging.warning(f"No se pudieron guardar los tiempos: {e}")
+
+
+@contextmanager
+def tramo(paso):
+    """Mide el bloque como `paso` de la traza actual (si hay una)."""
+    traza = traza_actual()
+    if traza is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        traza.registrar(paso, inicio, ok)
+
+
+def medido(paso=None):
+    """Decorador: mide cada llamada como `paso` (por defecto, el nombre de la
+    función). Cuenta como fallida si lanza una excepción o retorna False."""
+
+    def decorar(funcion):
+        nombre = paso or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            traza = traza_actual()
+            if traza is None:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            ok = False
+            try:
+                resultado = funcion(*args, **kwargs)
+                ok = resultado is not False
+                return resultado
+            finally:
+                traza.registrar(nombre, inicio, ok)
+
+        return envuelta
+
+    return decorar
+
+
+def nombre_espera(condicion):
+    """"espera <locator>" para una condición de expected_conditions (o una
+    condición propia con atributo locator)."""
+    locator = getattr(condicion, "locator", None)
+    if locator is None:
+        for celda in getattr(condicion, "__closure__", None) or ():
+            try:
+                contenido = celda.cell_contents
+            except ValueError:
+                continue
+            if (
+                isinstance(contenido, tuple)
+                and len(contenido) == 2
+                and isinstance(contenido[1], str)
+            ):
+                locator = contenido
+                break
+    if locator is not None:
+        return f"espera {locator[1]}"
+    return f"espera {getattr(condicion, '__name__', type(condicion).__name__)}"
+
+
+class WebDriverWait(_WebDriverWait):
+    """WebDriverWait de Selenium que registra cada espera en la traza."""
+
+    def until(self, method, message=""):
+        if traza_actual() is None:
+            return super().until(method, message)
+        with tramo(nombre_espera(method)):
+            return super().until(method, message)
+
+
+def percentil(ordenados, p):
+    """Percentil p (0-1) por rango más cercano de una lista ya ordenada."""
+    return ordenados[max(0, math.ceil(p * len(ordenados)) - 1)]
+
+
+def resumen(spans):
+    """[(paso, n, p50, p95, fallidos)] a partir de filas (paso, duracion, ok),
+    en el orden en que aparece cada paso."""
+    por_paso = {}
+    for paso, duracion, ok in spans:
+        por_paso.setdefault(paso, []).append((duracion, ok))
+    filas = []
+    for paso, medidas in por_paso.items():
+        duraciones = sorted(d for d, _ in medidas)
+        fallidos = sum(1 for _, ok in medidas if not ok)
+        filas.append(
+            (
+                paso,
+                len(duraciones),
+                percentil(duraciones, 0.50),
+                percentil(duraciones, 0.95),
+                fallidos,
+            )
+        )
+    return filas
+
+
+def formatear_resumen(filas):
+    ancho = max([len("paso")] + [len(f[0]) for f in filas])
+    lineas = [f"{'paso':<{ancho}}{'n':>7}{'p50 s':>9}{'p95 s':>9}{'fallidos':>10}"]
+    for paso, n, p50, p95, fallidos in filas:
+        lineas.append(f"{paso:<{ancho}}{n:>7}{p50:>9.3f}{p95:>9.3f}{fallidos:>10}")
+    return "\n".join(lineas)
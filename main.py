@@ -8,6 +8,8 @@ import os
 from PyQt5.QtWidgets import QApplication
 from Frontend.ui_main import BoletaApp
 from DataBase.admin_bd import modo_consola_sqlite
+from DataBase.DatabaseManager import DatabaseManager
+from Scraping.tracing import formatear_resumen, resumen
 
 
 log_dir = os.path.join(os.path.dirname(__file__), "logs")
@@ -23,11 +25,29 @@ logging.basicConfig(
 )
 
 
+def mostrar_tiempos(ultimas=200):
+    """p50/p95 de cada paso del scraper en las últimas emisiones a SUNAT."""
+    db = DatabaseManager()
+    db.create_tables()
+    spans = db.get_scraper_spans(ultimas)
+    db.close()
+    if not spans:
+        print("Todavía no hay emisiones medidas.")
+        return
+    documentos = sum(1 for paso, _, _ in spans if paso == "documento")
+    print(f"Tiempos por paso de las últimas {documentos} emisiones:\n")
+    print(formatear_resumen(resumen(spans)))
+
+
 def main():
     """Inicializar la app  y usamos un user admin para conexion en BD sqlite"""
     if "--admin" in sys.argv:
         modo_consola_sqlite()
         print("Modo administrador activado.")
+    elif "--tiempos" in sys.argv:
+        # python main.py --tiempos [N]: N emisiones más recientes (200)
+        resto = sys.argv[sys.argv.index("--tiempos") + 1 :]
+        mostrar_tiempos(int(resto[0]) if resto and resto[0].isdigit() else 200)
     else:
         app = QApplication(sys.argv)
         window = BoletaApp()